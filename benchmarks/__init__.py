@@ -0,0 +1,3 @@
+"""
+Benchmarks for the Process engine that run on synthetic USID datasets. See README.rst in this directory
+"""
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+airspeed velocity (asv) benchmarks for the Process engine.
+
+The size of the synthetic datasets can be changed via the environment variables PYUSID_BENCH_ROWS,
+PYUSID_BENCH_COLS and PYUSID_BENCH_SPEC_LEN
+
+Created on Sun Oct 18 15:03:26 2026
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+import itertools
+import os
+
+import h5py
+
+from pyUSID.processing.comp_utils import get_available_cores
+
+from .measure import measure, BACKENDS
+from .processes import KERNELS
+from .synthetic import make_usid_file
+
+MAIN_PATH = 'Measurement_000/Channel_000/Raw_Data'
+
+
+def _get_size():
+    """
+    Returns the number of rows, columns and spectroscopic values of the synthetic datasets
+    """
+    return tuple([int(os.environ.get('PYUSID_BENCH_' + name, default)) for name, default in
+                  [('ROWS', 64), ('COLS', 64), ('SPEC_LEN', 512)]])
+
+
+def _measure(file_path, **kwargs):
+    """
+    Computes a reference process over the main dataset in the provided file. See :func:`~benchmarks.measure.measure`
+    """
+    with h5py.File(file_path, mode='r+') as h5_f:
+        return measure(h5_f[MAIN_PATH], **kwargs)
+
+
+class _ProcessBenchmark(object):
+    """
+    Reports one of the quantities measured for a combination of parameters per track_* method. Suites measure every
+    combination once in setup_cache(), which asv calls once per suite and whose results it hands to all benchmarks.
+    setup_cache() is defined by each suite since asv shares the results of the same function across suites.
+    Combinations that cannot be measured are skipped
+    """
+
+    def _skip(self, *params):
+        """
+        Returns the reason why the provided combination of parameters cannot be measured or None if it can be
+        """
+        return None
+
+    def setup(self, stats, *params):
+        reason = self._skip(*params)
+        if reason is not None:
+            # asv skips combinations whose setup raises NotImplementedError
+            raise NotImplementedError(reason)
+
+    def track_pixels_per_sec(self, stats, *params):
+        return stats[params]['pixels_per_sec']
+    track_pixels_per_sec.unit = 'pixels/s'
+
+    def track_read_mb_per_sec(self, stats, *params):
+        return stats[params]['read_mb_per_sec']
+    track_read_mb_per_sec.unit = 'MB/s'
+
+
+class ProcessSuite(_ProcessBenchmark):
+    """
+    Throughput and peak memory of each reference process across numbers of cores and backends
+    """
+    params = (sorted(KERNELS.keys()), [1, 2, 4, 8], BACKENDS)
+    param_names = ['kernel', 'cores', 'backend']
+
+    def _skip(self, kernel, cores, backend):
+        if cores > get_available_cores():
+            return 'Only {} cores are available'.format(get_available_cores())
+        return None
+
+    def setup_cache(self):
+        num_rows, num_cols, spec_len = _get_size()
+        file_path = make_usid_file(os.path.abspath('process_suite.h5'), num_rows=num_rows, num_cols=num_cols,
+                                   spec_len=spec_len)
+        try:
+            return dict([(params, _measure(file_path, kernel=params[0], cores=params[1], backend=params[2]))
+                         for params in itertools.product(*self.params) if self._skip(*params) is None])
+        finally:
+            os.remove(file_path)
+    setup_cache.timeout = 3600
+
+    def track_write_mb_per_sec(self, stats, *params):
+        return stats[params]['write_mb_per_sec']
+    track_write_mb_per_sec.unit = 'MB/s'
+
+    def track_peak_mem_mb(self, stats, *params):
+        return stats[params]['peak_mem_mb']
+    track_peak_mem_mb.unit = 'MB'
+
+
+class StorageSuite(_ProcessBenchmark):
+    """
+    Throughput of the cheap process, which is dominated by reading and writing, across the precision, chunking and
+    compression of the source dataset
+    """
+    params = (['float32', 'float64', 'uint16', 'complex64'], ['contiguous', 'row', 'auto'], ['none', 'gzip', 'lzf'])
+    param_names = ['dtype', 'chunks', 'compression']
+
+    def _skip(self, dtype, chunks, compression):
+        if compression != 'none' and chunks == 'contiguous':
+            return 'Compressed datasets must be chunked'
+        return None
+
+    def setup_cache(self):
+        num_rows, num_cols, spec_len = _get_size()
+        stats = dict()
+        for dtype, chunks, compression in itertools.product(*self.params):
+            if self._skip(dtype, chunks, compression) is not None:
+                continue
+            file_path = make_usid_file(os.path.abspath('storage_suite_{}_{}_{}.h5'.format(dtype, chunks, compression)),
+                                       num_rows=num_rows, num_cols=num_cols, spec_len=spec_len, dtype=dtype,
+                                       chunks=chunks, compression=None if compression == 'none' else compression)
+            try:
+                stats[(dtype, chunks, compression)] = _measure(file_path, kernel='cheap')
+            finally:
+                os.remove(file_path)
+        return stats
+    setup_cache.timeout = 3600
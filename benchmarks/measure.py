@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the throughput and peak memory of computing a Process over an entire dataset
+
+Created on Sun Oct 18 14:41:52 2026
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+import threading
+import time as tm
+
+import psutil
+
+from pyUSID import USIDataset
+from pyUSID.processing.comp_utils import get_available_cores
+
+from .processes import KERNELS
+
+__all__ = ['PeakMemory', 'measure', 'parse_backend', 'BACKENDS']
+
+BACKENDS = ['processes', 'threads', 'dask-threads']
+
+
+def parse_backend(backend):
+    """
+    Translates the name of a backend into keyword arguments for the constructor of
+    :class:`~pyUSID.processing.process.Process`
+
+    Parameters
+    ----------
+    backend : str
+        "processes" or "threads" for a pool of workers of the same kind or "dask-" followed by the name of a local
+        dask scheduler such as "dask-threads"
+
+    Returns
+    -------
+    kwargs : dict
+        Keyword arguments for the constructor
+    """
+    if backend.startswith('dask-'):
+        return {'dask_scheduler': backend[len('dask-'):]}
+    return {'backend': backend}
+
+
+class PeakMemory(object):
+    """
+    Context manager that samples the resident memory of this process and all of its children, such as the workers
+    computing each batch, in a background thread and keeps track of the largest total
+    """
+
+    def __init__(self, interval=0.01):
+        """
+        Parameters
+        ----------
+        interval : float, optional
+            Time in seconds between successive samples. Default - 10 ms
+        """
+        self.interval = interval
+        self.peak = 0
+        self.__proc = psutil.Process()
+        self.__done = threading.Event()
+        self.__thread = None
+
+    def __sample(self):
+        total = self.__proc.memory_info().rss
+        for child in self.__proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                # Workers may exit while being sampled
+                pass
+        self.peak = max(self.peak, total)
+
+    def __run(self):
+        while not self.__done.wait(self.interval):
+            self.__sample()
+
+    def __enter__(self):
+        self.__sample()
+        self.__thread = threading.Thread(target=self.__run, name='PeakMemory')
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__done.set()
+        self.__thread.join()
+        self.__sample()
+        return False
+
+
+def measure(h5_main, kernel='cheap', cores=1, backend='processes', max_mem_mb=1024, **kwargs):
+    """
+    Computes one of the reference processes over the entire dataset and measures how quickly positions were
+    processed, how quickly data were read and written, and how much memory was used. The results group is deleted
+    afterwards so that repeated measurements do not grow the file
+
+    Parameters
+    ----------
+    h5_main : :class:`h5py.Dataset` or :class:`~pyUSID.io.usi_data.USIDataset`
+        Main dataset in a file opened in "r+" mode
+    kernel : str, optional
+        One of the reference processes - "cheap", "expensive", "complex" or "compound". Default - "cheap"
+    cores : uint, optional
+        Number of cores to compute with. Default - 1
+    backend : str, optional
+        Backend to compute with. See :func:`parse_backend`. Default - "processes"
+    max_mem_mb : uint, optional
+        Memory available to the process in MB. Default - 1024
+    kwargs : dict
+        Other keyword arguments for the constructor of the process such as prefetch or write_behind
+
+    Returns
+    -------
+    stats : dict
+        Number of positions, total time in seconds, positions per second, MB read and written per second, and the
+        peak memory of this process and its workers in MB
+    """
+    if kernel not in KERNELS:
+        raise ValueError('kernel should be one of {}'.format(sorted(KERNELS.keys())))
+    if cores > get_available_cores():
+        raise ValueError('Only {} cores are available'.format(get_available_cores()))
+    if not isinstance(h5_main, USIDataset):
+        h5_main = USIDataset(h5_main)
+    kwargs.update(parse_backend(backend))
+    proc = KERNELS[kernel](h5_main, cores=cores, max_mem_mb=max_mem_mb, **kwargs)
+
+    with PeakMemory() as peak_mem:
+        t_start = tm.time()
+        h5_results_grp = proc.compute(override=True, trace=True)
+        duration = tm.time() - t_start
+    del h5_main.file[h5_results_grp.name]
+
+    bytes_read = 0
+    bytes_written = 0
+    for span in proc.tracer.get_spans():
+        if span['name'] == 'read':
+            bytes_read += span['bytes_read']
+        elif span['name'] == 'write':
+            bytes_written += span['bytes_written']
+    if bytes_read == 0:
+        # Lazily loaded sources are read by the workers themselves and are not traced
+        bytes_read = h5_main.size * h5_main.dtype.itemsize
+
+    num_pos = h5_main.shape[0]
+    return {'positions': num_pos, 'seconds': duration,
+            'pixels_per_sec': num_pos / duration,
+            'read_mb_per_sec': bytes_read / 1024 ** 2 / duration,
+            'write_mb_per_sec': bytes_written / 1024 ** 2 / duration,
+            'peak_mem_mb': peak_mem.peak / 1024 ** 2}
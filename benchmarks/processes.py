@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Reference Process classes whose kernels span the range of costs and result types seen in practice
+
+Created on Sun Oct 18 14:20:11 2026
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+import numpy as np
+
+import pyUSID as usid
+
+__all__ = ['CheapProcess', 'ExpensiveProcess', 'ComplexProcess', 'CompoundProcess', 'KERNELS']
+
+# Degree of the polynomial and number of reweighting iterations used by the expensive kernel
+FIT_DEGREE = 8
+FIT_ITERATIONS = 16
+
+PEAK_DTYPE = np.dtype({'names': ['Amplitude', 'Position', 'Width'],
+                       'formats': [np.float32, np.float32, np.float32]})
+
+
+def _as_real(spectrum):
+    """
+    Returns the magnitude of complex spectra and the fields of compound spectra laid end to end. Real spectra are
+    returned as is
+    """
+    if spectrum.dtype.names is not None:
+        spectrum = np.hstack([spectrum[name] for name in spectrum.dtype.names])
+    if np.iscomplexobj(spectrum):
+        spectrum = np.abs(spectrum)
+    return spectrum
+
+
+class _ReferenceProcess(usid.Process):
+    """
+    Writes one result dataset per source dataset, sharing its position datasets. Children only need to provide the
+    kernel and describe the results via the class attributes below. Workers write results straight into preallocated
+    arrays that are written to the file without copies
+    """
+    process_label = None
+    results_name = None
+    output_dtype = np.float32
+
+    def __init__(self, h5_main, **kwargs):
+        super(_ReferenceProcess, self).__init__(h5_main, **kwargs)
+        self.process_name = self.process_label
+        self.parms_dict = {'kernel': self.process_label}
+        self.results_dtype = self.output_dtype
+        num_values = len(self._get_spec_dims().values)
+        self.results_shape = (num_values,) if num_values > 1 else ()
+
+    def _get_spec_dims(self):
+        """
+        Returns the spectroscopic dimension of the results
+        """
+        raise NotImplementedError('Please override _get_spec_dims specific to your process')
+
+    def _create_results_datasets(self):
+        self.h5_results_grp = usid.hdf_utils.create_results_group(self.h5_main, self.process_name)
+        usid.hdf_utils.write_simple_attrs(self.h5_results_grp, self.parms_dict)
+        spec_dims = self._get_spec_dims()
+        self.h5_results = usid.hdf_utils.write_main_dataset(self.h5_results_grp,
+                                                            (self.h5_main.shape[0], len(spec_dims.values)),
+                                                            self.results_name, self.results_name, 'a. u.', None,
+                                                            spec_dims, dtype=self.output_dtype,
+                                                            h5_pos_inds=self.h5_main.h5_pos_inds,
+                                                            h5_pos_vals=self.h5_main.h5_pos_vals)
+
+    def _get_existing_datasets(self):
+        self.h5_results = self.h5_results_grp[self.results_name]
+
+    def _write_results_chunk(self):
+        self._write_results_direct(self.h5_results)
+
+
+class CheapProcess(_ReferenceProcess):
+    """
+    Mean of the magnitude of each spectrum. Reading and writing dominate the time taken
+    """
+    process_label = 'Cheap'
+    results_name = 'Mean'
+
+    def _get_spec_dims(self):
+        return usid.write_utils.Dimension('Empty', 'a. u.', 1)
+
+    @staticmethod
+    def _map_function(spectrum, *args, **kwargs):
+        return np.mean(_as_real(spectrum))
+
+
+class ExpensiveProcess(_ReferenceProcess):
+    """
+    Robust polynomial fit to each spectrum via iteratively reweighted least squares. Computing dominates the time
+    taken
+    """
+    process_label = 'Expensive'
+    results_name = 'Coefficients'
+
+    def _get_spec_dims(self):
+        return usid.write_utils.Dimension('Coefficient', 'a. u.', FIT_DEGREE + 1)
+
+    @staticmethod
+    def _map_function(spectrum, *args, **kwargs):
+        spectrum = _as_real(spectrum).astype(np.float64)
+        vander = np.vander(np.linspace(-1, 1, spectrum.size), FIT_DEGREE + 1)
+        weights = np.ones_like(spectrum)
+        for _ in range(FIT_ITERATIONS):
+            coefs = np.linalg.lstsq(vander * weights[:, None], spectrum * weights, rcond=None)[0]
+            resid = spectrum - np.dot(vander, coefs)
+            # Cauchy weights suppress outliers in the next iteration
+            weights = 1 / np.sqrt(1 + (resid / (np.std(resid) + 1E-12)) ** 2)
+        return coefs.astype(np.float32)
+
+
+class ComplexProcess(_ReferenceProcess):
+    """
+    Fourier transform of each spectrum. The results are complex valued and about as large as the source dataset
+    """
+    process_label = 'Complex'
+    results_name = 'Spectrum'
+    output_dtype = np.complex64
+
+    def _get_spec_dims(self):
+        return usid.write_utils.Dimension('Frequency', 'a. u.', self.h5_main.shape[1] // 2 + 1)
+
+    @staticmethod
+    def _map_function(spectrum, *args, **kwargs):
+        return np.fft.rfft(_as_real(spectrum)).astype(np.complex64)
+
+
+class CompoundProcess(_ReferenceProcess):
+    """
+    Amplitude, position and width of the largest peak in each spectrum. The results are of a compound data type
+    """
+    process_label = 'Compound'
+    results_name = 'Peak'
+    output_dtype = PEAK_DTYPE
+
+    def _get_spec_dims(self):
+        return usid.write_utils.Dimension('Peak', 'a. u.', 1)
+
+    @staticmethod
+    def _map_function(spectrum, *args, **kwargs):
+        spectrum = np.abs(_as_real(spectrum))
+        peak = np.argmax(spectrum)
+        above = np.where(spectrum >= spectrum[peak] / 2)[0]
+        # Tuples are assigned to the fields of the preallocated compound array
+        return spectrum[peak], peak, above[-1] - above[0] + 1
+
+
+KERNELS = {'cheap': CheapProcess, 'expensive': ExpensiveProcess, 'complex': ComplexProcess,
+           'compound': CompoundProcess}
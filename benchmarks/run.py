@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the Process benchmarks without airspeed velocity and prints a table of the results. For example:
+
+    python -m benchmarks.run --rows 128 --cols 128 --spec-len 1024 --kernels cheap expensive --cores 1 4
+
+Created on Sun Oct 18 15:27:45 2026
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+
+import h5py
+
+from pyUSID.processing.comp_utils import get_available_cores
+
+from .bench_process import MAIN_PATH
+from .measure import measure, BACKENDS
+from .processes import KERNELS
+from .synthetic import make_usid_file
+
+
+@contextmanager
+def _quiet(enabled=True):
+    """
+    Hides everything printed while computing so that only the table of results is printed
+    """
+    if not enabled:
+        yield
+        return
+    orig_stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        yield
+    finally:
+        sys.stdout = orig_stdout
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the pyUSID Process engine on synthetic data')
+    parser.add_argument('--rows', type=int, default=64, help='Rows of positions')
+    parser.add_argument('--cols', type=int, default=64, help='Columns of positions')
+    parser.add_argument('--spec-len', type=int, default=512, help='Spectroscopic values per position')
+    parser.add_argument('--dtype', default='float32', help='Data type of the source dataset')
+    parser.add_argument('--chunks', default='contiguous',
+                        help='"contiguous", "auto", "row" or "<positions>x<spectral>" such as "16x256"')
+    parser.add_argument('--compression', default=None, help='Compression filter such as "gzip" or "lzf"')
+    parser.add_argument('--kernels', nargs='+', default=sorted(KERNELS.keys()), choices=sorted(KERNELS.keys()))
+    parser.add_argument('--cores', nargs='+', type=int, default=[1, get_available_cores()])
+    parser.add_argument('--backends', nargs='+', default=BACKENDS)
+    parser.add_argument('--max-mem-mb', type=int, default=1024, help='Memory available to each process in MB')
+    parser.add_argument('--repeat', type=int, default=1, help='Measurements per combination. The best is reported')
+    parser.add_argument('--file', default=None, help='Path for the synthetic file. Default - a temporary file')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of each computation')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    tmp_dir = None
+    file_path = args.file
+    if file_path is None:
+        tmp_dir = tempfile.mkdtemp()
+        file_path = os.path.join(tmp_dir, 'synthetic.h5')
+
+    columns = ['kernel', 'cores', 'backend', 'pixels/s', 'read MB/s', 'write MB/s', 'peak MB']
+    row_format = '{:<12}{:>6}  {:<14}{:>12}{:>12}{:>12}{:>10}'
+    try:
+        make_usid_file(file_path, num_rows=args.rows, num_cols=args.cols, spec_len=args.spec_len, dtype=args.dtype,
+                       chunks=args.chunks, compression=args.compression)
+        print('{} positions x {} values of {}, chunks: {}, compression: {}'.format(args.rows * args.cols,
+                                                                                 args.spec_len, args.dtype,
+                                                                                 args.chunks, args.compression))
+        print(row_format.format(*columns))
+        with h5py.File(file_path, mode='r+') as h5_f:
+            for kernel in args.kernels:
+                for cores in sorted(set(args.cores)):
+                    if cores > get_available_cores():
+                        print('Skipping {} cores since only {} are available'.format(cores, get_available_cores()))
+                        continue
+                    for backend in args.backends:
+                        with _quiet(not args.verbose):
+                            stats = [measure(h5_f[MAIN_PATH], kernel=kernel, cores=cores, backend=backend,
+                                             max_mem_mb=args.max_mem_mb) for _ in range(args.repeat)]
+                        best = max(stats, key=lambda item: item['pixels_per_sec'])
+                        print(row_format.format(kernel, cores, backend, '{:.1f}'.format(best['pixels_per_sec']),
+                                                '{:.1f}'.format(best['read_mb_per_sec']),
+                                                '{:.1f}'.format(best['write_mb_per_sec']),
+                                                '{:.0f}'.format(best['peak_mem_mb'])))
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
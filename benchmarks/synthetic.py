@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Generates synthetic USID files of configurable size, precision, chunking and compression for benchmarking
+
+Created on Sun Oct 18 14:02:37 2026
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+import sys
+
+import h5py
+import numpy as np
+
+import pyUSID as usid
+
+if sys.version_info.major == 3:
+    unicode = str
+
+__all__ = ['make_usid_file', 'parse_chunks']
+
+
+def parse_chunks(chunks, spec_len):
+    """
+    Interprets the chunking of the main dataset specified as a string, such as on the command line
+
+    Parameters
+    ----------
+    chunks : str, tuple, bool or None
+        "contiguous" or None for no chunking, "auto" or True for chunks chosen by h5py, "row" for one position per
+        chunk, or "<positions>x<spectral>" such as "16x256" for chunks of that shape. Tuples are returned as is
+
+    Returns
+    -------
+    chunks : tuple, bool or None
+        Chunking as expected by :meth:`h5py.Group.create_dataset`
+    """
+    if chunks is None or isinstance(chunks, (bool, tuple)):
+        return chunks
+    if not isinstance(chunks, (str, unicode)):
+        raise TypeError('chunks should be a string, tuple, boolean or None')
+    if chunks == 'contiguous':
+        return None
+    if chunks == 'auto':
+        return True
+    if chunks == 'row':
+        return 1, spec_len
+    try:
+        shape = tuple([int(item) for item in chunks.lower().split('x')])
+    except ValueError:
+        shape = ()
+    if len(shape) != 2 or min(shape) < 1:
+        raise ValueError('chunks should be "contiguous", "auto", "row" or of the form "<positions>x<spectral>". '
+                         'Provided: {}'.format(chunks))
+    return shape
+
+
+def _random_block(rng, shape, dtype):
+    """
+    Returns random values of the provided shape and data type. Complex values have random real and imaginary parts
+    and every field of compound data types is filled separately
+
+    Parameters
+    ----------
+    rng : :class:`numpy.random.RandomState`
+        Source of the random values
+    shape : tuple
+        Shape of the block
+    dtype : :class:`numpy.dtype`
+        Data type of the block
+
+    Returns
+    -------
+    block : :class:`numpy.ndarray`
+        Random values
+    """
+    if dtype.names is not None:
+        block = np.zeros(shape, dtype=dtype)
+        for name in dtype.names:
+            block[name] = _random_block(rng, shape, dtype[name])
+        return block
+    if dtype.kind == 'c':
+        return (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(dtype)
+    if dtype.kind in 'iu':
+        info = np.iinfo(dtype)
+        return rng.randint(max(info.min, -2 ** 15), min(info.max, 2 ** 15), size=shape).astype(dtype)
+    return rng.standard_normal(shape).astype(dtype)
+
+
+def make_usid_file(file_path, num_rows=64, num_cols=64, spec_len=512, dtype=np.float32, chunks=None,
+                   compression=None, seed=0, max_mem_mb=256):
+    """
+    Writes a USID main dataset filled with random values to a new HDF5 file. The data are written a few rows at a
+    time so that files far larger than the memory can be generated
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the HDF5 file. Any existing file will be overwritten
+    num_rows : uint, optional
+        Number of rows of positions. Default - 64
+    num_cols : uint, optional
+        Number of columns of positions. Default - 64
+    spec_len : uint, optional
+        Number of spectroscopic values per position. Default - 512
+    dtype : :class:`numpy.dtype`, optional
+        Real, complex, integer or compound data type of the main dataset. Default - 32 bit floats
+    chunks : str, tuple, bool or None, optional
+        Chunking of the main dataset. See :func:`parse_chunks`. Default - not chunked
+    compression : str, optional
+        Compression filter such as "gzip" or "lzf". Default - no compression
+    seed : int, optional
+        Seed for the random values so that the same file is generated each time. Default - 0
+    max_mem_mb : uint, optional
+        Maximum memory used to hold the values being written. Default - 256 MB
+
+    Returns
+    -------
+    file_path : str
+        Path to the HDF5 file containing the main dataset at "/Measurement_000/Channel_000/Raw_Data"
+    """
+    for name, value in zip(['num_rows', 'num_cols', 'spec_len'], [num_rows, num_cols, spec_len]):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise TypeError('{} should be a positive integer'.format(name))
+    dtype = np.dtype(dtype)
+    chunks = parse_chunks(chunks, spec_len)
+    if compression is not None and chunks is None:
+        # Compressed datasets must be chunked
+        chunks = True
+
+    num_pos = num_rows * num_cols
+    kwargs = {'dtype': dtype, 'compression': compression}
+    if chunks is not None:
+        kwargs['chunks'] = chunks
+
+    with h5py.File(file_path, mode='w') as h5_f:
+        h5_chan = h5_f.create_group('Measurement_000/Channel_000')
+        h5_main = usid.hdf_utils.write_main_dataset(h5_chan, (num_pos, spec_len), 'Raw_Data', 'Current', 'nA',
+                                                    [usid.write_utils.Dimension('X', 'nm', num_cols),
+                                                     usid.write_utils.Dimension('Y', 'nm', num_rows)],
+                                                    usid.write_utils.Dimension('Bias', 'V', spec_len), **kwargs)
+        rng = np.random.RandomState(seed)
+        rows_per_write = max(1, int(max_mem_mb * 1024 ** 2 // (spec_len * dtype.itemsize)))
+        for start in range(0, num_pos, rows_per_write):
+            stop = min(num_pos, start + rows_per_write)
+            h5_main[start: stop] = _random_block(rng, (stop - start, spec_len), dtype)
+    return file_path
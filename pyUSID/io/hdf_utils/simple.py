@@ -8,8 +8,11 @@ Created on Tue Nov  3 21:14:25 2015
 """
 from __future__ import division, print_function, absolute_import, unicode_literals
 import collections
+import hashlib
+import json
 from warnings import warn
 import sys
+from numbers import Number
 import h5py
 import numpy as np
 import dask.array as da
@@ -24,6 +27,10 @@ from .base import get_auxiliary_datasets, link_h5_obj_as_alias, get_attr, link_h
 
 if sys.version_info.major == 3:
     unicode = str
+
+# Prefix of the attributes of a group that index the results groups within it. There is one attribute per source
+# dataset, tool and hash of parameters so that finding or indexing a group only reads and writes a single attribute:
+RESULTS_INDEX_PREFIX = 'results_index:'
 """
 __all__ = ['assign_group_index', 'check_and_link_ancillary', 'check_for_matching_attrs', 'check_for_old',
            'check_if_main', 'copy_attributes', 'copy_main_attributes']
@@ -571,6 +578,258 @@ def check_for_old(h5_base, tool_name, new_parms=None, target_dset=None, verbose=
     return matching_groups
 
 
+def _canonicalize_parm(value):
+    """
+    Converts a parameter value to an equivalent JSON-serializable value such that equal values expressed via different
+    (python / numpy) types are converted to the same value
+
+    Parameters
+    ----------
+    value : object
+        Parameter value
+
+    Returns
+    -------
+    value : object
+        JSON-serializable value
+    """
+    if isinstance(value, dict):
+        return dict([(unicode(key), _canonicalize_parm(val)) for key, val in value.items()])
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, (str, unicode)):
+        return value
+    if isinstance(value, (Number, list, tuple, np.ndarray, np.generic)):
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            # Ragged lists
+            array = np.empty(0, dtype=object)
+        if array.dtype.kind in 'biuf':
+            # Integers and floats of the same value are considered equal, as they are by np.allclose()
+            return {'shape': list(array.shape), 'values': array.astype(np.float64).ravel().tolist()}
+        if array.dtype.kind == 'c':
+            return {'shape': list(array.shape), 'real': array.real.astype(np.float64).ravel().tolist(),
+                    'imag': array.imag.astype(np.float64).ravel().tolist()}
+        return [_canonicalize_parm(item) for item in (value.tolist() if hasattr(value, 'tolist') else value)]
+    if value is None:
+        return value
+    return repr(value)
+
+
+def hash_parms(parms_dict):
+    """
+    Computes a hash of the parameters with which a process is applied to a dataset. The hash does not depend on the
+    order of the parameters or on whether numbers, lists or arrays are expressed via python or numpy types.
+
+    Parameters
+    ----------
+    parms_dict : dict
+        Parameters of the process
+
+    Returns
+    -------
+    parms_hash : str
+        Hexadecimal SHA-1 hash of the parameters
+    """
+    if not isinstance(parms_dict, dict):
+        raise TypeError('parms_dict should be a dict')
+    canonical = json.dumps(_canonicalize_parm(parms_dict), sort_keys=True)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def _get_index_attr_name(h5_main, tool_name, parms_hash=None):
+    """
+    Returns the name of the attribute of the parent group of the dataset that indexes the results groups of the tool
+    computed with the provided hash of parameters. Without a hash, the name of the attribute listing the results
+    groups of the tool that were written before the tool was indexed is returned
+
+    Parameters
+    ----------
+    h5_main : :class:`h5py.Dataset`
+        Dataset to which the tool was applied
+    tool_name : str
+        Name of the tool applied to the dataset
+    parms_hash : str, optional
+        Hash of the parameters of the tool
+
+    Returns
+    -------
+    attr_name : str
+        Name of the attribute
+    """
+    # The hash is left empty for the list of unindexed groups
+    return RESULTS_INDEX_PREFIX + h5_main.name.split('/')[-1] + ':' + tool_name + ':' + \
+        ('' if parms_hash is None else parms_hash)
+
+
+def _read_index_attr(h5_main, attr_name, default):
+    """
+    Reads an attribute of the index of results groups from the parent group of the dataset
+
+    Parameters
+    ----------
+    h5_main : :class:`h5py.Dataset`
+        Dataset to which the tools were applied
+    attr_name : str
+        Name of the attribute
+    default : object
+        Value returned if the attribute does not exist
+
+    Returns
+    -------
+    value : object
+        Decoded contents of the attribute
+    """
+    if attr_name not in h5_main.parent.attrs:
+        return default
+    return json.loads(get_attr(h5_main.parent, attr_name))
+
+
+def get_results_index(h5_main, tool_name):
+    """
+    Returns the index of the groups containing results of the process of name `tool_name` being applied to the dataset.
+    The index is maintained by :func:`~pyUSID.io.hdf_utils.index_results_group` in the attributes of the parent group
+    of the dataset. Use :func:`~pyUSID.io.hdf_utils.find_indexed_results` to find the groups computed with a given set
+    of parameters without reading the rest of the index.
+
+    Parameters
+    ----------
+    h5_main : :class:`h5py.Dataset`
+        Dataset to which the tool was applied
+    tool_name : str
+        Name of the tool applied to the dataset
+
+    Returns
+    -------
+    index : dict
+        Hash of the parameters mapped to a dictionary of the names of the results groups computed with these
+        parameters mapped to the list of names of the status datasets that have been marked as complete
+    """
+    if not isinstance(h5_main, h5py.Dataset):
+        raise TypeError('h5_main should be a h5py.Dataset object')
+    tool_name = validate_single_string_arg(tool_name, 'tool_name')
+    prefix = _get_index_attr_name(h5_main, tool_name)
+    index = dict()
+    for attr_name in h5_main.parent.attrs.keys():
+        # Hashes never contain colons, unlike the attributes of tools whose names start with this tool's name
+        if attr_name.startswith(prefix) and len(attr_name) > len(prefix) and ':' not in attr_name[len(prefix):]:
+            index[attr_name[len(prefix):]] = _read_index_attr(h5_main, attr_name, dict())
+    return index
+
+
+def index_results_group(h5_main, tool_name, parms_hash, h5_group, complete_status=None):
+    """
+    Records the group containing results of the process of name `tool_name` applied to the dataset with the parameters
+    of the provided hash in the index of results groups. When the tool is indexed for the first time, the other
+    results groups of the tool are recorded as unindexed. See :func:`~pyUSID.io.hdf_utils.find_unindexed_results`
+
+    Parameters
+    ----------
+    h5_main : :class:`h5py.Dataset`
+        Dataset to which the tool was applied
+    tool_name : str
+        Name of the tool applied to the dataset
+    parms_hash : str
+        Hash of the parameters of the tool. See :func:`~pyUSID.io.hdf_utils.hash_parms`
+    h5_group : :class:`h5py.Group`
+        Group containing the results
+    complete_status : str, optional
+        Name of the dataset within h5_group tracking the positions that have been computed, if all positions have
+        now been computed
+    """
+    if not isinstance(h5_main, h5py.Dataset):
+        raise TypeError('h5_main should be a h5py.Dataset object')
+    if not isinstance(h5_group, h5py.Group):
+        raise TypeError('h5_group should be a h5py.Group object')
+    if h5_group.parent != h5_main.parent:
+        raise ValueError('h5_group should be a results group in the same group as h5_main')
+    tool_name = validate_single_string_arg(tool_name, 'tool_name')
+    parms_hash = validate_single_string_arg(parms_hash, 'parms_hash')
+    if ':' in parms_hash:
+        raise ValueError('parms_hash should not contain colons')
+    if complete_status is not None:
+        complete_status = validate_single_string_arg(complete_status, 'complete_status')
+
+    group_name = h5_group.name.split('/')[-1]
+    h5_parent_group = h5_main.parent
+
+    unindexed_name = _get_index_attr_name(h5_main, tool_name)
+    unindexed = _read_index_attr(h5_main, unindexed_name, None)
+    if unindexed is None:
+        unindexed = sorted([h5_other.name.split('/')[-1] for h5_other in find_results_groups(h5_main, tool_name)])
+    if group_name in unindexed or unindexed_name not in h5_parent_group.attrs:
+        # Only groups written before the tool was indexed are listed, so this list never grows
+        h5_parent_group.attrs[unindexed_name] = json.dumps([name for name in unindexed if name != group_name])
+
+    attr_name = _get_index_attr_name(h5_main, tool_name, parms_hash)
+    groups = _read_index_attr(h5_main, attr_name, dict())
+    completed = groups.setdefault(group_name, [])
+    if complete_status is not None and complete_status not in completed:
+        completed.append(complete_status)
+    h5_parent_group.attrs[attr_name] = json.dumps(groups, sort_keys=True)
+
+
+def find_indexed_results(h5_main, tool_name, parms_hash):
+    """
+    Finds the groups containing results of the process of name `tool_name` being applied to the dataset with the
+    parameters of the provided hash via the index of results groups. Only the attribute indexing this hash is read.
+    Groups that no longer exist are skipped.
+
+    Parameters
+    ----------
+    h5_main : :class:`h5py.Dataset`
+        Dataset to which the tool was applied
+    tool_name : str
+        Name of the tool applied to the dataset
+    parms_hash : str
+        Hash of the parameters of the tool. See :func:`~pyUSID.io.hdf_utils.hash_parms`
+
+    Returns
+    -------
+    groups : list of tuples
+        Each :class:`h5py.Group` along with the list of names of the status datasets that have been marked as complete
+    """
+    if not isinstance(h5_main, h5py.Dataset):
+        raise TypeError('h5_main should be a h5py.Dataset object')
+    tool_name = validate_single_string_arg(tool_name, 'tool_name')
+    parms_hash = validate_single_string_arg(parms_hash, 'parms_hash')
+    groups = _read_index_attr(h5_main, _get_index_attr_name(h5_main, tool_name, parms_hash), dict())
+    h5_parent_group = h5_main.parent
+    return [(h5_parent_group[name], completed) for name, completed in sorted(groups.items())
+            if name in h5_parent_group and isinstance(h5_parent_group[name], h5py.Group)]
+
+
+def find_unindexed_results(h5_main, tool_name):
+    """
+    Finds the groups containing results of the process of name `tool_name` being applied to the dataset that were
+    written before the tool was indexed and have not been indexed since. Only these groups need to be compared by their
+    attributes. Groups that no longer exist are skipped.
+
+    Parameters
+    ----------
+    h5_main : :class:`h5py.Dataset`
+        Dataset to which the tool was applied
+    tool_name : str
+        Name of the tool applied to the dataset
+
+    Returns
+    -------
+    groups : list of :class:`h5py.Group` or None
+        Groups that have not been indexed. None if the tool has never been indexed for this dataset, in which case
+        all groups found by :func:`~pyUSID.io.hdf_utils.find_results_groups` are unindexed
+    """
+    if not isinstance(h5_main, h5py.Dataset):
+        raise TypeError('h5_main should be a h5py.Dataset object')
+    tool_name = validate_single_string_arg(tool_name, 'tool_name')
+    names = _read_index_attr(h5_main, _get_index_attr_name(h5_main, tool_name), None)
+    if names is None:
+        return None
+    h5_parent_group = h5_main.parent
+    return [h5_parent_group[name] for name in names
+            if name in h5_parent_group and isinstance(h5_parent_group[name], h5py.Group)]
+
+
 def get_source_dataset(h5_group):
     """
     Find the name of the source dataset used to create the input `h5_group`
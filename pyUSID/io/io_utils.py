@@ -233,7 +233,7 @@ def formatted_str_to_number(str_val, magnitude_names, magnitude_values, separato
             return scaling * float(components[0])
 
 
-def get_available_memory():
+def get_available_memory(return_source=False):
     """
     Returns the available memory
 
@@ -241,15 +241,22 @@ def get_available_memory():
     ----
     This function has been moved to pyUSID.processing.comp_utils. PLease update your code to avoid future errors.
 
+    Parameters
+    ----------
+    return_source : bool, optional. Default = False
+        Whether or not to also return the source of the limit
+
     Returns
     -------
     mem : unsigned int
         Memory in bytes
+    source : str
+        Source of the limit. Only returned if return_source is True
     """
     from warnings import warn
     warn('Please use pyUSID.processing.comp_utils.get_available_memory() instead in the future', FutureWarning)
     from ..processing.comp_utils import get_available_memory
-    return get_available_memory()
+    return get_available_memory(return_source=return_source)
 
 
 def recommend_cpu_cores(num_jobs, requested_cores=None, lengthy_computation=False, min_free_cores=None, verbose=False):
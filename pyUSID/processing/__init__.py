@@ -10,7 +10,11 @@ Submodules
 """
 
 from .process import Process
-from .comp_utils import parallel_compute
+from .pipeline import ProcessPipeline
+from .comp_utils import parallel_compute, parallel_compute_blocks, imap_compute, dask_compute, WorkerPool
 from . import comp_utils
+from . import status_utils
+from . import trace_utils
 
-__all__ = ['Process', 'parallel_compute', 'comp_utils']
+__all__ = ['Process', 'ProcessPipeline', 'parallel_compute', 'parallel_compute_blocks', 'imap_compute', 'dask_compute',
+           'WorkerPool', 'comp_utils', 'status_utils', 'trace_utils']
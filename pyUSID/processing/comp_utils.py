@@ -6,25 +6,64 @@ Created on Tue Nov  3 21:14:25 2015
 
 @author: Suhas Somnath, Chris Smith
 """
+import os
+import sys
+import shutil
+import tempfile
+import time as tm
+from collections import deque
 import joblib
+import h5py
 import numpy as np
+import dask.array as da
 from multiprocessing import cpu_count
 from psutil import virtual_memory as vm
 
+if sys.version_info.major == 3:
+    unicode = str
+
+
+MPI_RANK_PID_ENV = 'PYUSID_MPI_RANK_PID'
+"""
+Environment variable holding the process ID of the MPI rank. Processes started by the rank, such as the workers that
+compute on its behalf, inherit it and can thereby tell that they are not the rank itself
+"""
+
+
+def _is_mpi_worker():
+    """
+    Returns whether or not this process was started by an MPI rank rather than by mpirun / mpiexec
+
+    Returns
+    -------
+    is_worker : bool
+        Whether or not this process is a worker of an MPI rank
+    """
+    rank_pid = os.environ.get(MPI_RANK_PID_ENV)
+    return rank_pid is not None and rank_pid != str(os.getpid())
+
 
 def get_MPI():
     """
-    Returns the mpi4py.MPI object if mpi4py is available and size > 1. Returns None otherwise
+    Returns the mpi4py.MPI object if mpi4py is available and size > 1. Returns None otherwise.
+
+    Workers started by an MPI rank, whether forked or spawned, always get None so that they never initialize MPI or
+    touch the communicators of the rank. Only the rank itself communicates with other ranks.
 
     Returns
     -------
     MPI : :class:`mpi4py.MPI` object or None
     """
+    if _is_mpi_worker():
+        return None
     try:
         from mpi4py import MPI
         if MPI.COMM_WORLD.Get_size() == 1:
             # mpi4py available but NOT called via mpirun or mpiexec => single node
             MPI = None
+        else:
+            # Inherited by any workers started from now on
+            os.environ[MPI_RANK_PID_ENV] = str(os.getpid())
     except ImportError:
         # mpi4py not even present! Single node by default:
         MPI = None
@@ -87,7 +126,817 @@ def group_ranks_by_socket(verbose=False):
     return master_ranks
 
 
-def parallel_compute(data, func, cores=None, lengthy_computation=False, func_args=None, func_kwargs=None, verbose=False):
+def _get_affinity():
+    """
+    Returns the logical cores that this process is pinned to
+
+    Returns
+    -------
+    cores : set of int
+        Indices of the logical cores
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return set(os.sched_getaffinity(0))
+    return set(range(cpu_count()))
+
+
+def recommend_cores_per_rank(comm=None, verbose=False):
+    """
+    Recommends the number of logical cores that the workers of this MPI rank should use such that the ranks on a node
+    do not compete for the same cores. This enables running a few ranks per node, each computing with a pool of
+    workers, rather than one rank per core. The cores that this rank is pinned to (e.g. - via mpirun --bind-to socket
+    or srun --cpu-bind) are shared equally among the ranks on the same node that are pinned to any of the same cores.
+    The CPU quota of the cgroup of the job is shared equally among all ranks on the node.
+    This is a collective operation when computing via MPI.
+
+    Parameters
+    ----------
+    comm : :class:`mpi4py.MPI.Comm`, optional
+        Communicator of the ranks. Default - MPI.COMM_WORLD
+    verbose : bool, optional
+        Whether or not to print debugging statements
+
+    Returns
+    -------
+    cores : uint
+        Number of logical cores for this rank. All available cores when not computing via MPI
+    """
+    if comm is None:
+        MPI = get_MPI()
+        if MPI is None:
+            return get_available_cores()
+        comm = MPI.COMM_WORLD
+    from mpi4py import MPI
+
+    affinity = _get_affinity()
+    everyone = comm.allgather((MPI.Get_processor_name(), sorted(affinity)))
+    node = everyone[comm.Get_rank()][0]
+    on_node = [set(cpus) for name, cpus in everyone if name == node]
+    sharing = sum([len(affinity & cpus) > 0 for cpus in on_node])
+
+    cores = len(affinity) // sharing
+    quota, _ = _get_cgroup_cpu_limit()
+    if quota is not None:
+        cores = min(cores, int(quota // len(on_node)))
+    cores = max(1, min(cores, cpu_count()))
+    if verbose:
+        print('Rank {} on {} is pinned to {} cores shared by {} of the {} ranks on the node and will use {} cores'
+              '.'.format(comm.Get_rank(), node, len(affinity), sharing, len(on_node), cores))
+    return cores
+
+
+# Environment variables in which MPI launchers report the number of ranks on this node:
+LOCAL_SIZE_ENVS = ['OMPI_COMM_WORLD_LOCAL_SIZE', 'MPI_LOCALNRANKS', 'PMI_LOCAL_SIZE', 'SLURM_NTASKS_PER_NODE']
+
+
+def _get_rank_cores(requested_cores=None):
+    """
+    Returns the number of logical cores that the workers of this MPI rank may use without communicating with other
+    ranks, unlike :func:`~pyUSID.processing.comp_utils.recommend_cores_per_rank`
+
+    Parameters
+    ----------
+    requested_cores : uint, optional
+        Number of cores requested. Limited to the cores available to this rank. Default - the available cores are
+        shared equally among the ranks on this node as reported by the MPI launcher. 1 if the launcher does not
+        report the number of ranks on this node
+
+    Returns
+    -------
+    cores : uint
+        Number of logical cores
+    """
+    available = get_available_cores()
+    if requested_cores is not None:
+        if not isinstance(requested_cores, int):
+            raise TypeError('cores should be an unsigned integer')
+        return max(1, min(int(abs(requested_cores)), available))
+    for name in LOCAL_SIZE_ENVS:
+        try:
+            local_ranks = int(os.environ.get(name, ''))
+        except ValueError:
+            # SLURM reports heterogeneous layouts such as "2(x3),1"
+            continue
+        if local_ranks > 0:
+            return max(1, available // local_ranks)
+    return 1
+
+
+# Names of the backends that workers may use mapped to the names used by joblib:
+BACKENDS = {'processes': None, 'threads': 'threading'}
+
+
+def check_backend(backend):
+    """
+    Checks whether the provided name of a backend for the workers is valid
+
+    Parameters
+    ----------
+    backend : str
+        "processes" - workers are separate processes. Rows and results are copied to and from the workers.
+        "threads" - workers are threads within this process that share the data without copying it. Only
+        worthwhile when the function releases the GIL, as most numpy and scipy functions do.
+
+    Returns
+    -------
+    joblib_backend : str or None
+        Name of the equivalent backend in joblib. None for the default backend of joblib
+    """
+    if not isinstance(backend, (str, unicode)):
+        raise TypeError('backend should be a string')
+    if backend not in BACKENDS:
+        raise ValueError('backend should be one of: {}'.format(sorted(BACKENDS.keys())))
+    return BACKENDS[backend]
+
+
+GRAIN_DURATION = 0.1
+"""
+Time in seconds that each task of rows should take when the grain size is chosen automatically. Dispatching a task
+to a worker costs far less than this
+"""
+
+GRAINS_PER_WORKER = 4
+"""
+Minimum number of tasks per worker when the grain size is chosen automatically so that workers that finish early can
+pick up the remaining tasks
+"""
+
+
+def check_grain_size(grain_size):
+    """
+    Checks whether the provided grain size, the number of rows computed by a worker per task, is valid
+
+    Parameters
+    ----------
+    grain_size : uint or str or None
+        Number of rows per task, "auto" to choose it from the time taken to compute the first few rows, or None to
+        send one row per task, or a few ranges of rows per worker when sharing memory
+
+    Returns
+    -------
+    grain_size : uint or str or None
+        The validated grain size
+    """
+    if grain_size is None:
+        return grain_size
+    if isinstance(grain_size, (str, unicode)):
+        if grain_size != 'auto':
+            raise ValueError('grain_size should either be "auto" or a positive integer')
+        return grain_size
+    if not isinstance(grain_size, int) or isinstance(grain_size, bool):
+        raise TypeError('grain_size should either be "auto" or a positive integer')
+    if grain_size < 1:
+        raise ValueError('grain_size should either be "auto" or a positive integer')
+    return grain_size
+
+
+def recommend_grain_size(time_per_row, num_rows, num_workers):
+    """
+    Recommends the number of rows that a worker should compute per task. Rows that are cheap to compute are grouped
+    into large tasks so that the time spent dispatching tasks and collecting their results does not dominate. Rows
+    that are expensive to compute are dispatched in small tasks so that the load remains balanced among the workers
+
+    Parameters
+    ----------
+    time_per_row : float
+        Time in seconds taken to compute a single row
+    num_rows : uint
+        Number of rows that remain to be computed
+    num_workers : uint
+        Number of workers computing the rows
+
+    Returns
+    -------
+    grain_size : uint
+        Number of rows per task
+    """
+    max_grain = int(np.ceil(num_rows / (GRAINS_PER_WORKER * max(1, num_workers))))
+    if time_per_row <= 0:
+        return max(1, max_grain)
+    return int(max(1, min(np.ceil(GRAIN_DURATION / time_per_row), max_grain)))
+
+
+def _time_first_rows(func, data, func_args, func_kwargs, max_rows=8, max_time=0.05):
+    """
+    Computes the first few rows in this process to estimate the time taken per row. Rows are computed until either
+    limit is reached, and at least one row is always computed
+
+    Parameters
+    ----------
+    func : callable
+        Function to map to each row
+    data : numpy.ndarray
+        Data to map function to
+    func_args : list
+        arguments to be passed to the function
+    func_kwargs : dict
+        keyword arguments to be passed onto function
+    max_rows : uint, optional
+        Maximum number of rows to compute
+    max_time : float, optional
+        Time in seconds after which no more rows are computed
+
+    Returns
+    -------
+    results : list
+        Results of the computed rows, which need not be computed again
+    time_per_row : float
+        Mean time in seconds taken to compute a row
+    """
+    results = []
+    t_start = tm.time()
+    elapsed = 0
+    while len(results) < min(max_rows, data.shape[0]) and (len(results) == 0 or elapsed < max_time):
+        results.append(func(data[len(results)], *func_args, **func_kwargs))
+        elapsed = tm.time() - t_start
+    return results, elapsed / max(1, len(results))
+
+
+def allocate_results(num_rows, shape=(), dtype=np.float32):
+    """
+    Preallocates an array that the results of mapping a function to each row of some data can be written into
+
+    Parameters
+    ----------
+    num_rows : uint
+        Number of rows in the data
+    shape : tuple of uint, optional
+        Shape of the results of each row. Default - () - one value per row
+    dtype : :class:`numpy.dtype`, optional
+        Data type of the results, which may be complex or compound. Default - 32 bit floats
+
+    Returns
+    -------
+    out : numpy.ndarray
+        Array of shape (num_rows,) + shape filled with zeros
+    """
+    if not isinstance(num_rows, (int, np.integer)) or isinstance(num_rows, bool) or num_rows < 0:
+        raise TypeError('num_rows should be an unsigned integer')
+    if isinstance(shape, (int, np.integer)):
+        shape = (shape,)
+    if not isinstance(shape, (tuple, list)):
+        raise TypeError('shape should be a tuple of unsigned integers')
+    for item in shape:
+        if not isinstance(item, (int, np.integer)) or isinstance(item, bool) or item < 0:
+            raise TypeError('shape should be a tuple of unsigned integers')
+    return np.zeros((int(num_rows),) + tuple([int(item) for item in shape]), dtype=np.dtype(dtype))
+
+
+def check_out(out, num_rows):
+    """
+    Checks whether the provided array can hold the results of all rows of some data
+
+    Parameters
+    ----------
+    out : numpy.ndarray or None
+        Preallocated array of results. Nothing is checked if None
+    num_rows : uint
+        Number of rows in the data
+    """
+    if out is None:
+        return
+    if not isinstance(out, np.ndarray):
+        raise TypeError('out should be a numpy array')
+    if out.ndim == 0 or out.shape[0] != num_rows:
+        raise ValueError('out should have {} rows - one per row of data. Provided shape: {}'
+                         '.'.format(num_rows, out.shape))
+    if out.dtype == object:
+        raise TypeError('out should not be an array of python objects')
+
+
+class RowFailure(object):
+    """
+    Stands in for the results of a row whose computation raised an exception. Returned by functions wrapped via
+    :func:`~pyUSID.processing.comp_utils.isolate_failures`
+    """
+
+    def __init__(self, error):
+        """
+        Parameters
+        ----------
+        error : str
+            Name of the exception and its message
+        """
+        self.error = error
+
+    def __repr__(self):
+        return 'RowFailure({!r})'.format(self.error)
+
+
+class _IsolatedFunction(object):
+    """
+    Calls the wrapped function and returns a RowFailure instead of raising any exception. A class rather than a
+    closure so that it can be sent to workers in other processes
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        try:
+            return self.func(*args, **kwargs)
+        except Exception as exc:
+            return RowFailure('{}: {}'.format(type(exc).__name__, exc))
+
+
+def isolate_failures(func):
+    """
+    Wraps the provided function such that exceptions raised for any one row, such as a fit diverging, do not abort
+    the computation of all other rows. The results of a failed row are a
+    :class:`~pyUSID.processing.comp_utils.RowFailure` describing the exception instead.
+
+    Examples
+    --------
+    >>> results = parallel_compute(data, isolate_failures(func))
+    >>> failed = [index for index, result in enumerate(results) if isinstance(result, RowFailure)]
+
+    Parameters
+    ----------
+    func : callable
+        Function to map to each row
+
+    Returns
+    -------
+    func : callable
+        Function that returns the results of func or a RowFailure. Results cannot be written into a preallocated
+        array via out or shared_memory in :func:`~pyUSID.processing.comp_utils.parallel_compute`
+    """
+    if not callable(func):
+        raise TypeError('Function argument is not callable')
+    return _IsolatedFunction(func)
+
+
+def _compute_rows(func, rows, func_args, func_kwargs, out_spec=None):
+    """
+    Maps the function to each of the provided rows. This is run by the workers so that a single task computes
+    several rows
+
+    Parameters
+    ----------
+    func : callable
+        Function to map to each row
+    rows : numpy.ndarray
+        Rows to compute
+    func_args : list
+        arguments to be passed to the function
+    func_kwargs : dict
+        keyword arguments to be passed onto function
+    out_spec : tuple, optional
+        Shape and dtype of the results of each row. If provided, results are written into an array instead of a list
+
+    Returns
+    -------
+    results : list or numpy.ndarray
+        Results for each row
+    """
+    if out_spec is None:
+        return [func(row, *func_args, **func_kwargs) for row in rows]
+    results = np.zeros((len(rows),) + out_spec[0], dtype=out_spec[1])
+    _compute_rows_into(func, rows, results, 0, len(rows), func_args, func_kwargs)
+    return results
+
+
+def _map_grains(parallel, func, data, func_args, func_kwargs, num_workers, grain_size=None, verbose=False,
+                out=None):
+    """
+    Maps the function to the first axis of the data by sending the workers tasks of several consecutive rows each
+    and returns the results in the order of the rows
+
+    Parameters
+    ----------
+    parallel : :class:`joblib.Parallel`
+        Workers to compute with
+    func : callable
+        Function to map to data
+    data : numpy.ndarray
+        Data to map function to
+    func_args : list
+        arguments to be passed to the function
+    func_kwargs : dict
+        keyword arguments to be passed onto function
+    num_workers : uint
+        Number of workers in parallel
+    grain_size : uint or str, optional
+        Number of rows per task or "auto" to choose it from the time taken to compute the first few rows.
+        Default - one row per task
+    verbose : bool, optional. default = False
+        Whether or not to print statements that aid in debugging
+    out : numpy.ndarray, optional
+        Preallocated array with one row per row of data that the results will be written into. Each task then
+        returns its results as an array rather than as a list
+
+    Returns
+    -------
+    results : list or numpy.ndarray
+        Results for each row. out if it was provided
+    """
+    head = []
+    if grain_size == 'auto':
+        head, time_per_row = _time_first_rows(func, data, func_args, func_kwargs)
+        grain_size = recommend_grain_size(time_per_row, data.shape[0] - len(head), num_workers)
+    elif grain_size is None:
+        grain_size = 1
+    starts = range(len(head), data.shape[0], grain_size)
+    if verbose:
+        print('Computing {} tasks of up to {} rows each'.format(len(starts), grain_size))
+    out_spec = None if out is None else (out.shape[1:], out.dtype)
+    tasks = parallel(joblib.delayed(_compute_rows)(func, data[start: start + grain_size], func_args, func_kwargs,
+                                                   out_spec=out_spec)
+                     for start in starts)
+    if out is None:
+        for task_results in tasks:
+            head += task_results
+        return head
+    for index, result in enumerate(head):
+        out[index] = result
+    for start, task_results in zip(starts, tasks):
+        out[start: start + len(task_results)] = task_results
+    return out
+
+
+def _get_shared_dir():
+    """
+    Returns the directory in which files shared with workers should be created. Memory backed file systems such as
+    /dev/shm are preferred so that the files never need to touch the disk
+
+    Returns
+    -------
+    path : str
+        Path to the directory
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _compute_rows_shared(func, source_spec, results_spec, start, stop, func_args, func_kwargs):
+    """
+    Maps the function to a range of rows of a memory mapped array and writes results into another memory mapped array.
+    This is run by the workers
+
+    Parameters
+    ----------
+    func : callable
+        Function to map to each row
+    source_spec : tuple
+        Path, dtype, and shape of the memory mapped source array
+    results_spec : tuple
+        Path, dtype, and shape of the memory mapped results array
+    start : uint
+        First row to compute
+    stop : uint
+        One more than the last row to compute
+    func_args : list
+        arguments to be passed to the function
+    func_kwargs : dict
+        keyword arguments to be passed onto function
+    """
+    source = np.memmap(source_spec[0], dtype=source_spec[1], mode='r', shape=source_spec[2])
+    results = np.memmap(results_spec[0], dtype=results_spec[1], mode='r+', shape=results_spec[2])
+    _compute_rows_into(func, source, results, start, stop, func_args, func_kwargs)
+    results.flush()
+
+
+def _compute_rows_into(func, source, results, start, stop, func_args, func_kwargs):
+    """
+    Maps the function to a range of rows of the source array and writes results into the results array
+
+    Parameters
+    ----------
+    func : callable
+        Function to map to each row
+    source : numpy.ndarray
+        Source array
+    results : numpy.ndarray
+        Preallocated results array
+    start : uint
+        First row to compute
+    stop : uint
+        One more than the last row to compute
+    func_args : list
+        arguments to be passed to the function
+    func_kwargs : dict
+        keyword arguments to be passed onto function
+    """
+    for index in range(start, stop):
+        results[index] = func(source[index], *func_args, **func_kwargs)
+
+
+def _map_shared(parallel, func, data, func_args, func_kwargs, num_workers, verbose=False, threads=False,
+                grain_size=None, out=None):
+    """
+    Maps the function to the first axis of the data by placing the data in a memory mapped file once and having
+    each worker compute a range of rows and write its results into a preallocated, memory mapped, results array.
+    Neither individual rows nor their results are serialized. The shape and data type of the results are inferred
+    from the results of the first row
+
+    Parameters
+    ----------
+    parallel : :class:`joblib.Parallel` or None
+        Workers to compute with. Rows are computed in this process if None
+    func : callable
+        Function to map to data. Must return numbers or numpy arrays of the same shape for every row
+    data : numpy.ndarray
+        Data to map function to
+    func_args : list
+        arguments to be passed to the function
+    func_kwargs : dict
+        keyword arguments to be passed onto function
+    num_workers : uint
+        Number of workers in parallel
+    verbose : bool, optional. default = False
+        Whether or not to print statements that aid in debugging
+    threads : bool, optional. default = False
+        Whether or not the workers are threads, which can write into an array in memory instead of a file
+    grain_size : uint or str, optional
+        Number of rows per range or "auto" to choose it from the time taken to compute the first few rows.
+        Default - a few ranges per worker
+    out : numpy.ndarray, optional
+        Preallocated array with one row per row of data that the results will be written into. By default, the
+        shape and data type of the results are inferred from the results of the first row
+
+    Returns
+    -------
+    results : numpy.ndarray
+        Results stacked along the first axis. out if it was provided
+    """
+    if data.dtype == object:
+        raise TypeError('data of type object cannot be shared with workers')
+    if data.shape[0] == 0:
+        return np.zeros(0) if out is None else out
+    if grain_size == 'auto' and parallel is not None:
+        head, time_per_row = _time_first_rows(func, data, func_args, func_kwargs)
+        grain_size = recommend_grain_size(time_per_row, data.shape[0] - len(head), num_workers)
+    elif out is None:
+        head = [func(data[0], *func_args, **func_kwargs)]
+    else:
+        head = []
+    if out is None:
+        first = np.asarray(head[0])
+        if first.dtype == object:
+            raise TypeError('Results of the mapped function should be numbers or numpy arrays in order to be shared')
+        out = np.zeros((data.shape[0],) + first.shape, dtype=first.dtype)
+    for index, result in enumerate(head):
+        out[index] = result
+    if parallel is None or data.shape[0] == len(head):
+        _compute_rows_into(func, data, out, len(head), data.shape[0], func_args, func_kwargs)
+        return out
+
+    if grain_size is None:
+        # A few ranges per worker balance the load when some rows take longer than others
+        bounds = np.linspace(len(head), data.shape[0],
+                             min(data.shape[0] - len(head), 4 * num_workers) + 1).astype(int).tolist()
+    else:
+        bounds = list(range(len(head), data.shape[0], grain_size)) + [data.shape[0]]
+
+    if threads:
+        parallel(joblib.delayed(_compute_rows_into)(func, data, out, start, stop, func_args, func_kwargs)
+                 for start, stop in zip(bounds[:-1], bounds[1:]))
+        return out
+
+    shared_dir = tempfile.mkdtemp(prefix='pyUSID_', dir=_get_shared_dir())
+    try:
+        source_spec = (os.path.join(shared_dir, 'source.dat'), data.dtype, data.shape)
+        source = np.memmap(source_spec[0], dtype=data.dtype, mode='w+', shape=data.shape)
+        source[:] = data
+        source.flush()
+        del source
+        results_spec = (os.path.join(shared_dir, 'results.dat'), out.dtype, out.shape)
+        results = np.memmap(results_spec[0], dtype=out.dtype, mode='w+', shape=out.shape)
+        results[:len(head)] = out[:len(head)]
+        results.flush()
+
+        if verbose:
+            print('Computing {} ranges of rows via files in {}'.format(len(bounds) - 1, shared_dir))
+        parallel(joblib.delayed(_compute_rows_shared)(func, source_spec, results_spec, start, stop, func_args,
+                                                      func_kwargs)
+                 for start, stop in zip(bounds[:-1], bounds[1:]))
+        # Copy out of the file before it is deleted
+        out[len(head):] = results[len(head):]
+        del results
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+    return out
+
+
+def _get_worker_id():
+    """
+    Returns the process ID of the worker. Used for spinning up the workers in a pool
+
+    Returns
+    -------
+    pid : int
+        Process ID
+    """
+    return os.getpid()
+
+
+class WorkerPool(object):
+    """
+    A pool of workers that is started once and can be reused across several calls to
+    :func:`~pyUSID.processing.comp_utils.parallel_compute`, thereby avoiding the cost of starting and stopping the
+    workers each time.
+
+    Examples
+    --------
+    >>> with WorkerPool(cores=4) as pool:
+    >>>     for batch in batches:
+    >>>         results = parallel_compute(batch, func, pool=pool)
+    """
+
+    def __init__(self, cores=None, verbose=False, backend='processes'):
+        """
+        Parameters
+        ----------
+        cores : uint, optional
+            Number of logical cores (workers) to use. Default - All cores - 1 (total cores <= 4) or - 2 (cores > 4)
+        verbose : bool, optional. default = False
+            Whether or not to print statements that aid in debugging
+        backend : str, optional. default = "processes"
+            Whether the workers are separate "processes" or "threads" within this process. See
+            :func:`~pyUSID.processing.comp_utils.check_backend`
+        """
+        self.__joblib_backend = check_backend(backend)
+        logical_cores = get_available_cores()
+        if cores is None:
+            cores = max(1, logical_cores - 1 - int(logical_cores > 4))
+        else:
+            if not isinstance(cores, int):
+                raise TypeError('cores should be an unsigned integer')
+            cores = max(1, min(int(abs(cores)), logical_cores))
+        self.cores = cores
+        self.verbose = verbose
+        self.backend = backend
+        self.startup_time = None
+        self.__parallel = None
+
+    @property
+    def is_active(self):
+        """
+        Whether or not the pool has been started and not yet shut down
+        """
+        return self.startup_time is not None
+
+    def start(self):
+        """
+        Starts the workers. Nothing is done if the pool is already active.
+
+        Returns
+        -------
+        startup_time : float
+            Time in seconds taken to start the workers
+        """
+        if self.is_active:
+            return self.startup_time
+        t_start = tm.time()
+        if self.cores > 1:
+            self.__parallel = joblib.Parallel(n_jobs=self.cores, backend=self.__joblib_backend)
+            self.__parallel.__enter__()
+            # Workers are only spawned when there is work. Make them start now
+            _ = self.__parallel(joblib.delayed(_get_worker_id)() for _ in range(self.cores))
+        self.startup_time = tm.time() - t_start
+        if self.verbose:
+            print('Started pool of {} {} in {} sec'.format(self.cores, self.backend, np.round(self.startup_time, 3)))
+        return self.startup_time
+
+    def map(self, func, data, func_args=None, func_kwargs=None, shared_memory=False, grain_size=None, out=None):
+        """
+        Maps the provided function to the first axis of data using the workers in this pool
+
+        Parameters
+        ----------
+        func : callable
+            Function to map to data
+        data : numpy.ndarray or list
+            Data to map function to. Function will be mapped to the first axis of data or to each item of a list,
+            such as the sub-blocks made by :func:`~pyUSID.processing.comp_utils.parallel_compute_blocks`. Each item
+            of a list is sent to the workers as a task of its own
+        func_args : list, optional
+            arguments to be passed to the function
+        func_kwargs : dict, optional
+            keyword arguments to be passed onto function
+        shared_memory : bool, optional
+            Whether or not to share data and results with the workers via memory mapped files instead of sending each
+            row and its results to and from the workers. See :func:`~pyUSID.processing.comp_utils.parallel_compute`.
+            Requires data to be a numpy array
+        grain_size : uint or str, optional
+            Number of rows computed by a worker per task or "auto". Ignored for lists.
+            See :func:`~pyUSID.processing.comp_utils.parallel_compute`
+        out : numpy.ndarray, optional
+            Preallocated array that results will be written into. Requires data to be a numpy array.
+            See :func:`~pyUSID.processing.comp_utils.parallel_compute`
+
+        Returns
+        -------
+        results : list or numpy.ndarray
+            List of computational results. Array of results if shared_memory is True or out is provided
+        """
+        if not self.is_active:
+            raise ValueError('The pool has not been started or has already been shut down')
+        if func_args is None:
+            func_args = list()
+        if func_kwargs is None:
+            func_kwargs = dict()
+        grain_size = check_grain_size(grain_size)
+        if not isinstance(data, np.ndarray):
+            if shared_memory or out is not None:
+                raise TypeError('data must be a numpy array in order to share memory or to write into out')
+            if self.__parallel is None:
+                return [func(item, *func_args, **func_kwargs) for item in data]
+            return self.__parallel(joblib.delayed(func)(item, *func_args, **func_kwargs) for item in data)
+        check_out(out, len(data))
+        if shared_memory or (out is not None and self.backend == 'threads'):
+            return _map_shared(self.__parallel, func, data, func_args, func_kwargs, self.cores, verbose=self.verbose,
+                               threads=self.backend == 'threads', grain_size=grain_size, out=out)
+        if self.__parallel is None:
+            if out is not None:
+                _compute_rows_into(func, data, out, 0, data.shape[0], func_args, func_kwargs)
+                return out
+            return [func(vector, *func_args, **func_kwargs) for vector in data]
+        return _map_grains(self.__parallel, func, data, func_args, func_kwargs, self.cores, grain_size=grain_size,
+                           verbose=self.verbose, out=out)
+
+    def shutdown(self):
+        """
+        Stops all workers in this pool
+        """
+        if self.__parallel is not None:
+            self.__parallel.__exit__(None, None, None)
+            self.__parallel = None
+        self.startup_time = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+class SharedCounter(object):
+    """
+    Counter that can be atomically incremented by all ranks in an MPI communicator without the participation of any
+    other rank. The value resides in a one-sided communication (RMA) window on rank 0. A plain local counter is used
+    when no communicator is provided.
+    """
+
+    def __init__(self, comm=None):
+        """
+        Creates the counter with a value of 0. This is a collective operation when a communicator is provided.
+
+        Parameters
+        ----------
+        comm : :class:`mpi4py.MPI.Comm`, optional
+            Communicator whose ranks will share this counter. Default - None (not shared)
+        """
+        self.__value = 0
+        self.__win = None
+        if comm is not None:
+            from mpi4py import MPI
+            itemsize = MPI.INT64_T.Get_size()
+            self.__win = MPI.Win.Allocate(itemsize if comm.Get_rank() == 0 else 0, disp_unit=itemsize, comm=comm)
+            if comm.Get_rank() == 0:
+                self.__win.Lock(0, MPI.LOCK_EXCLUSIVE)
+                self.__win.Put(np.zeros(1, dtype=np.int64), 0)
+                self.__win.Unlock(0)
+            comm.Barrier()
+
+    def fetch_and_add(self, increment):
+        """
+        Atomically adds the provided increment to the counter
+
+        Parameters
+        ----------
+        increment : int
+            Value to add to the counter
+
+        Returns
+        -------
+        value : int
+            Value of the counter before the increment was added
+        """
+        if self.__win is None:
+            value = self.__value
+            self.__value += increment
+            return value
+        from mpi4py import MPI
+        result = np.zeros(1, dtype=np.int64)
+        self.__win.Lock(0, MPI.LOCK_SHARED)
+        self.__win.Fetch_and_op(np.array([increment], dtype=np.int64), result, 0, 0, MPI.SUM)
+        self.__win.Unlock(0)
+        return int(result[0])
+
+    def free(self):
+        """
+        Releases the window holding the counter. This is a collective operation when a communicator was provided.
+        """
+        if self.__win is not None:
+            self.__win.Free()
+            self.__win = None
+
+
+def parallel_compute(data, func, cores=None, lengthy_computation=False, func_args=None, func_kwargs=None, verbose=False,
+                     pool=None, shared_memory=False, backend='processes', grain_size=None, out=None):
     """
     Computes the provided function using multiple cores using the joblib library
 
@@ -99,8 +948,11 @@ def parallel_compute(data, func, cores=None, lengthy_computation=False, func_arg
         Function to map to data
     cores : uint, optional
         Number of logical cores to use to compute
-        Default - All cores - 1 (total cores <= 4) or - 2 (cores > 4) depending on number of cores. 
-        Ignored in the MPI context - each rank will execute serially
+        Default - All cores - 1 (total cores <= 4) or - 2 (cores > 4) depending on number of cores.
+        In the MPI context, each rank computes with its own workers. Default - the cores available to this rank are
+        shared among the ranks on its node as reported by the MPI launcher, or 1 if it does not. Use
+        :func:`~pyUSID.processing.comp_utils.recommend_cores_per_rank` to share them precisely. Workers never
+        communicate via MPI. See :func:`~pyUSID.processing.comp_utils.get_MPI`
     lengthy_computation : bool, optional
         Whether or not each computation is expected to take substantial time.
         Sometimes the time for adding more cores can outweigh the time per core
@@ -111,10 +963,41 @@ def parallel_compute(data, func, cores=None, lengthy_computation=False, func_arg
         keyword arguments to be passed onto function
     verbose : bool, optional. default = False
         Whether or not to print statements that aid in debugging
+    pool : :class:`~pyUSID.processing.comp_utils.WorkerPool`, optional
+        Active pool of workers to compute with instead of starting new workers. cores and lengthy_computation will be
+        ignored if a pool is provided
+    shared_memory : bool, optional
+        Whether or not to avoid sending each row of data to, and its results from, the workers. If True, data is
+        written once to a memory mapped file (in /dev/shm where available) and each worker is only sent a range of
+        rows. Workers write results straight into a preallocated memory mapped array whose shape and data type are
+        inferred from the results of the first row. The function must therefore return numbers or numpy arrays of
+        the same shape for every row. Useful when rows are large. Default - False
+    backend : str, optional
+        "processes" (default) or "threads". Threads share data and results with this process without copying or
+        serializing them but only compute in parallel if func releases the GIL, as most numpy and scipy functions
+        do. Ignored if a pool is provided. See :func:`~pyUSID.processing.comp_utils.check_backend`
+    grain_size : uint or str, optional
+        Number of consecutive rows that a worker computes per task. Larger tasks spend less time being dispatched to
+        workers relative to the time spent computing, which matters when each row is computed quickly, but leave
+        fewer tasks to balance the load among workers. Set to "auto" to compute the first few rows in this process to
+        time them and choose the grain size such that each task takes roughly
+        :data:`~pyUSID.processing.comp_utils.GRAIN_DURATION` seconds while leaving at least
+        :data:`~pyUSID.processing.comp_utils.GRAINS_PER_WORKER` tasks per worker. func then also runs in this
+        process, outside the workers, for those rows. See :func:`~pyUSID.processing.comp_utils.recommend_grain_size`.
+        Default - one row per task, or a few ranges of rows per worker if shared_memory is True
+    out : numpy.ndarray, optional
+        Preallocated array whose first axis is as large as that of data, such as one made via
+        :func:`~pyUSID.processing.comp_utils.allocate_results`. The results of row i are assigned to out[i], so the
+        data type may be complex or compound, in which case func should return tuples. Threads write straight into
+        out and each task of processes returns an array of its results, so no list of python objects is ever made.
+        Results of one row that do not fit out raise a ValueError. Default - results are returned as a list, or as
+        an array whose shape and data type are inferred from the results of the first row if shared_memory is True
+
     Returns
     -------
-    results : list
-        List of computational results
+    results : list or numpy.ndarray
+        List of computational results in the order of the rows. Array of results stacked along the first axis if
+        shared_memory is True. out if it was provided
     """
 
     if not callable(func):
@@ -133,26 +1016,48 @@ def parallel_compute(data, func, cores=None, lengthy_computation=False, func_arg
     else:
         if not isinstance(func_kwargs, dict):
             raise TypeError('Keyword arguments to the mapped function should be specified via a dictionary')
+    if not isinstance(shared_memory, bool):
+        raise TypeError('shared_memory should be a boolean value')
+    joblib_backend = check_backend(backend)
+    grain_size = check_grain_size(grain_size)
+    check_out(out, data.shape[0])
+    if pool is not None:
+        if not isinstance(pool, WorkerPool):
+            raise TypeError('pool should be a WorkerPool object')
+        if verbose:
+            print('Computing using the provided pool of {} workers'.format(pool.cores))
+        return pool.map(func, data, func_args=func_args, func_kwargs=func_kwargs, shared_memory=shared_memory,
+                        grain_size=grain_size, out=out)
 
     req_cores = cores
     MPI = get_MPI()
     if MPI is not None:
         rank = MPI.COMM_WORLD.Get_rank()
-        # Was unable to get the MPI + joblib framework to work. Did not compute anything at all. Just froze
-        cores = 1
+        # Workers leave MPI to the rank. Loky spawns fresh interpreters rather than forking this one
+        cores = _get_rank_cores(cores)
     else:
         rank = 0
-        cores = recommend_cpu_cores(data.shape[0],
-                                    requested_cores=cores,
-                                    lengthy_computation=lengthy_computation,
-                                    verbose=verbose)
+    cores = recommend_cpu_cores(data.shape[0],
+                                requested_cores=cores,
+                                lengthy_computation=lengthy_computation,
+                                verbose=verbose)
 
     if verbose:
-        print('Rank {} starting computing on {} cores (requested {} cores)'.format(rank, cores, req_cores))
+        print('Rank {} starting computing on {} cores (requested {} cores) using {}'.format(rank, cores, req_cores,
+                                                                                           backend))
 
-    if cores > 1:
-        values = [joblib.delayed(func)(x, *func_args, **func_kwargs) for x in data]
-        results = joblib.Parallel(n_jobs=cores)(values)
+    if shared_memory or (out is not None and backend == 'threads'):
+        if cores > 1:
+            with joblib.Parallel(n_jobs=cores, backend=joblib_backend) as parallel:
+                results = _map_shared(parallel, func, data, func_args, func_kwargs, cores, verbose=verbose,
+                                      threads=backend == 'threads', grain_size=grain_size, out=out)
+        else:
+            results = _map_shared(None, func, data, func_args, func_kwargs, 1, verbose=verbose, out=out)
+
+    elif cores > 1:
+        with joblib.Parallel(n_jobs=cores, backend=joblib_backend) as parallel:
+            results = _map_grains(parallel, func, data, func_args, func_kwargs, cores, grain_size=grain_size,
+                                  verbose=verbose, out=out)
 
         # Finished reading the entire data set
         print('Rank {} finished parallel computation'.format(rank))
@@ -162,31 +1067,670 @@ def parallel_compute(data, func, cores=None, lengthy_computation=False, func_arg
             print("Rank {} computing serially ...".format(rank))
         # List comprehension vs map vs for loop?
         # https://stackoverflow.com/questions/1247486/python-list-comprehension-vs-map
-        results = [func(vector, *func_args, **func_kwargs) for vector in data]
+        if out is not None:
+            results = out
+            _compute_rows_into(func, data, out, 0, data.shape[0], func_args, func_kwargs)
+        else:
+            results = [func(vector, *func_args, **func_kwargs) for vector in data]
 
     return results
 
 
-def get_available_memory():
+def parallel_compute_blocks(data, func, cores=None, func_args=None, func_kwargs=None, verbose=False, pool=None,
+                            backend='processes'):
+    """
+    Computes the provided vectorized function on sub-blocks of the data using multiple cores. Unlike
+    :func:`~pyUSID.processing.comp_utils.parallel_compute`, the function is called once per sub-block of rows
+    rather than once per row, which avoids the overhead of calling a python function for every row.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data to map function to. Sub-blocks will be made along the first axis of data
+    func : callable
+        Function that accepts a sub-block of data and returns an array whose first axis is of the same size as the
+        first axis of the sub-block
+    cores : uint, optional
+        Number of logical cores to use to compute. One sub-block will be made per core
+        Default - All cores - 1 (total cores <= 4) or - 2 (cores > 4) depending on number of cores.
+        In the MPI context, see :func:`~pyUSID.processing.comp_utils.parallel_compute`
+    func_args : list, optional
+        arguments to be passed to the function
+    func_kwargs : dict, optional
+        keyword arguments to be passed onto function
+    verbose : bool, optional. default = False
+        Whether or not to print statements that aid in debugging
+    pool : :class:`~pyUSID.processing.comp_utils.WorkerPool`, optional
+        Active pool of workers to compute with instead of starting new workers. cores will be ignored if a pool is
+        provided
+    backend : str, optional
+        "processes" (default) or "threads". Ignored if a pool is provided.
+        See :func:`~pyUSID.processing.comp_utils.check_backend`
+
+    Returns
+    -------
+    results : numpy.ndarray
+        Results from all sub-blocks stacked along the first axis
+    """
+    if not callable(func):
+        raise TypeError('Function argument is not callable')
+    if not isinstance(data, np.ndarray):
+        raise TypeError('data must be a numpy array')
+    if func_args is None:
+        func_args = list()
+    else:
+        if isinstance(func_args, tuple):
+            func_args = list(func_args)
+        if not isinstance(func_args, list):
+            raise TypeError('Arguments to the mapped function should be specified as a list')
+    if func_kwargs is None:
+        func_kwargs = dict()
+    else:
+        if not isinstance(func_kwargs, dict):
+            raise TypeError('Keyword arguments to the mapped function should be specified via a dictionary')
+    joblib_backend = check_backend(backend)
+
+    if pool is not None:
+        if not isinstance(pool, WorkerPool):
+            raise TypeError('pool should be a WorkerPool object')
+        cores = pool.cores
+    else:
+        if get_MPI() is not None:
+            cores = _get_rank_cores(cores)
+        cores = recommend_cpu_cores(data.shape[0], requested_cores=cores, lengthy_computation=True,
+                                    verbose=verbose)
+    num_blocks = max(1, min(cores, data.shape[0]))
+    blocks = np.array_split(data, num_blocks, axis=0)
+
+    if verbose:
+        print('Computing {} sub-blocks of ~{} rows each on {} cores'.format(num_blocks, blocks[0].shape[0], cores))
+
+    if pool is not None:
+        results = pool.map(func, blocks, func_args=func_args, func_kwargs=func_kwargs)
+    elif num_blocks > 1:
+        parallel = joblib.Parallel(n_jobs=cores, backend=joblib_backend)
+        results = parallel(joblib.delayed(func)(block, *func_args, **func_kwargs) for block in blocks)
+    else:
+        results = [func(block, *func_args, **func_kwargs) for block in blocks]
+
+    for block, block_results in zip(blocks, results):
+        if np.shape(block_results)[:1] != block.shape[:1]:
+            raise ValueError('Results for a sub-block of {} rows had a first axis of size: {}'
+                             ''.format(block.shape[0], np.shape(block_results)[:1]))
+
+    return np.concatenate(results, axis=0)
+
+
+def _iter_blocks(data, block_size, start=0):
+    """
+    Reads the data one block of rows at a time
+
+    Parameters
+    ----------
+    data : numpy.ndarray, h5py.Dataset, dask.array.core.Array or iterable
+        Data to read. Iterables are expected to yield blocks of rows and are passed on as they are
+    block_size : uint
+        Number of rows per block. Ignored for iterables
+    start : uint, optional
+        Row to start reading from. Ignored for iterables
+
+    Returns
+    -------
+    iterable : :class:`generator`
+        Yields the index of the first row and the rows of each block as a numpy array
+    """
+    if isinstance(data, (np.ndarray, h5py.Dataset, da.core.Array)):
+        for offset in range(start, data.shape[0], block_size):
+            block = data[offset: min(data.shape[0], offset + block_size)]
+            if isinstance(block, da.core.Array):
+                block = block.compute()
+            yield offset, np.asarray(block)
+        return
+    offset = 0
+    for block in data:
+        block = np.asarray(block)
+        yield offset, block
+        offset += block.shape[0]
+
+
+def imap_compute(data, func, cores=None, block_size='auto', max_blocks=None, ordered=True, func_args=None,
+                 func_kwargs=None, verbose=False, backend='processes'):
+    """
+    Lazily maps the provided function to the rows of data that need not fit in memory, such as large HDF5 datasets.
+    Unlike :func:`~pyUSID.processing.comp_utils.parallel_compute`, results are yielded as soon as they are available
+    rather than returned as a list. Blocks of rows are read only when a worker is about to need them so that at most
+    max_blocks blocks (and their results) are held in memory at any given time.
+
+    Examples
+    --------
+    >>> for index, result in imap_compute(h5_main, func, cores=4, ordered=False):
+    >>>     h5_results[index] = result
+
+    Parameters
+    ----------
+    data : numpy.ndarray, h5py.Dataset, USIDataset, dask.array.core.Array or iterable
+        Data to map function to. Function will be mapped to the first axis of data. Other iterables, such as
+        generators, should yield 2D blocks of rows
+    func : callable
+        Function to map to each row
+    cores : uint, optional
+        Number of logical cores to use to compute.
+        Default - All cores - 1 (total cores <= 4) or - 2 (cores > 4) depending on number of cores.
+        In the MPI context, see :func:`~pyUSID.processing.comp_utils.parallel_compute`
+    block_size : uint or str, optional
+        Number of rows per block that is read and sent to a worker. Ignored for iterables of blocks.
+        Default - "auto" - the first few rows are computed in this process to time them and the size is chosen as in
+        :func:`~pyUSID.processing.comp_utils.recommend_grain_size`, limited such that max_blocks blocks occupy no
+        more than a quarter of the available memory
+    max_blocks : uint, optional
+        Maximum number of blocks being read, computed, or waiting to be yielded at any given time.
+        Default - twice the number of cores
+    ordered : bool, optional
+        Whether or not to yield results in the order of the rows. Otherwise, results of each block are yielded as
+        soon as the block has been computed along with the index of the row. Default - True
+    func_args : list, optional
+        arguments to be passed to the function
+    func_kwargs : dict, optional
+        keyword arguments to be passed onto function
+    verbose : bool, optional. default = False
+        Whether or not to print statements that aid in debugging
+    backend : str, optional
+        "processes" (default) or "threads". See :func:`~pyUSID.processing.comp_utils.check_backend`
+
+    Returns
+    -------
+    iterable : :class:`generator`
+        Yields the result of each row if ordered is True. Otherwise, yields tuples of the index of the row and its
+        result
+    """
+    if not callable(func):
+        raise TypeError('Function argument is not callable')
+    sliceable = isinstance(data, (np.ndarray, h5py.Dataset, da.core.Array))
+    if not sliceable and not hasattr(data, '__iter__'):
+        raise TypeError('data should be a numpy array, HDF5 dataset, dask array, or an iterable of blocks of rows')
+    if func_args is None:
+        func_args = list()
+    else:
+        if isinstance(func_args, tuple):
+            func_args = list(func_args)
+        if not isinstance(func_args, list):
+            raise TypeError('Arguments to the mapped function should be specified as a list')
+    if func_kwargs is None:
+        func_kwargs = dict()
+    else:
+        if not isinstance(func_kwargs, dict):
+            raise TypeError('Keyword arguments to the mapped function should be specified via a dictionary')
+    if isinstance(block_size, (str, unicode)):
+        if block_size != 'auto':
+            raise ValueError('block_size should either be "auto" or a positive integer')
+    elif not isinstance(block_size, int) or isinstance(block_size, bool):
+        raise TypeError('block_size should either be "auto" or a positive integer')
+    elif block_size < 1:
+        raise ValueError('block_size should either be "auto" or a positive integer')
+    if max_blocks is not None:
+        if not isinstance(max_blocks, int) or isinstance(max_blocks, bool):
+            raise TypeError('max_blocks should be a positive integer')
+        if max_blocks < 1:
+            raise ValueError('max_blocks should be a positive integer')
+    if not isinstance(ordered, bool):
+        raise TypeError('ordered should be a boolean value')
+    _ = check_backend(backend)
+    # Validate everything before the generator starts so that errors are raised when this function is called
+    return _imap_compute(data, func, cores, block_size, max_blocks, ordered, func_args, func_kwargs, verbose,
+                         backend)
+
+
+def _imap_compute(data, func, cores, block_size, max_blocks, ordered, func_args, func_kwargs, verbose, backend):
+    """
+    Generator behind :func:`~pyUSID.processing.comp_utils.imap_compute` that expects validated arguments
+    """
+    sliceable = isinstance(data, (np.ndarray, h5py.Dataset, da.core.Array))
+    if get_MPI() is not None:
+        cores = _get_rank_cores(cores)
+    cores = recommend_cpu_cores(data.shape[0] if sliceable else 2 ** 31 - 1, requested_cores=cores,
+                                verbose=verbose)
+    if max_blocks is None:
+        max_blocks = 2 * cores
+
+    start = 0
+    if sliceable and block_size == 'auto':
+        head, time_per_row = _time_first_rows(func, next(_iter_blocks(data, 8))[1], func_args, func_kwargs)
+        block_size = recommend_grain_size(time_per_row, data.shape[0] - len(head), cores)
+        row_bytes = int(np.prod(data.shape[1:])) * data.dtype.itemsize
+        block_size = max(1, min(block_size, int(get_available_memory() // (4 * max_blocks * max(1, row_bytes)))))
+        for index, result in enumerate(head):
+            yield result if ordered else (index, result)
+        start = len(head)
+    if verbose:
+        print('Computing blocks of {} rows with up to {} blocks in flight on {} cores'
+              '.'.format(block_size if sliceable else 'any number of', max_blocks, cores))
+
+    blocks = _iter_blocks(data, block_size, start=start)
+    if cores == 1:
+        for offset, block in blocks:
+            for index, row in enumerate(block):
+                result = func(row, *func_args, **func_kwargs)
+                yield result if ordered else (offset + index, result)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    if backend == 'threads':
+        executor = ThreadPoolExecutor(max_workers=cores)
+    else:
+        from joblib.externals.loky import get_reusable_executor
+        # Reusing the executor keeps the workers alive across calls, just as joblib does
+        executor = get_reusable_executor(max_workers=cores)
+    pending = deque()
+    try:
+        while True:
+            # Only read the next block when there is room for it
+            while len(pending) < max_blocks:
+                try:
+                    offset, block = next(blocks)
+                except StopIteration:
+                    break
+                pending.append((offset, executor.submit(_compute_rows, func, block, func_args, func_kwargs)))
+            if len(pending) == 0:
+                return
+            if ordered:
+                offset, future = pending.popleft()
+            else:
+                _ = wait([item[1] for item in pending], return_when=FIRST_COMPLETED)
+                offset, future = [item for item in pending if item[1].done()][0]
+                pending.remove((offset, future))
+            for index, result in enumerate(future.result()):
+                yield result if ordered else (offset + index, result)
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if backend == 'threads':
+            executor.shutdown(wait=True)
+
+
+DASK_THREAD_SCHEDULERS = ('threads', 'threading', 'synchronous', 'single-threaded', 'sync')
+"""
+Dask schedulers that execute tasks within this process. HDF5 datasets can be read lazily by such schedulers
+"""
+
+
+def check_dask_scheduler(scheduler):
     """
-    Returns the available memory
+    Checks whether the provided object can be used as a dask scheduler
+
+    Parameters
+    ----------
+    scheduler : str or object
+        Name of a local dask scheduler - "threads", "processes", "synchronous", etc. or a distributed Client object
+
+    Returns
+    -------
+    in_process : bool
+        Whether or not the scheduler executes tasks within this process
+    """
+    if isinstance(scheduler, (str, unicode)):
+        if scheduler in DASK_THREAD_SCHEDULERS:
+            return True
+        if scheduler in ('processes', 'multiprocessing'):
+            return False
+        raise ValueError('scheduler should be one of: {}, "processes", or a distributed Client object'
+                         '.'.format(DASK_THREAD_SCHEDULERS))
+    if not hasattr(scheduler, 'get'):
+        raise TypeError('scheduler should be a string or a distributed Client object')
+    return False
+
+
+def _map_rows(block, func, func_args, func_kwargs):
+    """
+    Calls the function on each row of the block and packs the list of results into a single element object array
+    """
+    results = np.empty(1, dtype=object)
+    results[0] = [func(row, *func_args, **func_kwargs) for row in block]
+    return results
+
+
+def _map_block(block, func, func_args, func_kwargs):
+    """
+    Calls the vectorized function on the whole block and packs the results into a single element object array
+    """
+    results = np.empty(1, dtype=object)
+    results[0] = func(block, *func_args, **func_kwargs)
+    if np.shape(results[0])[:1] != block.shape[:1]:
+        raise ValueError('Results for a sub-block of {} rows had a first axis of size: {}'
+                         ''.format(block.shape[0], np.shape(results[0])[:1]))
+    return results
+
+
+def dask_compute(data, func, scheduler='threads', cores=None, block_function=False, func_args=None,
+                 func_kwargs=None, verbose=False):
+    """
+    Computes the provided function on the rows of the data via dask. Sub-blocks of rows are mapped using
+    :func:`dask.array.map_blocks`, so the same function can run on the local threaded or multiprocessing schedulers
+    or on a distributed cluster.
+
+    Parameters
+    ----------
+    data : :class:`numpy.ndarray` or :class:`dask.array.core.Array`
+        Data to map function to. Sub-blocks will be made along the first axis of data. A dask array (for example one
+        from :func:`~pyUSID.io.dtype_utils.lazy_load_array`) is only read when the blocks are computed
+    func : callable
+        Function to map to each row of data, or to each sub-block of data if block_function is True
+    scheduler : str or object, optional
+        Name of a local dask scheduler - "threads" (default), "processes", "synchronous" or a distributed Client
+    cores : uint, optional
+        Number of sub-blocks to make and number of workers for local schedulers
+        Default - All cores - 1 (total cores <= 4) or - 2 (cores > 4) depending on number of cores.
+    block_function : bool, optional
+        Whether func accepts sub-blocks of rows and returns an array whose first axis is of the same size as the
+        first axis of the sub-block. Default - False - func is called once per row
+    func_args : list, optional
+        arguments to be passed to the function
+    func_kwargs : dict, optional
+        keyword arguments to be passed onto function
+    verbose : bool, optional. default = False
+        Whether or not to print statements that aid in debugging
+
+    Returns
+    -------
+    results : list or numpy.ndarray
+        List of results from each row or, for block functions, results from all sub-blocks stacked along the first
+        axis
+    """
+    if not callable(func):
+        raise TypeError('Function argument is not callable')
+    if not isinstance(data, (np.ndarray, da.core.Array)):
+        raise TypeError('data must be a numpy or dask array')
+    if not isinstance(block_function, bool):
+        raise TypeError('block_function should be a boolean value')
+    local_scheduler = isinstance(scheduler, (str, unicode))
+    check_dask_scheduler(scheduler)
+    if func_args is None:
+        func_args = list()
+    else:
+        if isinstance(func_args, tuple):
+            func_args = list(func_args)
+        if not isinstance(func_args, list):
+            raise TypeError('Arguments to the mapped function should be specified as a list')
+    if func_kwargs is None:
+        func_kwargs = dict()
+    else:
+        if not isinstance(func_kwargs, dict):
+            raise TypeError('Keyword arguments to the mapped function should be specified via a dictionary')
+
+    cores = recommend_cpu_cores(data.shape[0], requested_cores=cores, lengthy_computation=True, verbose=verbose)
+    rows_per_block = max(1, int(np.ceil(data.shape[0] / max(1, cores))))
+    if isinstance(data, da.core.Array):
+        data = data.rechunk({0: rows_per_block, 1: -1})
+    else:
+        data = da.from_array(data, chunks=(rows_per_block, data.shape[1]))
+    num_blocks = len(data.chunks[0])
+
+    if verbose:
+        print('Computing {} sub-blocks of ~{} rows each via dask using the {} scheduler'
+              '.'.format(num_blocks, rows_per_block, scheduler if local_scheduler else 'distributed'))
+
+    mapper = _map_block if block_function else _map_rows
+    results = data.map_blocks(mapper, func, func_args, func_kwargs, drop_axis=1, chunks=((1,) * num_blocks,),
+                              dtype=object, meta=np.empty((0,), dtype=object))
+    if local_scheduler:
+        results = results.compute(scheduler=scheduler, num_workers=cores)
+    else:
+        results = results.compute(scheduler=scheduler)
+
+    if block_function:
+        return np.concatenate(list(results), axis=0)
+    return [item for block_results in results for item in block_results]
+
+
+_CGROUP_ROOT = '/sys/fs/cgroup'
+# cgroup v1 reports a limit close to 2 ** 63 when no memory limit has been set
+_CGROUP_NO_LIMIT = 2 ** 60
+
+
+def _read_cgroup_file(path):
+    """
+    Reads the contents of a file within the cgroup file system
+
+    Parameters
+    ----------
+    path : str
+        Path to the file
+
+    Returns
+    -------
+    contents : str
+        Contents of the file without surrounding whitespace. None if the file could not be read
+    """
+    try:
+        with open(path) as file_handle:
+            return file_handle.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _get_cgroup_dirs(controller, root=None, proc_cgroup='/proc/self/cgroup'):
+    """
+    Lists the directories of the cgroups that this process belongs to for the provided controller, starting with
+    the cgroup of this process and ending with the root of the hierarchy. Limits set on any of these cgroups apply
+    to this process.
+
+    Parameters
+    ----------
+    controller : str
+        Name of the cgroup v1 controller such as 'cpu' or 'memory'
+    root : str, optional
+        Mount point of the cgroup file system. Default - /sys/fs/cgroup
+    proc_cgroup : str, optional
+        File listing the cgroups of this process. Default - /proc/self/cgroup
+
+    Returns
+    -------
+    version : uint
+        1 or 2 for cgroup v1 or v2 respectively. None if no cgroup hierarchy was found
+    dirs : list of str
+        Directories of the cgroups
+    """
+    if root is None:
+        root = _CGROUP_ROOT
+    if not os.path.isdir(root):
+        return None, []
+
+    v1_path = None
+    v2_path = None
+    contents = _read_cgroup_file(proc_cgroup)
+    for line in (contents.splitlines() if contents is not None else []):
+        fields = line.split(':', 2)
+        if len(fields) != 3:
+            continue
+        if fields[0] == '0' and fields[1] == '':
+            v2_path = fields[2]
+        elif controller in fields[1].split(','):
+            v1_path = fields[2]
+
+    if os.path.isdir(os.path.join(root, controller)):
+        version, mount = 1, os.path.join(root, controller)
+        cgroup_path = v1_path
+    elif os.path.isfile(os.path.join(root, 'cgroup.controllers')):
+        version, mount = 2, root
+        cgroup_path = v2_path
+    else:
+        return None, []
+
+    dirs = []
+    # Within containers, the path of this cgroup may not be visible in the mounted hierarchy
+    parts = [item for item in (cgroup_path or '').split('/') if len(item) > 0]
+    for ind in range(len(parts), -1, -1):
+        folder = os.path.join(mount, *parts[:ind])
+        if os.path.isdir(folder):
+            dirs.append(folder)
+    return version, dirs
+
+
+def _get_cgroup_cpu_limit(root=None, proc_cgroup='/proc/self/cgroup'):
+    """
+    Returns the (fractional) number of CPU cores that this process may use as per the CPU quota of its cgroups
+
+    Parameters
+    ----------
+    root : str, optional
+        Mount point of the cgroup file system. Default - /sys/fs/cgroup
+    proc_cgroup : str, optional
+        File listing the cgroups of this process. Default - /proc/self/cgroup
+
+    Returns
+    -------
+    cores : float
+        Number of cores as per the quota. None if no quota was set
+    source : str
+        File in which the quota was set. None if no quota was set
+    """
+    version, dirs = _get_cgroup_dirs('cpu', root=root, proc_cgroup=proc_cgroup)
+    cores = None
+    source = None
+    for folder in dirs:
+        if version == 2:
+            path = os.path.join(folder, 'cpu.max')
+            fields = (_read_cgroup_file(path) or 'max').split()
+            quota = fields[0]
+            period = fields[1] if len(fields) > 1 else '100000'
+            if quota == 'max':
+                continue
+        else:
+            path = os.path.join(folder, 'cpu.cfs_quota_us')
+            quota = _read_cgroup_file(path)
+            period = _read_cgroup_file(os.path.join(folder, 'cpu.cfs_period_us'))
+            if quota is None or period is None or int(quota) < 0:
+                continue
+        quota = int(quota) / int(period)
+        if cores is None or quota < cores:
+            cores = quota
+            source = path
+    return cores, source
+
+
+def _get_cgroup_memory(root=None, proc_cgroup='/proc/self/cgroup'):
+    """
+    Returns the memory that this process may still use as per the memory limits of its cgroups. Page cache that
+    can be reclaimed is not counted towards the memory used.
+
+    Parameters
+    ----------
+    root : str, optional
+        Mount point of the cgroup file system. Default - /sys/fs/cgroup
+    proc_cgroup : str, optional
+        File listing the cgroups of this process. Default - /proc/self/cgroup
+
+    Returns
+    -------
+    mem : unsigned int
+        Memory in bytes. None if no memory limit was set
+    source : str
+        File in which the limit was set. None if no limit was set
+    """
+    version, dirs = _get_cgroup_dirs('memory', root=root, proc_cgroup=proc_cgroup)
+    if version == 2:
+        limit_file, usage_file, inactive_key = 'memory.max', 'memory.current', 'inactive_file'
+    else:
+        limit_file, usage_file, inactive_key = 'memory.limit_in_bytes', 'memory.usage_in_bytes', 'total_inactive_file'
+    mem = None
+    source = None
+    for folder in dirs:
+        path = os.path.join(folder, limit_file)
+        limit = _read_cgroup_file(path)
+        usage = _read_cgroup_file(os.path.join(folder, usage_file))
+        if limit is None or usage is None or limit == 'max' or int(limit) >= _CGROUP_NO_LIMIT:
+            continue
+        used = int(usage)
+        stats = _read_cgroup_file(os.path.join(folder, 'memory.stat')) or ''
+        for line in stats.splitlines():
+            fields = line.split()
+            if len(fields) == 2 and fields[0] == inactive_key:
+                used -= int(fields[1])
+        avail = max(0, int(limit) - max(0, used))
+        if mem is None or avail < mem:
+            mem = avail
+            source = path
+    return mem, source
+
+
+def get_available_cores(return_source=False):
+    """
+    Returns the number of logical CPU cores that this process may use. Besides the number of cores in the machine,
+    the set of cores that this process is pinned to (e.g. - via a cpuset in SLURM) and the CPU quota of the cgroup
+    (e.g. - container CPU limits in Kubernetes / Docker) are taken into account.
+
+    Parameters
+    ----------
+    return_source : bool, optional. Default = False
+        Whether or not to also return the source of the limit
+
+    Returns
+    -------
+    cores : unsigned int
+        Number of logical cores
+    source : str
+        Source of the limit - 'cpu_count', 'sched_getaffinity', or the cgroup file containing the quota.
+        Only returned if return_source is True
+    """
+    if not isinstance(return_source, bool):
+        raise TypeError('return_source should be a boolean value')
+    cores = cpu_count()
+    source = 'cpu_count'
+
+    if hasattr(os, 'sched_getaffinity'):
+        pinned_cores = len(os.sched_getaffinity(0))
+        if 0 < pinned_cores < cores:
+            cores = pinned_cores
+            source = 'sched_getaffinity'
+
+    quota, quota_source = _get_cgroup_cpu_limit()
+    if quota is not None:
+        # Fractional quotas still allow a core to be used part of the time
+        quota = max(1, int(np.ceil(quota)))
+        if quota < cores:
+            cores = quota
+            source = quota_source
+
+    if return_source:
+        return cores, source
+    return cores
+
+
+def get_available_memory(return_source=False):
+    """
+    Returns the available memory. If this process belongs to a cgroup with a memory limit (e.g. - containers in
+    Kubernetes / Docker or jobs in SLURM), the memory remaining within this limit is returned if it is smaller
+    than the memory available in the machine.
 
     Chris Smith -- csmith55@utk.edu
 
     Parameters
     ----------
+    return_source : bool, optional. Default = False
+        Whether or not to also return the source of the limit
 
     Returns
     -------
     mem : unsigned int
         Memory in bytes
+    source : str
+        Source of the limit - 'virtual_memory' or the cgroup file containing the limit.
+        Only returned if return_source is True
     """
-    import sys
+    if not isinstance(return_source, bool):
+        raise TypeError('return_source should be a boolean value')
     mem = vm().available
+    source = 'virtual_memory'
+
+    cgroup_mem, cgroup_source = _get_cgroup_memory()
+    if cgroup_mem is not None and cgroup_mem < mem:
+        mem = cgroup_mem
+        source = cgroup_source
 
     if sys.maxsize <= 2 ** 32:
         mem = min([mem, sys.maxsize])
 
+    if return_source:
+        return mem, source
     return mem
 
 
@@ -216,7 +1760,7 @@ def recommend_cpu_cores(num_jobs, requested_cores=None, lengthy_computation=Fals
         Number of logical cores to use for computation
     """
 
-    logical_cores = cpu_count()
+    logical_cores = get_available_cores()
 
     if min_free_cores is not None:
         if not isinstance(min_free_cores, int):
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+:class:`~pyUSID.processing.pipeline.ProcessPipeline` - Chains several Process objects such that the results of one
+stage are handed to the next stage batch-by-batch in memory
+
+Created on Sun Oct 18 14:20:37 2026
+"""
+
+from __future__ import division, print_function, absolute_import
+import sys
+import time as tm
+import h5py
+import numpy as np
+
+from .process import Process
+from .comp_utils import get_available_memory, WorkerPool
+from .status_utils import STATUS_COMPLETED
+from ..io.io_utils import format_time, format_size
+
+if sys.version_info.major == 3:
+    unicode = str
+
+__all__ = ['ProcessPipeline']
+
+
+class _CapturedDataset(object):
+    """
+    Stands in for a results dataset of a stage in the pipeline. Values written to the positions in the current batch
+    are retained in memory so that they can be handed to the next stage, and are written to the HDF5 dataset only if
+    the dataset is persistent. All other attributes are those of the HDF5 dataset.
+    """
+
+    def __init__(self, h5_dset, persistent):
+        """
+        Parameters
+        ----------
+        h5_dset : :class:`h5py.Dataset`
+            HDF5 dataset that this object stands in for
+        persistent : bool
+            Whether or not values should also be written to the HDF5 dataset
+        """
+        self.h5_dset = h5_dset
+        self.persistent = persistent
+        self.__pixels = None
+        self.__buffer = None
+
+    def __getattr__(self, item):
+        return getattr(self.h5_dset, item)
+
+    def __getitem__(self, item):
+        return self.h5_dset[item]
+
+    def start_batch(self, pixels):
+        """
+        Discards values from the previous batch and prepares to capture values for the provided positions
+
+        Parameters
+        ----------
+        pixels : :class:`numpy.ndarray`
+            1D array of sorted unsigned integers denoting the positions in this batch
+        """
+        self.__pixels = pixels
+        self.__buffer = np.zeros((len(pixels),) + self.h5_dset.shape[1:], dtype=self.h5_dset.dtype)
+
+    def get_batch(self):
+        """
+        Returns the values captured for the positions in the current batch
+
+        Returns
+        -------
+        values : :class:`numpy.ndarray`
+            Values for the current batch in the order of the positions
+        """
+        return self.__buffer
+
+    def __get_rows(self, positions):
+        """
+        Translates positions in the dataset to rows of the buffer holding the current batch
+        """
+        if isinstance(positions, slice):
+            positions = np.arange(*positions.indices(self.h5_dset.shape[0]))
+        positions = np.atleast_1d(np.asarray(positions))
+        if positions.dtype == bool:
+            positions = np.where(positions)[0]
+        rows = np.minimum(np.searchsorted(self.__pixels, positions), len(self.__pixels) - 1)
+        if np.any(self.__pixels[rows] != positions):
+            raise ValueError('Results can only be written to the positions in the current batch of dataset: {}'
+                             '.'.format(self.h5_dset.name))
+        return rows
+
+    def __setitem__(self, key, value):
+        if self.__buffer is None:
+            raise ValueError('No batch has been started for dataset: {}'.format(self.h5_dset.name))
+        if not isinstance(key, tuple):
+            key = (key,)
+        self.__buffer[(self.__get_rows(key[0]),) + key[1:]] = value
+        if self.persistent:
+            self.h5_dset[key] = value
+
+
+class _Stage(object):
+    """
+    Book-keeping for a single Process in the pipeline
+    """
+
+    def __init__(self, process, h5_results_grp, complete):
+        """
+        Parameters
+        ----------
+        process : :class:`~pyUSID.processing.process.Process`
+            Process object for this stage
+        h5_results_grp : :class:`h5py.Group`
+            Group holding the results of this stage
+        complete : bool
+            Whether or not results for all positions are already available from a prior computation
+        """
+        self.process = process
+        self.h5_results_grp = h5_results_grp
+        self.complete = complete
+        # Proxies for the results datasets held by the process, keyed by the name of the HDF5 dataset:
+        self.captured = dict()
+
+    @property
+    def tracked(self):
+        """
+        Whether or not all results of this stage are written to the file, in which case positions can be marked as
+        completed and skipped when resuming
+        """
+        return all([proxy.persistent for proxy in self.captured.values()])
+
+
+class ProcessPipeline(object):
+    """
+    Chains several :class:`~pyUSID.processing.process.Process` objects (stages), such as filter -> guess -> fit,
+    where each stage works on the results of the previous stage. Each batch of positions flows through all stages in
+    memory, so results of intermediate stages are not written to and read back from the HDF5 file unless they are
+    asked to be kept.
+
+    Stages are created by factories that are called with the HDF5 group holding the results of the previous stage (or
+    the source dataset for the first stage) since the results of a stage only exist once the stage has been set up.
+    Stages should hold references to their results datasets as attributes, which is how results are normally written
+    in :meth:`~pyUSID.processing.process.Process._write_results_chunk`. Results datasets that are not persistent are
+    replaced by stand-ins that only retain the current batch in memory.
+
+    Each stage keeps its own completed_positions dataset. Only stages whose results are all persistent mark positions
+    as completed. When resuming, positions that have not been completed by any such stage are recomputed by all stages.
+
+    Stages share a single pool of workers of the backend ("processes" or "threads") that they were created with, so
+    all stages not computing via dask should use the same backend. Stages computing via dask use their own workers.
+
+    Examples
+    --------
+    >>> pipeline = ProcessPipeline(h5_raw, [lambda h5_main: Filter(h5_main),
+    >>>                                     lambda h5_grp: Guess(h5_grp['Filtered_Data']),
+    >>>                                     lambda h5_grp: Fit(h5_grp['Guess'])])
+    >>> h5_filter_grp, h5_guess_grp, h5_fit_grp = pipeline.compute()
+    """
+
+    def __init__(self, h5_main, stages, persistent=None, max_mem_mb=4*1024, cores=None, verbose=False):
+        """
+        Parameters
+        ----------
+        h5_main : :class:`~pyUSID.io.usi_data.USIDataset`
+            The USID main HDF5 dataset that the first stage will work on
+        stages : list of callables
+            Each callable accepts a single argument and returns a Process object. The first callable is provided with
+            h5_main and the others with the HDF5 group containing the results of the previous stage
+        persistent : list of str, optional
+            Names of the results datasets of the intermediate stages that should be written to the file.
+            Results of the final stage are always written. By default, no results of intermediate stages are written
+        max_mem_mb : uint, optional
+            How much memory to use for all stages together. Default 4096 Mb
+        cores : uint, optional
+            How many workers the stages share for the computation. Default: as many as the first stage that does not
+            compute via dask was created with
+        verbose : bool, optional, default = False
+            Whether or not to print debugging statements
+        """
+        if not isinstance(h5_main, h5py.Dataset):
+            raise TypeError('h5_main should be a h5py.Dataset object')
+        if not isinstance(stages, (list, tuple)) or len(stages) == 0:
+            raise TypeError('stages should be a non-empty list of callables')
+        if not all([callable(item) for item in stages]):
+            raise TypeError('stages should be a non-empty list of callables')
+        if persistent is None:
+            persistent = []
+        if not isinstance(persistent, (list, tuple)) or \
+                not all([isinstance(item, (str, unicode)) for item in persistent]):
+            raise TypeError('persistent should be a list of names of datasets')
+        if not isinstance(max_mem_mb, int) or max_mem_mb <= 0:
+            raise TypeError('max_mem_mb should be a positive integer')
+        self.h5_main = h5_main
+        self.__factories = list(stages)
+        self.persistent = list(persistent)
+        self.max_mem_mb = max_mem_mb
+        self.cores = cores
+        self.verbose = verbose
+        self.processes = []
+        self.__stages = []
+
+    def __is_persistent(self, h5_dset):
+        """
+        Returns whether or not values written to the provided results dataset of an intermediate stage should be
+        written to the file
+        """
+        return h5_dset.name.split('/')[-1] in self.persistent
+
+    def __set_up_stages(self, override):
+        """
+        Creates the Process objects and their results groups one after another
+        """
+        self.processes = []
+        self.__stages = []
+        source = self.h5_main
+        for index, factory in enumerate(self.__factories):
+            process = factory(source)
+            if not isinstance(process, Process):
+                raise TypeError('Stage {} was not a Process object'.format(index))
+            if process.mpi_size > 1:
+                raise NotImplementedError('ProcessPipeline does not yet support computing via MPI')
+            h5_duplicate_grp = process._prepare_results(override=override)
+            if h5_duplicate_grp is None:
+                stage = _Stage(process, process.h5_results_grp, False)
+            else:
+                stage = _Stage(process, h5_duplicate_grp, True)
+            if not stage.complete and index < len(self.__factories) - 1:
+                # Results of intermediate stages are captured so that they can be handed to the next stage
+                for name, value in list(vars(process).items()):
+                    if not isinstance(value, h5py.Dataset) or value.parent.name != stage.h5_results_grp.name:
+                        continue
+                    if value.name.split('/')[-1] == process._status_dset_name:
+                        continue
+                    if value.name not in stage.captured:
+                        stage.captured[value.name] = _CapturedDataset(value, self.__is_persistent(value))
+                    setattr(process, name, stage.captured[value.name])
+            if self.verbose:
+                print('Stage {} - {} results in: {}. Results held in memory: {}'
+                      '.'.format(index, 'reusing complete' if stage.complete else 'computing',
+                                 stage.h5_results_grp.name,
+                                 [proxy.name for proxy in stage.captured.values() if not proxy.persistent]))
+            self.processes.append(process)
+            self.__stages.append(stage)
+            source = stage.h5_results_grp
+
+        for index, (stage, next_stage) in enumerate(zip(self.__stages[:-1], self.__stages[1:])):
+            if stage.complete or next_stage.complete:
+                continue
+            source_name = next_stage.process.h5_main.name
+            if source_name in stage.captured:
+                continue
+            if source_name.split('/')[-1] not in self.persistent:
+                raise ValueError('Stage {} reads {}, which is neither persistent nor held as an attribute of stage {}'
+                                 '.'.format(index + 1, source_name, index))
+
+    def __get_pending(self):
+        """
+        Returns the positions that need to be computed by the pipeline
+        """
+        pending = np.zeros(0, dtype=np.int64)
+        for stage in self.__stages:
+            if stage.complete or not stage.tracked:
+                continue
+            pending = np.union1d(pending, np.asarray(stage.process._status_tracker.get_pending()))
+        return pending.astype(np.int64)
+
+    def __make_pool(self):
+        """
+        Returns a pool of workers shared by all stages being computed, of the backend that these stages were asked to
+        compute with. Stages computing via dask use their own workers. None if all stages compute via dask
+        """
+        active = [stage.process for stage in self.__stages if not stage.complete]
+        pooled = [process for process in active if process._dask_scheduler is None]
+        if len(pooled) == 0:
+            return None
+        backends = set([process._backend for process in pooled])
+        if len(backends) > 1:
+            raise ValueError('Stages share a pool of workers and should therefore compute with the same backend. '
+                             'Stages asked for: {}'.format(sorted(backends)))
+        cores = pooled[0]._cores if self.cores is None else self.cores
+        return WorkerPool(cores=cores, backend=backends.pop())
+
+    def __get_batch_size(self, cores):
+        """
+        Returns the number of positions per batch such that the batches of all stages together fit in the memory
+
+        Parameters
+        ----------
+        cores : uint
+            Number of workers computing each batch
+        """
+        active = [stage.process for stage in self.__stages if not stage.complete]
+        bytes_per_pos = sum([process._get_bytes_per_pos() for process in active])
+        max_mem_bytes = min(get_available_memory(), self.max_mem_mb * 1024 ** 2)
+        pos_per_batch = max(1, int(np.floor(max_mem_bytes / cores / bytes_per_pos)))
+        if self.verbose:
+            print('Each position requires {} across the {} stages being computed. Computing up to {} positions per '
+                  'batch'.format(format_size(bytes_per_pos), len(active), pos_per_batch))
+        return pos_per_batch
+
+    def compute(self, override=False, *args, **kwargs):
+        """
+        Computes all stages batch by batch
+
+        Parameters
+        ----------
+        override : bool, optional. default = False
+            By default, complete results of a stage are reused and partial results are resumed. Set to True to force
+            fresh computation of all stages
+        args : list
+            arguments to the mapped functions of all stages in the correct order
+        kwargs : dict
+            keyword arguments to the mapped functions of all stages
+
+        Returns
+        -------
+        h5_results_grps : list of :class:`h5py.Group`
+            Groups containing the results of each stage
+        """
+        self.__set_up_stages(override)
+        h5_groups = [stage.h5_results_grp for stage in self.__stages]
+        active = [stage for stage in self.__stages if not stage.complete]
+        if len(active) == 0:
+            print('Returned previously computed results of all stages')
+            return h5_groups
+
+        pending = self.__get_pending()
+        if len(pending) == 0:
+            return h5_groups
+        pool = self.__make_pool()
+        if pool is None:
+            pos_per_batch = self.__get_batch_size(active[0].process._cores if self.cores is None else self.cores)
+        else:
+            pos_per_batch = self.__get_batch_size(pool.cores)
+            pool.start()
+        for stage in active:
+            if stage.process._dask_scheduler is None:
+                stage.process._worker_pool = pool
+        try:
+            for start in range(0, len(pending), pos_per_batch):
+                t_start = tm.time()
+                pixels = pending[start: start + pos_per_batch]
+                data = active[0].process.h5_main[pixels, :]
+                for index, stage in enumerate(active):
+                    for proxy in stage.captured.values():
+                        proxy.start_batch(pixels)
+                    stage.process._process_batch(pixels, data, *args, **kwargs)
+                    if index < len(active) - 1:
+                        source_name = active[index + 1].process.h5_main.name
+                        if source_name in stage.captured:
+                            data = stage.captured[source_name].get_batch()
+                        else:
+                            data = active[index + 1].process.h5_main[pixels, :]
+
+                self.h5_main.file.flush()
+                for stage in active:
+                    if stage.tracked:
+                        stage.process._status_tracker.mark(pixels, STATUS_COMPLETED)
+                        stage.process._status_tracker.commit()
+
+                print('Computed {} of {} positions through {} stages. Last batch took {}'
+                      '.'.format(min(start + pos_per_batch, len(pending)), len(pending), len(active),
+                                 format_time(tm.time() - t_start)))
+        finally:
+            for stage in active:
+                stage.process._worker_pool = None
+            if pool is not None:
+                pool.shutdown()
+
+        self.h5_main.file.flush()
+        for stage in active:
+            if stage.tracked:
+                stage.process._complete_results()
+
+        print('Finished processing the entire dataset through all stages!')
+        return h5_groups
@@ -8,19 +8,40 @@ Created on 7/17/16 10:08 AM
 """
 
 from __future__ import division, print_function, absolute_import
+import sys
 import numpy as np
 import psutil
 import time as tm
+import threading
+from warnings import warn
 import h5py
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
 from numbers import Number
-from multiprocessing import cpu_count
 
-from .comp_utils import parallel_compute, get_MPI, group_ranks_by_socket, get_available_memory
-from ..io.hdf_utils import check_if_main, check_for_old, get_attributes
+from .comp_utils import get_MPI, group_ranks_by_socket, get_available_memory, get_available_cores, WorkerPool, \
+    SharedCounter, check_dask_scheduler, check_backend
+from . import comp_utils
+from .status_utils import CompletionTracker, values_to_runs, STATUS_PENDING, STATUS_COMPLETED, STATUS_FAILED, \
+    FAILURE_DTYPE
+from .trace_utils import Tracer, get_nbytes
+from ..io.hdf_utils import check_if_main, check_for_matching_attrs, get_attributes, get_attr, find_results_groups, \
+    hash_parms, find_indexed_results, find_unindexed_results, index_results_group
 from ..io.usi_data import USIDataset
-from ..io.dtype_utils import integers_to_slices
+from ..io.dtype_utils import lazy_load_array
 from ..io.io_utils import format_time, format_size
 
+if sys.version_info.major == 3:
+    unicode = str
+
 
 class Process(object):
     """
@@ -30,14 +51,19 @@ class Process(object):
     """
 
     def __init__(self, h5_main, cores=None, max_mem_mb=4*1024,
-                 mem_multiplier=1.0, verbose=False):
+                 mem_multiplier=1.0, verbose=False, prefetch=False, write_behind=0, pool=None, dask_scheduler=None,
+                 shared_memory=False, aggregate_io=False, backend='processes'):
         """
         Parameters
         ----------
         h5_main : :class:`~pyUSID.io.usi_data.USIDataset`
             The USID main HDF5 dataset over which the analysis will be performed.
         cores : uint, optional
-            How many cores to use for the computation. Default: all available cores - 2 if operating outside MPI context
+            How many cores to use for the computation. Default: all available cores - 2 if operating outside MPI context.
+            Via MPI, each rank computes with a pool of this many workers. Default: the cores that this rank is pinned to
+            and its share of the CPU quota, shared equally with the other ranks on the node pinned to the same cores.
+            See :func:`~pyUSID.processing.comp_utils.recommend_cores_per_rank`. Launch a few ranks per node, such as
+            one per socket, to compute with both MPI and workers
         max_mem_mb : uint, optional
             How much memory to use for the computation.  Default 1024 Mb
         mem_multiplier : float, optional. Default = 1
@@ -52,10 +78,76 @@ class Process(object):
             the multiplier will be 2 (1 for source, 1 for result)
         verbose : bool, Optional, default = False
             Whether or not to print debugging statements
+        prefetch : bool, Optional, default = False
+            Whether or not to read the next batch of positions from the source dataset in a background thread while
+            the current batch is being computed. Since two batches of the source dataset will be held in memory at
+            any given time, the number of positions per batch will be reduced accordingly. When computing via MPI,
+            prefetching is disabled unless MPI was initialized with MPI.THREAD_MULTIPLE
+        write_behind : uint, Optional, default = 0
+            Number of computed batches that may be held in memory while they are written to the HDF5 file by a
+            background thread. Results are written and flushed in the background while the next batch is being
+            computed. The number of positions per batch will be reduced to account for the results waiting to be
+            written. By default, results are written synchronously after each batch is computed. When computing via
+            MPI, results are written synchronously unless MPI was initialized with MPI.THREAD_MULTIPLE
+        pool : :class:`~pyUSID.processing.comp_utils.WorkerPool`, Optional
+            Pool of workers to use for computing. Provide the same pool to several Process objects to avoid starting
+            and stopping workers for each. This pool will be started if necessary but will not be shut down by this
+            object. By default, a pool is started at the beginning of compute() and shut down at the end of it.
+        dask_scheduler : str or object, Optional
+            Computes each batch via dask instead of the pool of workers. Use "threads", "processes", "synchronous" or
+            a distributed Client object. With "threads" or "synchronous" and without prefetching, the source dataset
+            is loaded lazily and read by the dask workers themselves. Otherwise, each batch is read by this process
+            and sent to the workers. Batches are still written to the file and marked as completed one at a time so
+            that computations can be resumed. By default, dask is not used
+        shared_memory : bool, Optional, default = False
+            Whether or not to share each batch with the workers via memory mapped files instead of sending every
+            position to the workers and every result back. Worthwhile when each position holds a large spectrum.
+            _map_function must then return numbers or numpy arrays of the same shape for every position. Results
+            are handed to _write_results_chunk() as a numpy array. See
+            :func:`~pyUSID.processing.comp_utils.parallel_compute`
+        aggregate_io : bool, Optional, default = False
+            Whether or not to only let one rank per socket (node) read from and write to the file when computing via
+            MPI. This rank reads each batch on behalf of all ranks on its socket and scatters it to them. The results
+            are gathered back to this rank, which writes them and marks the positions as completed. Far fewer ranks
+            then contend for metadata and locks on parallel file systems. The reading rank holds the batches of all
+            ranks on its socket in memory. Ignored when not computing via MPI
+        backend : str, Optional, default = "processes"
+            Whether the workers computing each batch are separate "processes" or "threads" within this process.
+            Threads share the batch without copying it, so batches may be as large as the memory allows rather than
+            a fraction of it per worker. Threads only compute in parallel if _map_function releases the GIL, as most
+            numpy and scipy functions do. The backend of the pool is used instead if a pool is provided
         """
 
         if h5_main.file.mode != 'r+':
             raise TypeError('Need to ensure that the file is in r+ mode to write results back to the file')
+        if not isinstance(prefetch, bool):
+            raise TypeError('prefetch should be a boolean')
+        if not isinstance(write_behind, int) or isinstance(write_behind, bool):
+            raise TypeError('write_behind should be an unsigned integer')
+        if write_behind < 0:
+            raise ValueError('write_behind should be an unsigned integer')
+        if pool is not None and not isinstance(pool, WorkerPool):
+            raise TypeError('pool should be a WorkerPool object')
+        _ = check_backend(backend)
+        if pool is not None:
+            backend = pool.backend
+        lazy_read = False
+        if dask_scheduler is not None:
+            lazy_read = check_dask_scheduler(dask_scheduler) and not prefetch
+            if pool is not None:
+                raise ValueError('A pool of workers cannot be used when computing via dask')
+            if backend != 'processes':
+                raise ValueError('backend cannot be set when computing via dask')
+        if not isinstance(shared_memory, bool):
+            raise TypeError('shared_memory should be a boolean')
+        if not isinstance(aggregate_io, bool):
+            raise TypeError('aggregate_io should be a boolean')
+
+        # Batches being written in the background are visible only to the thread writing them
+        self.__thread_batch = threading.local()
+        self.__data = None
+        self.__results = None
+        self.__failures = None
 
         MPI = get_MPI()
 
@@ -69,10 +161,7 @@ class Process(object):
             if verbose:
                 print("Rank {} of {} on {} sees {} logical cores on the socket".format(comm.Get_rank(), comm.Get_size(),
                                                                                        MPI.Get_processor_name(),
-                                                                                       cpu_count()))
-
-            # First, ensure that cores=logical cores in node. No point being economical / considerate
-            cores = psutil.cpu_count()
+                                                                                       get_available_cores()))
 
             # It is sufficient if just one rank checks all this.
             if self.mpi_rank == 0:
@@ -83,6 +172,15 @@ class Process(object):
                 raise TypeError('The HDF5 file should have been opened with driver="mpio". Current driver = "{}"'
                                 ''.format(h5_main.file.driver))
 
+            if (prefetch or write_behind > 0) and MPI.Query_thread() < MPI.THREAD_MULTIPLE:
+                # h5py serializes HDF5 calls, but MPI calls made by HDF5 in the background threads may coincide with
+                # MPI calls made directly by the main thread, such as those that decide on flushes or claim batches
+                if self.mpi_rank == 0:
+                    print('MPI was not initialized with MPI.THREAD_MULTIPLE. Prefetching and writing in the '
+                          'background will be disabled')
+                prefetch = False
+                write_behind = 0
+
             if verbose and self.mpi_rank == 0:
                 print('Finished getting all necessary MPI information')
 
@@ -131,6 +229,29 @@ class Process(object):
         self.__socket_master_rank = 0
         self._max_pos_per_read = None
         self.__bytes_per_pos = None
+        self._prefetch = prefetch
+        self.__prefetched = None
+        self._write_behind = write_behind
+        # Positions per batch when batches are sized to meet a checkpoint interval instead of just the memory:
+        self.__batch_limit = None
+        # Hands out batches to ranks on demand when scheduling dynamically:
+        self.__job_counter = None
+        # When results are flushed to the file:
+        self.__flush_every = 1
+        self.__flush_interval = None
+        self.__batches_since_flush = 0
+        self.__last_flush_time = None
+        # Keeps a flush from interleaving with a batch being written in the background:
+        self.__commit_lock = threading.Lock()
+        self.__external_pool = pool
+        self._worker_pool = None
+        self._dask_scheduler = dask_scheduler
+        self._shared_memory = shared_memory
+        self._backend = backend
+        # Batches will be sliced from this dask array instead of being read if it is set:
+        self.__lazy_source = lazy_load_array(h5_main) if lazy_read else None
+        # Nothing is recorded unless compute() is asked to trace
+        self._tracer = Tracer(rank=self.mpi_rank, enabled=False)
 
         # Now have to be careful here since the below properties are a function of the MPI rank
         self.__start_pos = None
@@ -140,14 +261,32 @@ class Process(object):
 
         # Determining the max size of the data that can be put into memory
         # all ranks go through this and they need to have this value any
+        self.__max_mem_mb = max_mem_mb
+        # Set by calibrate_memory() and autotune() and recorded in the results group:
+        self._mem_calibration = None
+        self._autotune = None
+        self.__tuned_batch_size = None
         self._set_memory_and_cores(cores=cores, man_mem_limit=max_mem_mb,
                                    mem_multiplier=mem_multiplier)
+        # Connects the ranks on this socket with the rank that reads and writes on their behalf:
+        self.__node_comm = None
+        if aggregate_io and self.mpi_comm is not None:
+            self.__node_comm = self.mpi_comm.Split(color=int(self.__socket_master_rank), key=self.mpi_rank)
+            if verbose and self.mpi_rank == self.__socket_master_rank:
+                print('Rank {} will read and write on behalf of the {} ranks on its socket'
+                      '.'.format(self.mpi_rank, self.__node_comm.Get_size()))
+        # Full batch of all ranks on this socket held by the rank reading and writing for them:
+        self.__node_batch = None
         if verbose and self.mpi_rank == 0:
             print('Finished collecting info on memory and workers')
         self.duplicate_h5_groups = []
         self.partial_h5_groups = []
         self.process_name = None  # Reset this in the extended classes
         self.parms_dict = None
+        # Set results_dtype in the extended classes to have the workers write the results of each position, of shape
+        # results_shape, straight into a preallocated array instead of returning a list of results:
+        self.results_shape = ()
+        self.results_dtype = None
 
         """
         The name of the HDF5 dataset that should be present to signify which positions have already been computed
@@ -157,6 +296,13 @@ class Process(object):
         variable before checking for duplicates
         """
         self._status_dset_name = 'completed_positions'
+        # Records of the positions whose computation raised an exception and the errors raised:
+        self._failures_dset_name = 'failed_positions'
+        # Whether exceptions raised for single positions are recorded rather than raised, as set by compute():
+        self.__isolate_failures = False
+        self.__retry_failed = False
+        # Failed positions and their errors that have not yet been written to the file:
+        self.__failure_records = []
 
         self._results = None
         self.h5_results_grp = None
@@ -185,29 +331,85 @@ class Process(object):
         """
         Sets the start and end indices for each MPI rank
         """
-        # First figure out what positions need to be computed
-        self._compute_jobs = np.where(self._h5_status_dset[()] == 0)[0]
+        # Any batch read ahead of time belongs to a previous assignment of jobs
+        self.__discard_prefetched()
+
+        # First figure out what positions need to be computed. Stored as runs of positions to keep memory small
+        pending_values = (STATUS_PENDING, STATUS_FAILED) if self.__retry_failed else (STATUS_PENDING,)
+        self._compute_jobs = self._status_tracker.get_pending(values=pending_values)
         if self.verbose and self.mpi_rank == 0:
             print('Among the {} positions in this dataset, the following positions need to be computed: {}'
                   '.'.format(self.h5_main.shape[0], self._compute_jobs))
 
-        pos_per_rank = self._compute_jobs.size // self.mpi_size  # integer division
+        num_readers, reader = self.mpi_size, self.mpi_rank
+        if self.__node_comm is not None:
+            # Positions are divided among sockets. The socket master reads and writes on behalf of its ranks
+            num_readers = self.__socket_masters.size
+            reader = int(np.searchsorted(self.__socket_masters, self.__socket_master_rank))
+
+        pos_per_rank = self._compute_jobs.size // num_readers  # integer division
         if self.verbose and self.mpi_rank == 0:
-            print('Each rank is required to work on {} of the {} (remaining) positions in this dataset'
-                  '.'.format(pos_per_rank, self._compute_jobs.size))
+            print('Each {} is required to work on {} of the {} (remaining) positions in this dataset'
+                  '.'.format('socket' if self.__node_comm is not None else 'rank', pos_per_rank,
+                             self._compute_jobs.size))
 
         # The start and end indices now correspond to the indices in the incomplete jobs rather than the h5 dataset
-        self.__start_pos = self.mpi_rank * pos_per_rank
-        self.__rank_end_pos = (self.mpi_rank + 1) * pos_per_rank
-        self.__end_pos = int(min(self.__rank_end_pos, self.__start_pos + self._max_pos_per_read))
-        if self.mpi_rank == self.mpi_size - 1:
-            # Force the last rank to go to the end of the dataset
+        # Ranks should not share chunks of the dataset. Every rank computes all boundaries to arrive at the same answer
+        rank_bounds = [0]
+        for rank in range(1, num_readers):
+            rank_bounds.append(self.__snap_to_chunks(rank_bounds[-1], rank * pos_per_rank))
+        # Force the last rank to go to the end of the dataset
+        rank_bounds.append(self._compute_jobs.size)
+
+        self.__start_pos = rank_bounds[reader]
+        self.__rank_end_pos = rank_bounds[reader + 1]
+        self.__end_pos = self.__get_batch_end(self.__start_pos)
+
+        if self.__job_counter is not None:
+            # Batches will instead be requested one at a time from the shared counter
+            self.__start_pos = 0
+            self.__end_pos = 0
             self.__rank_end_pos = self._compute_jobs.size
+            if self.verbose:
+                print('Rank {} will request batches from the {} remaining positions as it needs them'
+                      '.'.format(self.mpi_rank, self._compute_jobs.size))
+            return
 
         if self.verbose:
             print('Rank {} will read positions {} to {} of {}'.format(self.mpi_rank, self.__start_pos,
                                                                       self.__rank_end_pos, self.h5_main.shape[0]))
 
+    def __get_checkpoint_batch_size(self, checkpoint_interval, last_batch_size, time_per_pos):
+        """
+        Returns the number of positions to compute in the next batch such that results are written to the file
+        approximately at the requested interval
+
+        Parameters
+        ----------
+        checkpoint_interval : float
+            Desired time in seconds between successive writes of results
+        last_batch_size : uint
+            Number of positions in the last batch
+        time_per_pos : float
+            Moving average of the time in seconds taken to compute and write a single position
+
+        Returns
+        -------
+        pos_per_batch : uint
+            Number of positions in the next batch
+        """
+        # Grow gradually since the timing of the first (small) batches may not be representative
+        max_growth = 10
+        if time_per_pos > 0:
+            pos_per_batch = int(checkpoint_interval / time_per_pos)
+        else:
+            pos_per_batch = self._max_pos_per_read
+        pos_per_batch = max(1, min(pos_per_batch, max_growth * last_batch_size, self._max_pos_per_read))
+        if self.verbose:
+            print('Rank {} - next batch will contain up to {} positions to write results every ~{}'
+                  '.'.format(self.mpi_rank, pos_per_batch, format_time(checkpoint_interval)))
+        return pos_per_batch
+
     def _estimate_compute_time_per_pixel(self, *args, **kwargs):
         """
         Estimates how long it takes to compute an average pixel's worth of data. This information should be used by the
@@ -220,10 +422,298 @@ class Process(object):
         """
         chosen_pos = np.random.randint(0, high=self.h5_main.shape[0]-1, size=5)
         t0 = tm.time()
-        _ = parallel_compute(self.h5_main[chosen_pos, :], self._map_function, cores=1,
-                             lengthy_computation=False, func_args=args, func_kwargs=kwargs, verbose=False)
+        _ = comp_utils.parallel_compute(self.h5_main[chosen_pos, :], self._map_function, cores=1,
+                                        lengthy_computation=False, func_args=args, func_kwargs=kwargs, verbose=False)
         return (tm.time() - t0) / len(chosen_pos)
 
+    def calibrate_memory(self, num_pos=None, safety_factor=1.25, *args, **kwargs):
+        """
+        Measures the memory required per position instead of relying on the mem_multiplier provided to the
+        constructor. The computation is run serially on a small sample of positions while tracking the peak memory
+        used for the source data, results, and any temporary arrays. The mem_multiplier and therefore the number of
+        positions per batch are then recalculated from this measurement. The calibration is recorded in the
+        attributes of the results group when compute() is called.
+
+        Notes
+        -----
+        Nothing is written to the file. Memory allocated by the workers of a pool is not visible to this process,
+        which is why the sample is computed serially. On python 2, the increase in resident memory is used instead of
+        the peak memory.
+
+        Parameters
+        ----------
+        num_pos : uint, optional
+            Number of positions to compute. Default - 8 positions or the whole dataset if smaller
+        safety_factor : float, optional
+            Factor by which the measured memory per position is inflated. Default - 1.25
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+
+        Returns
+        -------
+        mem_multiplier : float
+            Calibrated ratio of the memory required per position to the size of a position in the source dataset
+        """
+        if num_pos is None:
+            num_pos = 8
+        if not isinstance(num_pos, int) or isinstance(num_pos, bool):
+            raise TypeError('num_pos should be a positive integer')
+        if num_pos < 1:
+            raise ValueError('num_pos should be a positive integer')
+        if not isinstance(safety_factor, Number) or isinstance(safety_factor, (bool, complex)):
+            raise TypeError('safety_factor should be a number no smaller than 1')
+        if safety_factor < 1:
+            raise ValueError('safety_factor should be a number no smaller than 1')
+        num_pos = min(num_pos, self.h5_main.shape[0])
+        pixels = np.arange(num_pos)
+
+        cores, pool = self._cores, self._worker_pool
+        self._cores, self._worker_pool = 1, None
+        already_tracing = True
+        try:
+            if tracemalloc is not None:
+                already_tracing = tracemalloc.is_tracing()
+                if not already_tracing:
+                    tracemalloc.start()
+                base_mem = tracemalloc.get_traced_memory()[0]
+                if hasattr(tracemalloc, 'reset_peak'):
+                    # Python 3.9+. Otherwise, an earlier peak would only make the estimate more conservative
+                    tracemalloc.reset_peak()
+            else:
+                base_mem = psutil.Process().memory_info().rss
+            self.__thread_batch.batch = _BatchState(pixels, self.h5_main[pixels, :], None, None)
+            try:
+                self._unit_computation(*args, **kwargs)
+                if tracemalloc is not None:
+                    peak_mem = tracemalloc.get_traced_memory()[1]
+                else:
+                    peak_mem = psutil.Process().memory_info().rss
+            finally:
+                self.__thread_batch.batch = None
+        finally:
+            # Tracing slows down all allocations, so it should not outlive the calibration even if the computation fails
+            if not already_tracing:
+                tracemalloc.stop()
+            self._cores, self._worker_pool = cores, pool
+
+        source_bytes_per_pos = self.h5_main.dtype.itemsize * self.h5_main.shape[1]
+        bytes_per_pos = max(0, peak_mem - base_mem) / num_pos
+        mem_multiplier = float(max(1.0, safety_factor * bytes_per_pos / source_bytes_per_pos))
+        if self.verbose and self.mpi_rank == 0:
+            print('Rank {} - computing {} positions required {} per position. Setting mem_multiplier to {}'
+                  '.'.format(self.mpi_rank, num_pos, format_size(bytes_per_pos), np.round(mem_multiplier, 2)))
+
+        self.__set_memory(man_mem_limit=self.__max_mem_mb, mem_multiplier=mem_multiplier)
+        self._mem_calibration = {'calibrated_bytes_per_pos': bytes_per_pos,
+                                 'calibrated_mem_multiplier': mem_multiplier}
+        if self.h5_results_grp is not None:
+            self.h5_results_grp.attrs.update(self._mem_calibration)
+        return mem_multiplier
+
+    def autotune(self, cores=None, batch_sizes=None, backends=None, override=False, *args, **kwargs):
+        """
+        Benchmarks combinations of the number of cores, the number of positions per batch, and the backend used for
+        computing on contiguous samples of positions and adopts the combination that processes positions the
+        fastest. Both the time taken to read each sample from the file and the time taken to compute it are
+        considered. The chosen settings are recorded in the attributes of the results group when compute() is called.
+        Unless override is True, the settings recorded in the latest results group of this process applied to the
+        same dataset are adopted instead of benchmarking again.
+
+        Notes
+        -----
+        Nothing is written to the file. Reads may be served from the cache of the operating system and therefore
+        appear faster than they would be for the full dataset. Only the batch size is tuned when running via MPI
+        or with a pool of workers provided to the constructor.
+
+        Parameters
+        ----------
+        cores : list of uint, optional
+            Numbers of cores to try. Default - 1, half, and all of the cores this object would otherwise use
+        batch_sizes : list of uint, optional
+            Numbers of positions per batch to try. Default - 1, 4, and 16 positions per core for the largest number
+            of cores, limited by the memory and the size of the dataset
+        backends : list of str, optional
+            Backends to try - "processes" or "threads" for a pool of workers of the same kind and "dask-" followed by
+            the name of a local dask scheduler such as "dask-threads" or "dask-processes".
+            Default - ["processes", "threads", "dask-threads"]
+        override : bool, optional. default = False
+            Whether or not to benchmark even if settings were recorded by a prior computation
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+
+        Returns
+        -------
+        settings : dict
+            Chosen number of cores, batch size, and backend along with the positions processed per second and the
+            bytes read per second with these settings
+        """
+        if not isinstance(override, bool):
+            raise TypeError('override should be a boolean value')
+        tune_workers = self.mpi_comm is None and self.__external_pool is None
+
+        if not override and self.process_name is not None:
+            for h5_group in reversed(find_results_groups(self.h5_main, self.process_name)):
+                if 'autotuned_batch_size' in h5_group.attrs.keys():
+                    settings = dict([(key, get_attr(h5_group, key)) for key in h5_group.attrs.keys()
+                                     if key.startswith('autotuned_')])
+                    if self.verbose and self.mpi_rank == 0:
+                        print('Adopting settings recorded in {}: {}'.format(h5_group.name, settings))
+                    self.__apply_tuning(settings, tune_workers)
+                    return settings
+
+        if not tune_workers:
+            cores = [self._cores]
+            if backends is None:
+                backends = [self._backend]
+        elif cores is None:
+            cores = [1, self._cores // 2, self._cores]
+        if backends is None:
+            backends = ['processes', 'threads', 'dask-threads']
+        for name, values in zip(['cores', 'batch_sizes', 'backends'], [cores, batch_sizes, backends]):
+            if values is not None and (not isinstance(values, (list, tuple)) or len(values) == 0):
+                raise TypeError('{} should be a non-empty list'.format(name))
+        for item in cores:
+            if not isinstance(item, int) or isinstance(item, bool) or item < 0:
+                raise TypeError('cores should be a list of positive integers')
+        cores = sorted(set([item for item in cores if item > 0]))
+        for backend in backends:
+            if not isinstance(backend, (str, unicode)):
+                raise TypeError('backends should be a list of strings')
+            if not tune_workers and backend != self._backend:
+                raise ValueError('Only the "{}" backend can be used via MPI or with a provided pool of workers'
+                                 '.'.format(self._backend))
+            if backend.startswith('dask-'):
+                _ = check_dask_scheduler(backend[len('dask-'):])
+            elif backend not in comp_utils.BACKENDS:
+                raise ValueError('backends should either be one of {} or start with "dask-"'
+                                 '.'.format(sorted(comp_utils.BACKENDS.keys())))
+
+        num_pos = self.h5_main.shape[0]
+        if batch_sizes is None:
+            batch_sizes = [max(cores) * factor for factor in [1, 4, 16]]
+        for item in batch_sizes:
+            if not isinstance(item, int) or isinstance(item, bool) or item < 1:
+                raise TypeError('batch_sizes should be a list of positive integers')
+        batch_sizes = sorted(set([max(1, min(item, num_pos, self._max_pos_per_read)) for item in batch_sizes]))
+
+        orig_state = (self._cores, self._worker_pool, self._dask_scheduler, self._backend)
+        bytes_per_pos = self.h5_main.dtype.itemsize * self.h5_main.shape[1]
+        timings = []
+        try:
+            for batch_size in batch_sizes:
+                start = np.random.randint(0, num_pos - batch_size + 1)
+                pixels = np.arange(start, start + batch_size)
+                t_start = tm.time()
+                data = self.h5_main[start: start + batch_size]
+                read_time = tm.time() - t_start
+                for num_cores in cores:
+                    for backend in backends:
+                        self._cores = num_cores
+                        self._worker_pool = None
+                        self._dask_scheduler = None
+                        if backend.startswith('dask-'):
+                            self._dask_scheduler = backend[len('dask-'):]
+                        else:
+                            self._backend = backend
+                            self._worker_pool = self.__external_pool or WorkerPool(cores=num_cores, backend=backend)
+                            self._worker_pool.start()
+                        try:
+                            # The first call may pay for one-time costs such as importing modules in the workers
+                            warm_up = min(batch_size, num_cores)
+                            self.__time_batch(pixels[:warm_up], data[:warm_up], *args, **kwargs)
+                            compute_time = self.__time_batch(pixels, data, *args, **kwargs)
+                        finally:
+                            if self._worker_pool is not None and self._worker_pool is not self.__external_pool:
+                                self._worker_pool.shutdown()
+                        if self._prefetch:
+                            # Reads overlap with the computation
+                            time_per_pos = max(read_time, compute_time) / batch_size
+                        else:
+                            time_per_pos = (read_time + compute_time) / batch_size
+                        timings.append((time_per_pos, num_cores, batch_size, backend, read_time))
+                        if self.verbose and self.mpi_rank == 0:
+                            print('Rank {} - {} cores, {} positions per batch, {} backend: read in {}, computed in '
+                                  '{}'.format(self.mpi_rank, num_cores, batch_size, backend, format_time(read_time),
+                                              format_time(compute_time)))
+        finally:
+            self._cores, self._worker_pool, self._dask_scheduler, self._backend = orig_state
+
+        # Faster is better. Larger batches break ties since they need fewer reads and writes
+        time_per_pos, num_cores, batch_size, backend, read_time = min(timings,
+                                                                      key=lambda item: (item[0], -item[2]))
+        settings = {'autotuned_cores': num_cores, 'autotuned_batch_size': batch_size,
+                    'autotuned_backend': backend,
+                    'autotuned_pos_per_sec': 1 / time_per_pos if time_per_pos > 0 else float(num_pos),
+                    'autotuned_read_bytes_per_sec': bytes_per_pos * batch_size / max(read_time, 1E-9)}
+        if self.verbose and self.mpi_rank == 0:
+            print('Rank {} - chose {} cores, {} positions per batch, and the {} backend to process ~{} positions per '
+                  'second'.format(self.mpi_rank, num_cores, batch_size, backend,
+                                  np.round(settings['autotuned_pos_per_sec'], 1)))
+        self.__apply_tuning(settings, tune_workers)
+        return settings
+
+    def __time_batch(self, pixels, data, *args, **kwargs):
+        """
+        Computes the provided batch of positions without writing the results
+
+        Parameters
+        ----------
+        pixels : :class:`numpy.ndarray`
+            1D array of unsigned integers denoting the positions
+        data : :class:`numpy.ndarray`
+            2D array with the source data for these positions
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+
+        Returns
+        -------
+        compute_time : float
+            Time in seconds taken to compute the batch
+        """
+        self.__thread_batch.batch = _BatchState(pixels, data, None, None)
+        try:
+            t_start = tm.time()
+            self._unit_computation(*args, **kwargs)
+            return tm.time() - t_start
+        finally:
+            self.__thread_batch.batch = None
+
+    def __apply_tuning(self, settings, tune_workers):
+        """
+        Adopts the number of cores, batch size, and backend chosen by autotune()
+
+        Parameters
+        ----------
+        settings : dict
+            Settings returned by autotune()
+        tune_workers : bool
+            Whether or not the number of cores and the backend may be changed
+        """
+        self.__tuned_batch_size = int(settings['autotuned_batch_size'])
+        if tune_workers:
+            self._cores = int(settings['autotuned_cores'])
+            backend = settings['autotuned_backend']
+            self._dask_scheduler = None
+            self.__lazy_source = None
+            if backend in comp_utils.BACKENDS:
+                self._backend = backend
+            else:
+                self._backend = 'processes'
+                self._dask_scheduler = backend[len('dask-'):]
+                if check_dask_scheduler(self._dask_scheduler) and not self._prefetch:
+                    self.__lazy_source = lazy_load_array(self.h5_main)
+            # The memory available to each worker depends on the number of workers
+            self.__set_memory(man_mem_limit=self.__max_mem_mb, mem_multiplier=self.__mem_multiplier)
+        self._autotune = settings
+        if self.h5_results_grp is not None:
+            self.h5_results_grp.attrs.update(settings)
+
     def _get_pixels_in_current_batch(self):
         """
         Returns the indices of the pixels that will be processed in this batch.
@@ -233,8 +723,72 @@ class Process(object):
         pixels_in_batch : :class:`numpy.ndarray`
             1D array of unsigned integers denoting the pixels that will be read, processed, and written back to
         """
+        batch = getattr(self.__thread_batch, 'batch', None)
+        if batch is not None:
+            return batch.pixels
         return self.__pixels_in_batch
 
+    @property
+    def tracer(self):
+        """
+        :class:`~pyUSID.processing.trace_utils.Tracer` holding the timeline recorded during the last call to compute()
+        """
+        return self._tracer
+
+    @property
+    def data(self):
+        """
+        Batch of the source dataset that is being processed
+        """
+        batch = getattr(self.__thread_batch, 'batch', None)
+        if batch is not None:
+            return batch.data
+        return self.__data
+
+    @data.setter
+    def data(self, value):
+        batch = getattr(self.__thread_batch, 'batch', None)
+        if batch is not None:
+            batch.data = value
+        else:
+            self.__data = value
+
+    @property
+    def _results(self):
+        """
+        Results computed for the batch being processed
+        """
+        batch = getattr(self.__thread_batch, 'batch', None)
+        if batch is not None:
+            return batch.results
+        return self.__results
+
+    @_results.setter
+    def _results(self, value):
+        batch = getattr(self.__thread_batch, 'batch', None)
+        if batch is not None:
+            batch.results = value
+        else:
+            self.__results = value
+
+    @property
+    def _failures(self):
+        """
+        Index within the batch being processed and error of each position whose computation raised an exception
+        """
+        batch = getattr(self.__thread_batch, 'batch', None)
+        if batch is not None:
+            return batch.failures
+        return self.__failures
+
+    @_failures.setter
+    def _failures(self, value):
+        batch = getattr(self.__thread_batch, 'batch', None)
+        if batch is not None:
+            batch.failures = value
+        else:
+            self.__failures = value
+
     def test(self, **kwargs):
         """
         Tests the process on a subset (for example a pixel) of the whole data. The class can be re-instantiated with
@@ -267,15 +821,34 @@ class Process(object):
         if self.verbose and self.mpi_rank == 0:
             print('Checking for duplicates:')
 
+        # Groups computed with the same parameters are looked up via the hash of the parameters
+        indexed_groups = find_indexed_results(self.h5_main, self.process_name, self.__get_parms_hash())
+        # Only the attributes of groups written before results were indexed need to be compared. All groups of this
+        # process are compared if the file has no index for it
+        legacy_groups = find_unindexed_results(self.h5_main, self.process_name)
+        if legacy_groups is None:
+            legacy_groups = find_results_groups(self.h5_main, self.process_name)
+        legacy_groups = [h5_group for h5_group in legacy_groups
+                         if check_for_matching_attrs(h5_group, new_parms=self.parms_dict,
+                                                     verbose=self.verbose and self.mpi_rank == 0)]
+        if self.verbose and self.mpi_rank == 0:
+            print('Found {} results groups via the index and {} other groups with matching attributes'
+                  '.'.format(len(indexed_groups), len(legacy_groups)))
+
+        # Groups that were not indexed as complete are partial. Completion of the other groups is verified below
+        # since their status datasets may have been changed, for example to compute some positions again
+        partial_h5_groups = [h5_group for h5_group, completed in indexed_groups
+                             if self._status_dset_name not in completed and self._status_dset_name in h5_group]
         # This list will contain completed runs only
-        duplicate_h5_groups = check_for_old(self.h5_main, self.process_name,
-                                            new_parms=self.parms_dict,
-                                            verbose=self.verbose and self.mpi_rank==0)
-        partial_h5_groups = []
+        duplicate_h5_groups = [h5_group for h5_group, _ in indexed_groups
+                               if h5_group not in partial_h5_groups] + legacy_groups
+        if self.verbose and self.mpi_rank == 0:
+            for h5_group in partial_h5_groups:
+                print('{} was not indexed as complete. Moving it to partial'.format(h5_group.name))
 
         # First figure out which ones are partially completed:
         if len(duplicate_h5_groups) > 0:
-            for index, curr_group in enumerate(duplicate_h5_groups):
+            for curr_group in list(duplicate_h5_groups):
                 """
                 Earlier, we only checked the 'last_pixel' but to be rigorous we should check self._status_dset_name
                 The last_pixel attribute check may be deprecated in the future.
@@ -299,7 +872,7 @@ class Process(object):
 
                     # ##### ACTUAL COMPLETENESS TEST HERE #########
 
-                    completed_positions = np.sum(status_dset[()])
+                    completed_positions = CompletionTracker(status_dset).count(STATUS_COMPLETED)
 
                     if self.verbose and self.mpi_rank == 0:
                         print('{} has results that are {} % complete'
@@ -312,7 +885,8 @@ class Process(object):
                         # remove from duplicates and move to partial
                         if self.verbose and self.mpi_rank == 0:
                             print('moving {} to partial'.format(curr_group.name))
-                        partial_h5_groups.append(duplicate_h5_groups.pop(index))
+                        partial_h5_groups.append(curr_group)
+                        duplicate_h5_groups.remove(curr_group)
                         # Let's write the legacy attribute for safety
                         curr_group.attrs['last_pixel'] = self.h5_main.shape[0]
                         # No further checks necessary
@@ -330,7 +904,7 @@ class Process(object):
                         print('Group: {} had neither the status HDF5 dataset or the legacy attribute: "last_pixel"'
                               '.'.format(curr_group))
                     # Not sure what to do with such groups. Don't consider them
-                    duplicate_h5_groups.pop(index)
+                    duplicate_h5_groups.remove(curr_group)
                     continue
 
                 # Case 3.A: Only the legacy book-keeping is available:
@@ -341,7 +915,8 @@ class Process(object):
                         print('moving {} to partial since computation was {} % complete'
                               '.'.format(curr_group.name,
                                          int(100 * curr_group.attrs['last_pixel'] / self.h5_main.shape[0])))
-                    partial_h5_groups.append(duplicate_h5_groups.pop(index))
+                    partial_h5_groups.append(curr_group)
+                    duplicate_h5_groups.remove(curr_group)
 
                     continue
 
@@ -349,6 +924,15 @@ class Process(object):
                 if self.verbose and self.mpi_rank == 0:
                     print('Leaving {} in duplicate groups'.format(curr_group.name))
 
+        # Index the groups that matched so that they can be found via the hash from now on
+        for h5_group in legacy_groups:
+            if h5_group in duplicate_h5_groups or h5_group in partial_h5_groups:
+                self.__index_results(h5_group, complete=h5_group in duplicate_h5_groups)
+
+        # The latest group is expected to be last
+        duplicate_h5_groups = sorted(duplicate_h5_groups, key=lambda h5_group: h5_group.name)
+        partial_h5_groups = sorted(partial_h5_groups, key=lambda h5_group: h5_group.name)
+
         if len(duplicate_h5_groups) > 0 and self.mpi_rank == 0:
             print('\nNote: ' + self.process_name + ' has already been performed with the same parameters before. '
                                                  'These results will be returned by compute() by default. '
@@ -365,6 +949,43 @@ class Process(object):
 
         return duplicate_h5_groups, partial_h5_groups
 
+    def __get_parms_hash(self):
+        """
+        Returns the hash of the parameters of this process
+
+        Returns
+        -------
+        parms_hash : str
+            Hash of parms_dict. See :func:`~pyUSID.io.hdf_utils.hash_parms`
+        """
+        return hash_parms(self.parms_dict if self.parms_dict is not None else dict())
+
+    def __index_results(self, h5_group, complete=False):
+        """
+        Records the provided results group in the index of results groups kept in the parent group of the source
+        dataset along with the hash of the parameters, such that duplicate or partial results can be found without
+        comparing the attributes of every results group
+
+        Parameters
+        ----------
+        h5_group : :class:`h5py.Group`
+            Group containing the results of this process
+        complete : bool, optional. default = False
+            Whether or not all positions have been computed
+        """
+        if self.process_name is None or h5_group.parent != self.h5_main.parent:
+            # Results elsewhere cannot be found by find_results_groups() either
+            return
+        if 'parms_hash' in h5_group.attrs.keys():
+            # Groups keep the hash of the parameters they were computed with. parms_dict holds all attributes of the
+            # group, including book-keeping attributes, once computation is resumed in it
+            parms_hash = get_attr(h5_group, 'parms_hash')
+        else:
+            parms_hash = self.__get_parms_hash()
+            h5_group.attrs['parms_hash'] = parms_hash
+        index_results_group(self.h5_main, self.process_name, parms_hash, h5_group,
+                            complete_status=self._status_dset_name if complete else None)
+
     def use_partial_computation(self, h5_partial_group=None):
         """
         Extracts the necessary parameters from the provided h5 group to resume computation
@@ -401,31 +1022,35 @@ class Process(object):
             How many CPU cores to use for the computation.
         """
         if self.mpi_comm is None:
-            min_free_cores = 1 + int(psutil.cpu_count() > 4)
+            min_free_cores = 1 + int(get_available_cores() > 4)
 
             if cores is None:
-                self._cores = max(1, psutil.cpu_count() - min_free_cores)
+                self._cores = max(1, get_available_cores() - min_free_cores)
             else:
                 if not isinstance(cores, int):
                     raise TypeError('cores should be an integer but got: {}'.format(cores))
                 cores = int(abs(cores))
-                self._cores = max(1, min(psutil.cpu_count(), cores))
+                self._cores = max(1, min(get_available_cores(), cores))
 
             self.__socket_master_rank = 0
             self.__ranks_on_socket = 1
+            self.__socket_masters = np.array([0])
         else:
-            # user-provided input cores will simply be ignored in an effort to use the entire CPU
             ranks_by_socket = group_ranks_by_socket(verbose=False)
             self.__socket_master_rank = ranks_by_socket[self.mpi_rank]
+            self.__socket_masters = np.unique(ranks_by_socket)
             # which ranks in this socket?
             ranks_on_this_socket = np.where(ranks_by_socket == self.__socket_master_rank)[0]
             # how many in this socket?
             self.__ranks_on_socket = ranks_on_this_socket.size
-            # Force usage of all available memory
-            man_mem_limit = None
-            self._cores = 1
-            # Disabling the following line since mpi4py and joblib didn't play well for Bayesian Inference
-            # self._cores = self.__cores_per_rank = psutil.cpu_count() // self.__ranks_on_socket
+            # Each rank computes with its own workers on its share of the cores on this node
+            rank_cores = comp_utils.recommend_cores_per_rank(self.mpi_comm, verbose=self.verbose)
+            if cores is None:
+                self._cores = rank_cores
+            else:
+                if not isinstance(cores, int):
+                    raise TypeError('cores should be an integer but got: {}'.format(cores))
+                self._cores = max(1, min(rank_cores, int(abs(cores))))
 
     def _set_memory_and_cores(self, cores=None, man_mem_limit=None,
                               mem_multiplier=1.0):
@@ -483,13 +1108,14 @@ class Process(object):
         mem_multiplier = abs(mem_multiplier)
         if mem_multiplier < 1:
             raise ValueError('mem_multiplier must be at least 1')
+        self.__mem_multiplier = mem_multiplier
 
         avail_mem_bytes = get_available_memory()  # in bytes
         if self.verbose and self.mpi_rank == self.__socket_master_rank:
             # expected to be the same for all ranks so just use this.
             print('Rank {} - on socket with {} cores and {} avail. RAM shared '
                   'by {} ranks each given {} cores'
-                  '.'.format(self.__socket_master_rank, psutil.cpu_count(),
+                  '.'.format(self.__socket_master_rank, get_available_cores(),
                              format_size(avail_mem_bytes),
                              self.__ranks_on_socket, self._cores))
 
@@ -509,7 +1135,11 @@ class Process(object):
         # Remember that multiple processes (either via MPI or joblib) will share this socket
         # This makes logical sense but there's always too much free memory and the
         # cores are starved.
-        max_mem_per_worker = max_mem_bytes / (self._cores * self.__ranks_on_socket)
+        num_copies = self._cores * self.__ranks_on_socket
+        if self._backend == 'threads':
+            # Threads share a single copy of each batch
+            num_copies = self.__ranks_on_socket
+        max_mem_per_worker = max_mem_bytes / num_copies
         if self.verbose and self.mpi_rank == self.__socket_master_rank:
             print('Rank {}: Each of the {} workers on this socket are allowed '
                   'to use {} of RAM'
@@ -530,6 +1160,21 @@ class Process(object):
             print('Each position of the source and results dataset(s) is {} '
                   'large.'.format(format_size(self.__bytes_per_pos)))
 
+        if self._prefetch:
+            # The next batch of the source dataset is read while the current one is being computed upon
+            self.__bytes_per_pos += self.h5_main.dtype.itemsize * self.h5_main.shape[1]
+            if self.verbose and self.mpi_rank == 0:
+                print('Accounting for an additional batch of the source dataset being prefetched. Each position now '
+                      'requires {}'.format(format_size(self.__bytes_per_pos)))
+
+        if self._write_behind > 0:
+            # Each batch waiting to be written retains its source data and results
+            self.__bytes_per_pos += self._write_behind * mem_multiplier * \
+                                    self.h5_main.dtype.itemsize * self.h5_main.shape[1]
+            if self.verbose and self.mpi_rank == 0:
+                print('Accounting for {} batches waiting to be written. Each position now requires {}'
+                      '.'.format(self._write_behind, format_size(self.__bytes_per_pos)))
+
         self._max_pos_per_read = int(np.floor(max_mem_per_worker / self.__bytes_per_pos))
 
         if self.verbose and self.mpi_rank == self.__socket_master_rank:
@@ -559,18 +1204,293 @@ class Process(object):
         """
         raise NotImplementedError('Please override the _unit_function specific to your process')
 
+    @staticmethod
+    def _map_block_function(*args, **kwargs):
+        """
+        Optional vectorized alternative to :meth:`~pyUSID.processing.process.Process._map_function` that manipulates
+        the data for several positions at once. If this function is overridden, it will be used instead of
+        _map_function by :meth:`~pyUSID.processing.process.Process._unit_computation`. The batch is split into one
+        sub-block of positions per core rather than one task per position, which is far more efficient for cheap
+        computations that can be expressed using numpy operations over the entire sub-block.
+
+        Parameters
+        ----------
+        args : list
+            arguments to the function in the correct order. The first is a 2D :class:`numpy.ndarray` arranged as
+            (positions, spectral values)
+        kwargs : dict
+            keyword arguments to the function
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            Results for all positions in the sub-block stacked along the first axis
+        """
+        raise NotImplementedError('Please override the _map_block_function specific to your process')
+
+    def _uses_block_function(self):
+        """
+        Returns whether or not this class has provided a vectorized
+        :meth:`~pyUSID.processing.process.Process._map_block_function`
+
+        Returns
+        -------
+        bool
+            Whether or not _map_block_function has been overridden
+        """
+        return type(self)._map_block_function is not Process._map_block_function
+
+    def __get_batch_end(self, start_pos):
+        """
+        Returns the (exclusive) index within the list of pending jobs at which the batch starting at the provided
+        index should end
+
+        Parameters
+        ----------
+        start_pos : uint
+            Index within the list of pending jobs where the batch starts
+
+        Returns
+        -------
+        end_pos : uint
+            Index within the list of pending jobs where the batch ends
+        """
+        end_pos = int(min(self.__rank_end_pos, start_pos + self.__get_batch_size()))
+        if end_pos < self.__rank_end_pos:
+            end_pos = self.__snap_to_chunks(start_pos, end_pos)
+        return end_pos
+
+    def __get_batch_size(self):
+        """
+        Returns the maximum number of positions that can be computed in a single batch
+
+        Returns
+        -------
+        pos_per_batch : uint
+            Maximum number of positions in a batch
+        """
+        pos_per_batch = self._max_pos_per_read
+        if self.__tuned_batch_size is not None:
+            pos_per_batch = min(pos_per_batch, self.__tuned_batch_size)
+        if self.__batch_limit is not None:
+            pos_per_batch = min(pos_per_batch, self.__batch_limit)
+        if self.__node_comm is not None:
+            # Batches are read on behalf of all ranks on this socket
+            pos_per_batch *= self.__node_comm.Get_size()
+        return pos_per_batch
+
+    def __get_next_batch_bounds(self, start_pos):
+        """
+        Returns the bounds of the next batch this rank should compute. When scheduling dynamically, this claims the
+        batch from the counter shared by all ranks.
+
+        Parameters
+        ----------
+        start_pos : uint
+            Index within the list of pending jobs where the next batch would start if scheduling statically
+
+        Returns
+        -------
+        bounds : tuple or None
+            Indices within the list of pending jobs where the next batch starts and ends (exclusive).
+            None if this rank has no more positions to compute
+        """
+        if self.__job_counter is None:
+            if start_pos >= self.__rank_end_pos:
+                return None
+            return start_pos, self.__get_batch_end(start_pos)
+
+        pos_per_batch = self.__get_batch_size()
+        chunk_rows = self.__get_chunk_rows()
+        if pos_per_batch > chunk_rows:
+            # Claims that are multiples of the chunk size keep batches from sharing chunks
+            pos_per_batch -= pos_per_batch % chunk_rows
+        start_pos = self.__job_counter.fetch_and_add(pos_per_batch)
+        if start_pos >= self._compute_jobs.size:
+            return None
+        return start_pos, int(min(start_pos + pos_per_batch, self._compute_jobs.size))
+
+    def __snap_to_chunks(self, start_pos, end_pos):
+        """
+        Moves the end of a batch back such that the batch does not end in the middle of a chunk of the HDF5 dataset.
+        Otherwise, the same (compressed) chunk would need to be read and decompressed again for the next batch.
+        The end is left as is if the batch is smaller than a chunk.
+
+        Parameters
+        ----------
+        start_pos : uint
+            Index within the list of pending jobs where the batch starts
+        end_pos : uint
+            Index within the list of pending jobs where the batch would end (exclusive) if chunks were ignored
+
+        Returns
+        -------
+        end_pos : uint
+            Index within the list of pending jobs where the batch should end
+        """
+        chunk_rows = self.__get_chunk_rows()
+        if chunk_rows <= 1 or end_pos >= self._compute_jobs.size:
+            return end_pos
+        # The first position of the chunk containing the first position of the next batch:
+        next_pos = self._compute_jobs[end_pos]
+        chunk_start = next_pos - next_pos % chunk_rows
+        snapped_end = self._compute_jobs.searchsorted(chunk_start)
+        if snapped_end > start_pos:
+            return snapped_end
+        return end_pos
+
+    def __get_chunk_rows(self):
+        """
+        Returns the number of positions in each chunk of the source dataset
+
+        Returns
+        -------
+        chunk_rows : uint
+            Number of positions in each chunk. 1 if the dataset is not chunked
+        """
+        if self.h5_main.chunks is None:
+            return 1
+        return self.h5_main.chunks[0]
+
+    def __straddles_chunk(self, end_pos):
+        """
+        Checks whether the batch ending at the provided index shares a chunk of the source dataset with the next one
+
+        Parameters
+        ----------
+        end_pos : uint
+            Index within the list of pending jobs where the batch ends (exclusive)
+
+        Returns
+        -------
+        straddles : bool
+            Whether or not the last position of this batch and the first position of the next batch lie in the same
+            chunk
+        """
+        chunk_rows = self.__get_chunk_rows()
+        if chunk_rows <= 1 or end_pos <= 0 or end_pos >= self._compute_jobs.size:
+            return False
+        return self._compute_jobs[end_pos - 1] // chunk_rows == self._compute_jobs[end_pos] // chunk_rows
+
+    def __prefetch_next_batch(self):
+        """
+        Starts reading the batch that follows the current batch in a background thread
+        """
+        bounds = self.__get_next_batch_bounds(self.__end_pos)
+        if bounds is None:
+            return
+        start_pos, end_pos = bounds
+        if self.verbose:
+            print('Rank {} prefetching positions {} to {} of the pending jobs'.format(self.mpi_rank, start_pos,
+                                                                                     end_pos))
+        self.__prefetched = _BackgroundRead(self.h5_main, self._compute_jobs[start_pos: end_pos], start_pos,
+                                            end_pos, tracer=self._tracer)
+
+    def __discard_prefetched(self):
+        """
+        Waits for and discards any batch that was being read in the background
+        """
+        if self.__prefetched is not None:
+            self.__prefetched.join()
+            self.__prefetched = None
+
     def _read_data_chunk(self):
         """
         Reads a chunk of data for the intended computation into memory
         """
-        if self.__start_pos < self.__rank_end_pos:
-            self.__end_pos = int(min(self.__rank_end_pos, self.__start_pos + self._max_pos_per_read))
+        if self.__node_comm is not None:
+            self.__scatter_node_batch()
+            return
+        self.__read_batch()
+
+    def __scatter_node_batch(self):
+        """
+        Reads the next batch of all ranks on this socket on the socket master rank and hands each rank its share
+        """
+        node_size = self.__node_comm.Get_size()
+        parts = None
+        if self.__node_comm.Get_rank() == 0:
+            self.__read_batch()
+            parts = [None] * node_size
+            self.__node_batch = None
+            if self.data is not None:
+                # Lazily loaded batches are read here rather than by each rank
+                data = np.asarray(self.data)
+                self.__node_batch = (self.__pixels_in_batch, data)
+                bounds = [len(data) * ind // node_size for ind in range(node_size + 1)]
+                parts = [(self.__start_pos, self.__end_pos, self.__pixels_in_batch[start: end], data[start: end])
+                         for start, end in zip(bounds[:-1], bounds[1:])]
+
+        with self._tracer.span('scatter', batch=self.__start_pos) as span:
+            part = self.__node_comm.scatter(parts, root=0)
+            if part is not None:
+                span.bytes_read = part[-1].nbytes
+        if part is None:
+            if self.verbose:
+                print('Rank {} - Finished receiving all data!'.format(self.mpi_rank))
+            self.data = None
+            return
+        self.__start_pos, self.__end_pos, self.__pixels_in_batch, self.data = part
+        if self.verbose:
+            print('Rank {} received positions: {}'.format(self.mpi_rank, self.__pixels_in_batch))
+
+    def __gather_node_batch(self):
+        """
+        Collects the results of all ranks on this socket on the socket master rank
+
+        Returns
+        -------
+        batch : _BatchState or None
+            Positions, source data, and results of the batch of all ranks on this socket on the socket master rank.
+            None on all other ranks
+        """
+        with self._tracer.span('gather', batch=self.__start_pos):
+            parts = self.__node_comm.gather((self._results, self._failures), root=0)
+        if parts is None:
+            return None
+        failures = []
+        offset = 0
+        for part_results, part_failures in parts:
+            # Indices of failed positions are relative to the batch of each rank
+            failures += [(offset + index, error) for index, error in part_failures or []]
+            offset += len(part_results)
+        parts = [part for part, _ in parts if len(part) > 0]
+        if len(parts) > 0 and all([isinstance(part, np.ndarray) for part in parts]):
+            results = np.concatenate(parts, axis=0)
+        else:
+            results = [item for part in parts for item in part]
+        pixels, data = self.__node_batch
+        self.__node_batch = None
+        return _BatchState(pixels, data, results, self.__end_pos, failures=failures)
+
+    def __read_batch(self):
+        """
+        Reads the next batch of this rank from the file or from the batch prefetched in the background
+        """
+        prefetched = self.__prefetched
+        self.__prefetched = None
+        if prefetched is not None and self.__job_counter is None and prefetched.start_pos != self.__start_pos:
+            # The positions have been changed since this batch was requested
+            prefetched.join()
+            prefetched = None
+
+        if prefetched is None:
+            bounds = self.__get_next_batch_bounds(self.__start_pos)
+        else:
+            # Batches claimed from the shared counter must be computed
+            bounds = (prefetched.start_pos, prefetched.end_pos)
+
+        if bounds is not None:
+            self.__start_pos, self.__end_pos = bounds
 
             # DON'T DIRECTLY apply the start and end indices anymore to the h5 dataset. Find out what it means first
             self.__pixels_in_batch = self._compute_jobs[self.__start_pos: self.__end_pos]
 
             if self.verbose:
                 print('Rank {} will read positions: {}'.format(self.mpi_rank, self.__pixels_in_batch))
+                if self.__straddles_chunk(self.__end_pos):
+                    print('Rank {} - this batch ends in the middle of a chunk of {} positions. The chunk will be read '
+                          'again for the next batch. Consider allowing more memory per batch'
+                          '.'.format(self.mpi_rank, self.__get_chunk_rows()))
                 bytes_this_read = self.__bytes_per_pos * len(self.__pixels_in_batch)
                 print('Rank {} will read {} of the SOURCE dataset'
                       '.'.format(self.mpi_rank, format_size(bytes_this_read)))
@@ -583,9 +1503,25 @@ class Process(object):
                                      tot_workers,
                                      bytes_this_read * tot_workers))
 
-            self.data = self.h5_main[self.__pixels_in_batch, :]
+            if self.__lazy_source is not None:
+                # Read by the dask workers when the batch is computed
+                self.data = self.__lazy_source[self.__pixels_in_batch]
+            elif prefetched is None:
+                with self._tracer.span('read', batch=self.__start_pos) as span:
+                    self.data = self.h5_main[self.__pixels_in_batch, :]
+                    span.bytes_read = self.data.nbytes
+            else:
+                t_start = tm.time()
+                with self._tracer.span('read_wait', batch=self.__start_pos):
+                    self.data = prefetched.get_data()
+                if self.verbose:
+                    print('Rank {} waited {} for the prefetched batch'.format(self.mpi_rank,
+                                                                             format_time(tm.time() - t_start)))
             # DON'T update the start position
 
+            if self._prefetch:
+                self.__prefetch_next_batch()
+
         else:
             if self.verbose:
                 print('Rank {} - Finished reading all data!'.format(self.mpi_rank))
@@ -601,6 +1537,225 @@ class Process(object):
         # This line can remain as is
         raise NotImplementedError('Please override the _set_results specific to your process')
 
+    def __commit_batch(self, batch, write_times):
+        """
+        Writes the results of the provided batch and flushes the file if the flush policy calls for it. Positions are
+        only marked as completed once they have been flushed. This may be called from the thread writing results in
+        the background.
+
+        Parameters
+        ----------
+        batch : _BatchState
+            Positions, source data, and results of the batch to write
+        write_times : SimpleFIFO
+            Moving average of the time taken to write a single position
+        """
+        t_start = tm.time()
+        with self.__commit_lock:
+            self.__commit_batch_locked(batch)
+        dump_time = tm.time() - t_start
+        write_times.put(dump_time / len(batch.pixels))
+
+        if self.verbose:
+            print('Rank {} - wrote its {} pixel chunk in {}'.format(self.mpi_rank,
+                                                                    len(batch.pixels),
+                                                                    format_time(dump_time)))
+
+    def __commit_batch_locked(self, batch):
+        """
+        Writes the results of the provided batch, marks its positions, and flushes the file if the flush policy calls
+        for it when not computing via MPI. Expects the caller to hold the lock for committing batches.
+
+        Parameters
+        ----------
+        batch : _BatchState
+            Positions, source data, and results of the batch to write
+        """
+        batch_id = batch.end_pos - len(batch.pixels)
+        failed = np.array([index for index, _ in batch.failures or []], dtype=np.int64)
+        self.__thread_batch.batch = batch
+        try:
+            # Nothing can be written if every position failed and there were no preallocated results to stand in
+            if failed.size == 0 or failed.size < len(batch.pixels) or isinstance(batch.results, np.ndarray):
+                with self._tracer.span('write', batch=batch_id) as span:
+                    self._write_results_chunk()
+                    if self._tracer.enabled:
+                        span.bytes_written = get_nbytes(batch.results)
+        finally:
+            self.__thread_batch.batch = None
+
+        # All ranks should mark the pixels for this batch as completed. 'last_pixel' attribute will be updated later
+        # These positions will only be written to the status dataset after the results have been flushed
+        pixels = np.asarray(batch.pixels)
+        if failed.size > 0:
+            self._status_tracker.mark(np.delete(pixels, failed), STATUS_COMPLETED)
+            self._status_tracker.mark(pixels[failed], STATUS_FAILED)
+            self.__failure_records += [(pixels[index], error) for index, error in batch.failures]
+        else:
+            self._status_tracker.mark(pixels, STATUS_COMPLETED)
+        self.__batches_since_flush += 1
+
+        # Child classes don't even have to worry about flushing. Process will do it.
+        # Ranks decide together when to flush via __sync_flush() since flushing is a collective operation via MPI
+        if self.mpi_comm is None and self.__flush_due():
+            self.__flush_results(end_pos=batch.end_pos, batch_id=batch_id)
+
+    def __flush_due(self):
+        """
+        Returns whether or not the flush policy calls for flushing the results written thus far
+
+        Returns
+        -------
+        due : bool
+            Whether flush_every batches have been written or flush_interval has elapsed since the last flush
+        """
+        if self.__flush_every is not None and self.__batches_since_flush >= self.__flush_every:
+            return True
+        return self.__flush_interval is not None and tm.time() - self.__last_flush_time >= self.__flush_interval
+
+    def __sync_flush(self, active, batch_id=None):
+        """
+        Decides together with all other ranks whether or not to flush the results written thus far and flushes them if
+        so. Flushing a file opened via the mpio driver is a collective operation. Therefore, every rank calls this
+        once per batch while any rank still has batches to compute, even if it has no batches left or does not write
+        its own results when aggregating I/O. Results are flushed once any rank has written flush_every batches since
+        the last flush, or once flush_interval has elapsed per the clock of rank 0.
+
+        Parameters
+        ----------
+        active : bool
+            Whether or not this rank has just computed a batch
+        batch_id : uint, optional
+            Identifier for the last batch computed by this rank
+
+        Returns
+        -------
+        any_active : bool
+            Whether or not any rank has just computed a batch
+        """
+        with self.__commit_lock:
+            due = self.__flush_every is not None and self.__batches_since_flush >= self.__flush_every
+        if self.mpi_rank == 0 and self.__flush_interval is not None:
+            due = due or tm.time() - self.__last_flush_time >= self.__flush_interval
+        flags = np.array([due, active], dtype=np.int32)
+        totals = np.zeros_like(flags)
+        with self._tracer.span('barrier', batch=batch_id):
+            self.mpi_comm.Allreduce(flags, totals)
+        if totals[0] > 0:
+            with self.__commit_lock:
+                self.__flush_results(batch_id=batch_id)
+        return totals[1] > 0
+
+    def __flush_results(self, end_pos=None, batch_id=None):
+        """
+        Flushes all results written thus far to the file and only then writes the positions of these results to the
+        status dataset. Computations resumed later therefore never trust results that may not have reached the file.
+        The status dataset itself reaches the file with the next flush.
+
+        Parameters
+        ----------
+        end_pos : uint, optional
+            Index within the list of pending jobs where the last written batch ends. Used to update the legacy
+            'last_pixel' attribute
+        batch_id : uint, optional
+            Identifier for the last written batch
+        """
+        # Leaving in this provision that will allow restarting of processes
+        if self.mpi_size == 1 and end_pos is not None:
+            self.h5_results_grp.attrs['last_pixel'] = end_pos
+        with self._tracer.span('flush', batch=batch_id):
+            self.h5_main.file.flush()
+        # Consecutive positions are written together
+        with self._tracer.span('status', batch=batch_id) as span:
+            span.bytes_written = self._status_tracker.num_marked
+            self._status_tracker.commit()
+        if self.mpi_comm is None:
+            # Ranks only record failures together once all positions have been computed
+            self.__write_failures()
+        self.__batches_since_flush = 0
+        self.__last_flush_time = tm.time()
+        if self.verbose:
+            print('Rank {} - flushed results to the file'.format(self.mpi_rank))
+
+    def __write_failures(self):
+        """
+        Writes the positions that failed since the last call along with their errors to the dataset of failures in the
+        results group, which is only created once a position fails. Earlier records of positions that have since been
+        computed successfully, or that failed again, are dropped so that the dataset holds one record per position
+        that is currently marked as failed. This is a collective operation when computing via MPI.
+        """
+        records = self.__failure_records
+        self.__failure_records = []
+        if self.mpi_comm is not None:
+            records = [item for part in self.mpi_comm.allgather(records) for item in part]
+        h5_failures = None
+        if self._failures_dset_name in self.h5_results_grp.keys():
+            h5_failures = self.h5_results_grp[self._failures_dset_name]
+        if h5_failures is None and len(records) == 0:
+            return
+
+        failures = np.array([(position, error.encode('utf-8', 'replace')[:FAILURE_DTYPE['Error'].itemsize])
+                             for position, error in records], dtype=FAILURE_DTYPE)
+        if h5_failures is not None and h5_failures.shape[0] > 0:
+            earlier = h5_failures[()]
+            positions = np.unique(earlier['Position']).astype(np.int64)
+            still_failed = positions[self._h5_status_dset[positions] == STATUS_FAILED]
+            keep = np.isin(earlier['Position'], still_failed) & ~np.isin(earlier['Position'], failures['Position'])
+            failures = np.concatenate([earlier[keep], failures])
+        failures = failures[np.argsort(failures['Position'], kind='mergesort')]
+
+        if h5_failures is None:
+            h5_failures = self.h5_results_grp.create_dataset(self._failures_dset_name, shape=(0,), maxshape=(None,),
+                                                             dtype=FAILURE_DTYPE, chunks=(1024,))
+        h5_failures.resize((failures.shape[0],))
+        if self.mpi_rank == 0 and failures.shape[0] > 0:
+            h5_failures[:] = failures
+
+    def _process_batch(self, pixels, data, *args, **kwargs):
+        """
+        Computes and writes the results for the provided batch of positions without flushing the file or marking the
+        positions as completed. Used by :class:`~pyUSID.processing.pipeline.ProcessPipeline` to drive this process one
+        batch at a time.
+
+        Parameters
+        ----------
+        pixels : :class:`numpy.ndarray`
+            1D array of sorted unsigned integers denoting the positions in this batch
+        data : :class:`numpy.ndarray`
+            2D array with the source data for these positions
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
+        self.__thread_batch.batch = _BatchState(pixels, data, None, None)
+        try:
+            self._unit_computation(*args, **kwargs)
+            self._write_results_chunk()
+        finally:
+            self.__thread_batch.batch = None
+
+    def _complete_results(self):
+        """
+        Records that all positions have been computed once results were computed batch by batch via
+        _process_batch(), such that the results group is found as a duplicate by later computations. Used by
+        :class:`~pyUSID.processing.pipeline.ProcessPipeline`
+        """
+        self.h5_results_grp.attrs['last_pixel'] = self.h5_main.shape[0]
+        self.__index_results(self.h5_results_grp, complete=True)
+
+    def _get_bytes_per_pos(self):
+        """
+        Returns the memory that each position in a batch is expected to occupy, including results, prefetched
+        positions and positions waiting to be written
+
+        Returns
+        -------
+        bytes_per_pos : float
+            Size in bytes
+        """
+        return self.__bytes_per_pos
+
     def _create_results_datasets(self):
         """
         Process specific call that will write the h5 group, guess dataset, corresponding spectroscopic datasets and also
@@ -633,6 +1788,7 @@ class Process(object):
                 completed_pixels = self.h5_results_grp.attrs['last_pixel']
                 if completed_pixels > 0:
                     self._h5_status_dset[:completed_pixels] = 1
+        self._status_tracker = CompletionTracker(self._h5_status_dset)
 
     def _get_existing_datasets(self):
         """
@@ -648,13 +1804,217 @@ class Process(object):
         """
         # TODO: Try to use the functools.partials to preconfigure the map function
         # cores = number of processes / rank here
+        if self._dask_scheduler is not None:
+            if self.verbose and self.mpi_rank == 0:
+                print("Rank {} at Process class' default _unit_computation() that "
+                      "will call dask_compute()".format(self.mpi_rank))
+            if self._uses_block_function():
+                func = self._map_block_function
+            else:
+                func = self._map_function
+            results = comp_utils.dask_compute(self.data, func, scheduler=self._dask_scheduler, cores=self._cores,
+                                              block_function=self._uses_block_function(), func_args=args,
+                                              func_kwargs=kwargs, verbose=self.verbose)
+            self._results = self.__fill_results(results, self._allocate_results(self.data.shape[0]))
+            return
+        if self._uses_block_function():
+            if self.verbose and self.mpi_rank == 0:
+                print("Rank {} at Process class' default _unit_computation() that "
+                      "will call parallel_compute_blocks()".format(self.mpi_rank))
+            results = comp_utils.parallel_compute_blocks(self.data, self._map_block_function, cores=self._cores,
+                                                         func_args=args, func_kwargs=kwargs, verbose=self.verbose,
+                                                         pool=self._worker_pool, backend=self._backend)
+            self._results = self.__fill_results(results, self._allocate_results(self.data.shape[0]))
+            return
         if self.verbose and self.mpi_rank == 0:
             print("Rank {} at Process class' default _unit_computation() that "
                   "will call parallel_compute()".format(self.mpi_rank))
-        self._results = parallel_compute(self.data, self._map_function, cores=self._cores,
-                                         lengthy_computation=False,
-                                         func_args=args, func_kwargs=kwargs,
-                                         verbose=self.verbose)
+        out = self._allocate_results(self.data.shape[0])
+        if self.__isolate_failures:
+            # Failures can only be told apart from results in a list
+            results = comp_utils.parallel_compute(self.data, comp_utils.isolate_failures(self._map_function),
+                                                  cores=self._cores, lengthy_computation=False,
+                                                  func_args=args, func_kwargs=kwargs,
+                                                  verbose=self.verbose, pool=self._worker_pool, backend=self._backend)
+            self._results = self.__separate_failures(results, out)
+            return
+        self._results = comp_utils.parallel_compute(self.data, self._map_function, cores=self._cores,
+                                                    lengthy_computation=False,
+                                                    func_args=args, func_kwargs=kwargs,
+                                                    verbose=self.verbose, pool=self._worker_pool,
+                                                    shared_memory=self._shared_memory, backend=self._backend,
+                                                    out=out)
+
+    @staticmethod
+    def __fill_results(results, out):
+        """
+        Copies the results of the positions in the batch into the array preallocated by _allocate_results(), so that
+        _write_results_chunk() receives the same kind of results regardless of how they were computed
+
+        Parameters
+        ----------
+        results : list or numpy.ndarray
+            Results of each position, or results of all positions stacked along the first axis
+        out : numpy.ndarray or None
+            Preallocated array with one entry per position. The results are returned as they are if None
+
+        Returns
+        -------
+        results : list or numpy.ndarray
+            out if it was provided
+        """
+        if out is None:
+            return results
+        if isinstance(results, np.ndarray):
+            if results.size != out.size:
+                raise ValueError('Results of shape {} cannot be held in an array of shape {}. Please check '
+                                 'results_shape'.format(results.shape, out.shape))
+            out[...] = results.reshape(out.shape)
+            return out
+        for index, result in enumerate(results):
+            out[index] = result
+        return out
+
+    def __separate_failures(self, results, out=None):
+        """
+        Moves the errors of positions whose computation failed from the provided results to self._failures and
+        stands in zeros shaped like the results of the other positions for them, so that _write_results_chunk() need
+        not know about failures
+
+        Parameters
+        ----------
+        results : list
+            Results of each position in the batch, some of which may be
+            :class:`~pyUSID.processing.comp_utils.RowFailure` objects
+        out : numpy.ndarray, optional
+            Preallocated array that the results of the positions that did not fail will be written into
+
+        Returns
+        -------
+        results : list or numpy.ndarray
+            Results of each position. out if it was provided. Failed positions are left as None if every position in
+            the batch failed and out was not provided
+        """
+        failed = [index for index, result in enumerate(results) if isinstance(result, comp_utils.RowFailure)]
+        self._failures = [(index, results[index].error) for index in failed]
+        if self.verbose and len(failed) > 0:
+            print('Rank {} - computation failed for {} of the {} positions in this batch'
+                  '.'.format(self.mpi_rank, len(failed), len(results)))
+        if out is not None:
+            for index, result in enumerate(results):
+                if not isinstance(result, comp_utils.RowFailure):
+                    out[index] = result
+            return out
+        if len(failed) == 0:
+            return results
+        template = next((result for result in results if not isinstance(result, comp_utils.RowFailure)), None)
+        fill = None if template is None else _zeros_like(template)
+        return [fill if isinstance(result, comp_utils.RowFailure) else result for result in results]
+
+    def _allocate_results(self, num_pos):
+        """
+        Preallocates the array that the workers will write the results of a batch into, based on results_shape and
+        results_dtype. Complex and compound data types are supported. _map_function should return a tuple per position
+        for compound data types. The array is handed to _write_results_chunk() via self._results and can be written to
+        the file without any copies via :meth:`~pyUSID.processing.process.Process._write_results_direct`
+
+        Parameters
+        ----------
+        num_pos : uint
+            Number of positions in the batch
+
+        Returns
+        -------
+        out : numpy.ndarray or None
+            Array of shape (num_pos,) + results_shape. None if results_dtype has not been set, in which case the
+            results are returned as a list
+        """
+        if self.results_dtype is None:
+            return None
+        return comp_utils.allocate_results(num_pos, shape=self.results_shape, dtype=self.results_dtype)
+
+    def _write_results_direct(self, h5_dset):
+        """
+        Writes the results of the current batch into the rows of the provided dataset that correspond to the
+        positions in this batch. Results held in a numpy array, such as the one made by _allocate_results(), are
+        written via :meth:`h5py.Dataset.write_direct` without being copied. Lists of results are first stacked into
+        an array. Datasets that a :class:`~pyUSID.processing.pipeline.ProcessPipeline` holds in memory are written
+        to via indexing instead. Intended to be called from _write_results_chunk()
+
+        Parameters
+        ----------
+        h5_dset : :class:`h5py.Dataset`
+            Dataset with one row per position in the source dataset. The results of each position should be of the
+            same size as a row of this dataset
+        """
+        direct = isinstance(h5_dset, h5py.Dataset)
+        # Stand-ins for datasets used by ProcessPipeline hold the HDF5 dataset as an attribute
+        if not direct and not isinstance(getattr(h5_dset, 'h5_dset', None), h5py.Dataset):
+            raise TypeError('h5_dset should be a h5py.Dataset object')
+        pixels = self._get_pixels_in_current_batch()
+        if len(pixels) == 0:
+            return
+        results = self._results
+        if not isinstance(results, np.ndarray):
+            results = np.array(results)
+        # Reshaping and ensuring a contiguous layout do not copy arrays that were preallocated
+        results = np.ascontiguousarray(results.reshape((len(pixels),) + h5_dset.shape[1:]))
+        # Batches of pending positions may skip positions that were already computed
+        starts, stops = values_to_runs(pixels)
+        offset = 0
+        for start, stop in zip(starts, stops):
+            if direct:
+                h5_dset.write_direct(results, source_sel=np.s_[offset: offset + stop - start],
+                                     dest_sel=np.s_[start: stop])
+            else:
+                h5_dset[start: stop] = results[offset: offset + stop - start]
+            offset += stop - start
+
+    def _prepare_results(self, override=False):
+        """
+        Finds previously computed results, or prepares the HDF5 group and datasets that will hold the results along
+        with the dataset that tracks which positions have been computed.
+
+        Parameters
+        ----------
+        override : bool, optional. default = False
+            Set to True to ignore previously computed results and prepare for a fresh computation
+
+        Returns
+        -------
+        h5_duplicate_grp : :class:`h5py.Group` or None
+            Group containing complete results from a prior computation with the same parameters. None if results
+            still need to be computed
+        """
+        if not override:
+            if len(self.duplicate_h5_groups) > 0:
+                if self.mpi_rank == 0:
+                    print('Returned previously computed results at ' + self.duplicate_h5_groups[-1].name)
+                return self.duplicate_h5_groups[-1]
+            elif len(self.partial_h5_groups) > 0:
+                if self.mpi_rank == 0:
+                    print('Resuming computation in group: ' + self.partial_h5_groups[-1].name)
+                self.use_partial_computation()
+
+        resuming = False
+        if self.h5_results_grp is None:
+            # starting fresh
+            if self.verbose and self.mpi_rank == 0:
+                print('Creating HDF5 group and datasets to hold results')
+            self._create_results_datasets()
+        else:
+            # resuming from previous checkpoint
+            resuming = True
+            self._get_existing_datasets()
+
+        self.__create_compute_status_dataset()
+        self.__index_results(self.h5_results_grp)
+
+        if resuming and self.mpi_rank == 0:
+            percent_complete = int(100 * self._status_tracker.count(STATUS_COMPLETED) / self._h5_status_dset.shape[0])
+            print('Resuming computation. {}% completed already'.format(percent_complete))
+
+        return None
 
     def compute(self, override=False, *args, **kwargs):
         """
@@ -669,13 +2029,99 @@ class Process(object):
         args : list
             arguments to the mapped function in the correct order
         kwargs : dict
-            keyword arguments to the mapped function
+            keyword arguments to the mapped function. The following keyword arguments are used by compute() itself
+            and are not passed on:
+
+            schedule : str, optional
+                How positions are distributed among MPI ranks. "static" (default) assigns each rank a contiguous
+                block of positions upfront. "dynamic" has ranks claim batches from a counter shared via one-sided MPI
+                communication as and when they need them, so that ranks with cheaper positions compute more of them.
+
+            checkpoint_interval : float, optional
+                Approximate time in seconds between successive writes of results (checkpoints) to the file. The
+                number of positions per batch will be adjusted on the fly based on how long it takes to compute and
+                write each position without exceeding the limits imposed by the memory. By default, each batch is
+                as large as the memory permits.
+
+            flush_every : uint, optional
+                Number of batches after which results are flushed to the file. Default - 1 - every batch. Set to None
+                to flush based only on flush_interval. If both are None, results are only flushed at the end. Fewer
+                flushes are faster, especially on parallel file systems, but more positions may need to be computed
+                again if the computation is interrupted, since positions are only marked as completed once their
+                results have been flushed. Via MPI, flushing is a collective operation, so all ranks flush together
+                once any rank has written this many batches since the last flush. Ranks that have run out of batches
+                keep taking part in these flushes until all ranks are done.
+
+            flush_interval : float, optional
+                Time in seconds after which results are flushed to the file, whether or not flush_every batches have
+                been written. By default, flushes do not depend on time. Via MPI, only the clock of rank 0 is
+                consulted and all ranks flush together at the end of the batch during which the interval elapsed.
+
+            trace : bool or :class:`~pyUSID.processing.trace_utils.Tracer`, optional
+                Whether or not to record the time spent by this rank reading, computing, writing, flushing, updating
+                the status of, and waiting at barriers for each batch, along with the time spent scattering and
+                gathering each batch within a socket when aggregating I/O. Default - False. The recorded timeline is
+                available via :attr:`~pyUSID.processing.process.Process.tracer` and can be exported as a Chrome trace
+                or summarized as a table. A Tracer object may be provided to accumulate spans over multiple calls.
+
+            isolate_failures : bool, optional
+                Whether or not exceptions raised by _map_function for single positions, such as a fit diverging, are
+                recorded instead of aborting the computation. Failed positions are marked with
+                :data:`~pyUSID.processing.status_utils.STATUS_FAILED` in the status dataset, zeros are written in place
+                of their results, and their errors are recorded in the "failed_positions" dataset in the results
+                group. Results are then gathered as a list rather than written into shared memory. Not supported with
+                a dask scheduler or a block function, and has no effect if _unit_computation() is overridden.
+                Default - False
+
+            retry_failed : bool, optional
+                Whether or not to compute the positions that failed in an earlier call with isolate_failures again,
+                along with any positions that were never computed. Default - False. Results groups with failed
+                positions are never treated as complete and are resumed by compute() as usual
 
         Returns
         -------
         h5_results_grp : :class:`h5py.Group`
             Group containing all the results
         """
+        schedule = kwargs.pop('schedule', 'static')
+        if not isinstance(schedule, (str, unicode)):
+            raise TypeError('schedule should be a string')
+        if schedule not in ['static', 'dynamic']:
+            raise ValueError('schedule should be either "static" or "dynamic"')
+        checkpoint_interval = kwargs.pop('checkpoint_interval', None)
+        if checkpoint_interval is not None:
+            if not isinstance(checkpoint_interval, Number) or isinstance(checkpoint_interval, (bool, complex)):
+                raise TypeError('checkpoint_interval should be a positive number')
+            if checkpoint_interval <= 0:
+                raise ValueError('checkpoint_interval should be a positive number')
+        flush_every = kwargs.pop('flush_every', 1)
+        if flush_every is not None:
+            if not isinstance(flush_every, int) or isinstance(flush_every, bool):
+                raise TypeError('flush_every should be a positive integer')
+            if flush_every < 1:
+                raise ValueError('flush_every should be a positive integer')
+        flush_interval = kwargs.pop('flush_interval', None)
+        if flush_interval is not None:
+            if not isinstance(flush_interval, Number) or isinstance(flush_interval, (bool, complex)):
+                raise TypeError('flush_interval should be a positive number')
+            if flush_interval <= 0:
+                raise ValueError('flush_interval should be a positive number')
+        isolate_failures = kwargs.pop('isolate_failures', False)
+        if not isinstance(isolate_failures, bool):
+            raise TypeError('isolate_failures should be a boolean value')
+        if isolate_failures and (self._dask_scheduler is not None or self._uses_block_function()):
+            raise ValueError('isolate_failures is only supported when positions are computed one at a time via '
+                             '_map_function without dask')
+        retry_failed = kwargs.pop('retry_failed', False)
+        if not isinstance(retry_failed, bool):
+            raise TypeError('retry_failed should be a boolean value')
+        trace = kwargs.pop('trace', False)
+        if isinstance(trace, bool):
+            self._tracer = Tracer(rank=self.mpi_rank, enabled=trace)
+        elif isinstance(trace, Tracer):
+            self._tracer = trace
+        else:
+            raise TypeError('trace should be a boolean value or a Tracer object')
 
         class SimpleFIFO(object):
             """
@@ -723,8 +2169,10 @@ class Process(object):
                 Returns
                 -------
                 avg : number.Number
-                    Mean of all elements within the queue
+                    Mean of all elements within the queue. 0 if the queue is empty
                 """
+                if len(self.__queue) == 0:
+                    return 0
                 return np.mean(self.__queue)
 
             def get_cycles(self):
@@ -738,42 +2186,42 @@ class Process(object):
                 """
                 return self.__count
 
-        if not override:
-            if len(self.duplicate_h5_groups) > 0:
-                if self.mpi_rank == 0:
-                    print('Returned previously computed results at ' + self.duplicate_h5_groups[-1].name)
-                return self.duplicate_h5_groups[-1]
-            elif len(self.partial_h5_groups) > 0:
-                if self.mpi_rank == 0:
-                    print('Resuming computation in group: ' + self.partial_h5_groups[-1].name)
-                self.use_partial_computation()
+        h5_duplicate_grp = self._prepare_results(override=override)
+        if h5_duplicate_grp is not None:
+            return h5_duplicate_grp
 
-        resuming = False
-        if self.h5_results_grp is None:
-            # starting fresh
-            if self.verbose and self.mpi_rank == 0:
-                print('Creating HDF5 group and datasets to hold results')
-            self._create_results_datasets()
-        else:
-            # resuming from previous checkpoint
-            resuming = True
-            self._get_existing_datasets()
+        if self._mem_calibration is not None:
+            self.h5_results_grp.attrs.update(self._mem_calibration)
+        if self._autotune is not None:
+            self.h5_results_grp.attrs.update(self._autotune)
 
-        self.__create_compute_status_dataset()
+        # Start with a small batch to time the computation if batches need to be sized for checkpointing
+        self.__batch_limit = None
+        if checkpoint_interval is not None:
+            self.__batch_limit = self._cores
 
-        if resuming and self.mpi_rank == 0:
-            percent_complete = int(100 * len(np.where(self._h5_status_dset[()] == 1)[0]) /
-                                   self._h5_status_dset.shape[0])
-            print('Resuming computation. {}% completed already'.format(percent_complete))
+        self.__job_counter = None
+        if schedule == 'dynamic':
+            self.__job_counter = SharedCounter(self.mpi_comm)
+
+        self.__flush_every = flush_every
+        self.__flush_interval = flush_interval
+        self.__isolate_failures = isolate_failures
+        self.__retry_failed = retry_failed
+        self.__failure_records = []
+        self.__batches_since_flush = 0
+        self.__last_flush_time = tm.time()
 
         self.__assign_job_indices()
 
         # Not sure if this is necessary but I don't think it would hurt either
         if self.mpi_comm is not None:
-            self.mpi_comm.barrier()
+            with self._tracer.span('barrier'):
+                self.mpi_comm.barrier()
 
         compute_times = SimpleFIFO(5)
         write_times = SimpleFIFO(5)
+        queue_depths = SimpleFIFO(5)
         orig_rank_start = self.__start_pos
 
         if self.mpi_rank == 0 and self.mpi_size == 1:
@@ -790,86 +2238,361 @@ class Process(object):
             print('Rank: {} - with nothing loaded has {} free memory'
                   ''.format(self.mpi_rank, format_size(get_available_memory())))
 
-        self._read_data_chunk()
+        # The same workers will be used for all batches. Dask manages its own workers
+        if self._dask_scheduler is not None:
+            self._worker_pool = None
+        elif self.__external_pool is None:
+            self._worker_pool = WorkerPool(cores=self._cores, backend=self._backend)
+        else:
+            self._worker_pool = self.__external_pool
+        if self._worker_pool is not None:
+            startup_time = self._worker_pool.start()
+            if self.verbose:
+                print('Rank {} - pool of {} workers took {} to start'.format(self.mpi_rank, self._worker_pool.cores,
+                                                                           format_time(startup_time)))
+
+        writer = None
+        if self._write_behind > 0:
+            writer = _BatchWriter(lambda batch: self.__commit_batch(batch, write_times), self._write_behind)
+
+        computed = False
+        try:
+            self._read_data_chunk()
+
+            if self.mpi_comm is not None:
+                with self._tracer.span('barrier'):
+                    self.mpi_comm.barrier()
+
+            if self.verbose and self.mpi_rank == self.__socket_master_rank:
+                print('Rank: {} - with only raw data loaded has {} free memory'
+                      ''.format(self.mpi_rank, format_size(get_available_memory())))
+
+            while self.data is not None:
+
+                num_jobs_in_batch = len(self.__pixels_in_batch)
+                batch_id = self.__start_pos
+
+                t_start_1 = tm.time()
+
+                self._failures = None
+                with self._tracer.span('compute', batch=batch_id):
+                    if num_jobs_in_batch > 0:
+                        self._unit_computation(*args, **kwargs)
+                    else:
+                        # Possible when a socket's batch is smaller than the number of ranks on it
+                        self._results = []
+
+                comp_time = tm.time() - t_start_1  # in seconds
+                time_per_pix = comp_time / max(1, num_jobs_in_batch)
+                compute_times.put(time_per_pix)
+
+                if self.verbose:
+                    mesg = 'Rank {} - computed chunk in {} or {} per pixel. Average: {} per pixel' \
+                           ''.format(self.mpi_rank, format_time(comp_time), format_time(time_per_pix),
+                                     format_time(compute_times.get_mean()))
+                    if writer is not None:
+                        queue_depths.put(writer.get_depth())
+                        mesg += '. {} batches waiting to be written. Average: {} batches' \
+                                ''.format(writer.get_depth(), np.round(queue_depths.get_mean(), decimals=1))
+                    print(mesg)
+
+                # Ranks can become memory starved. Check memory usage - raw data + results in memory at this point
+                if self.verbose and self.mpi_rank == self.__socket_master_rank:
+                    print('Rank: {} - now holding onto raw data + results has {} free memory'
+                          ''.format(self.mpi_rank, format_size(get_available_memory())))
+
+                if self.__node_comm is None:
+                    batch = _BatchState(self.__pixels_in_batch, self.data, self._results, self.__end_pos,
+                                        failures=self._failures)
+                else:
+                    batch = self.__gather_node_batch()
+
+                # NOW, update the positions. Users are NOT allowed to touch start and end pos
+                self.__start_pos = self.__end_pos
+
+                if batch is None:
+                    # Only the socket master rank writes results and marks positions as completed
+                    pass
+                elif writer is None:
+                    self.__commit_batch(batch, write_times)
+                else:
+                    # Positions will be marked as completed once the results have been written and flushed
+                    writer.put(batch)
+
+                if self.mpi_comm is not None:
+                    _ = self.__sync_flush(True, batch_id=batch_id)
+
+                time_remaining = (self.__rank_end_pos - self.__end_pos) * \
+                                 (compute_times.get_mean() + write_times.get_mean())
+                if self.__job_counter is not None:
+                    # Remaining positions will be shared by all ranks
+                    time_remaining /= self.mpi_size
+
+                if self.verbose or self.mpi_rank == 0:
+                    percent_complete = int(100 * (self.__end_pos - orig_rank_start) /
+                                           (self.__rank_end_pos - orig_rank_start))
+                    print('Rank {} - {}% complete. Time remaining: {}'.format(self.mpi_rank, percent_complete,
+                                                                              format_time(time_remaining)))
+
+                if checkpoint_interval is not None:
+                    self.__batch_limit = self.__get_checkpoint_batch_size(checkpoint_interval, num_jobs_in_batch,
+                                                                          compute_times.get_mean() +
+                                                                          write_times.get_mean())
+
+                self._read_data_chunk()
+
+            if self.mpi_comm is not None:
+                # Take part in the flushes of the ranks that are still computing
+                while self.__sync_flush(False):
+                    pass
+
+            computed = True
+        finally:
+            if self.__external_pool is None and self._worker_pool is not None:
+                self._worker_pool.shutdown()
+            self._worker_pool = None
+            if writer is not None:
+                # Wait for all results to be written before proceeding. Errors raised while writing must not mask an
+                # exception raised while computing
+                writer.close(raise_error=computed)
+            # test() and other calls to _unit_computation() outside compute() should raise as usual
+            self.__isolate_failures = False
+            self.__retry_failed = False
+
+        if self.verbose:
+            print('Rank {} - Finished computing all jobs!'.format(self.mpi_rank))
+            if self._tracer.enabled:
+                print('Rank {} - time spent in each step:\n{}'.format(self.mpi_rank, self._tracer.summary()))
+
+        if self.__job_counter is not None:
+            self.__job_counter.free()
+            self.__job_counter = None
+
+        # Make sure that the last results and then their status reach the file
+        self.__flush_results()
+        self.h5_main.file.flush()
 
         if self.mpi_comm is not None:
-            self.mpi_comm.barrier()
+            with self._tracer.span('barrier'):
+                self.mpi_comm.barrier()
+            self.__write_failures()
+            self.h5_main.file.flush()
 
-        if self.verbose and self.mpi_rank == self.__socket_master_rank:
-            print('Rank: {} - with only raw data loaded has {} free memory'
-                  ''.format(self.mpi_rank, format_size(get_available_memory())))
+        # Failed positions keep the results group from being considered complete
+        num_failed = self._status_tracker.count(STATUS_FAILED)
+        if self.mpi_rank == 0:
+            if num_failed > 0:
+                print('Finished processing the entire dataset but computation failed for {} positions. Their errors '
+                      'are in the "{}" dataset in {}. Call compute(retry_failed=True) to compute them again'
+                      '.'.format(num_failed, self._failures_dset_name, self.h5_results_grp.name))
+            else:
+                print('Finished processing the entire dataset!')
 
-        while self.data is not None:
+        # Update the legacy 'last_pixel' attribute here:
+        if self.mpi_rank == 0:
+            self.h5_results_grp.attrs['last_pixel'] = self.h5_main.shape[0]
 
-            num_jobs_in_batch = self.__end_pos - self.__start_pos
+        self.__index_results(self.h5_results_grp, complete=num_failed == 0)
 
-            t_start_1 = tm.time()
+        return self.h5_results_grp
 
-            self._unit_computation(*args, **kwargs)
 
-            comp_time = np.round(tm.time() - t_start_1, decimals=2)  # in seconds
-            time_per_pix = comp_time / num_jobs_in_batch
-            compute_times.put(time_per_pix)
+def _zeros_like(result):
+    """
+    Returns zeros of the same type, shape, and data type as the provided results of a single position
 
-            if self.verbose:
-                print('Rank {} - computed chunk in {} or {} per pixel. Average: {} per pixel'
-                      '.'.format(self.mpi_rank, format_time(comp_time), format_time(time_per_pix),
-                                 format_time(compute_times.get_mean())))
+    Parameters
+    ----------
+    result : object
+        Number, numpy array, or a tuple or list of these
 
-            # Ranks can become memory starved. Check memory usage - raw data + results in memory at this point
-            if self.verbose and self.mpi_rank == self.__socket_master_rank:
-                print('Rank: {} - now holding onto raw data + results has {} free memory'
-                      ''.format(self.mpi_rank, format_size(get_available_memory())))
+    Returns
+    -------
+    zeros : object
+        Zeros in the same form as result
+    """
+    if isinstance(result, (tuple, list)):
+        return type(result)([_zeros_like(item) for item in result])
+    if isinstance(result, np.ndarray):
+        return np.zeros_like(result)
+    return np.asarray(result).dtype.type(0)
 
-            t_start_2 = tm.time()
-            self._write_results_chunk()
 
-            # NOW, update the positions. Users are NOT allowed to touch start and end pos
-            self.__start_pos = self.__end_pos
-            # Leaving in this provision that will allow restarting of processes
-            if self.mpi_size == 1:
-                self.h5_results_grp.attrs['last_pixel'] = self.__end_pos
-            # Child classes don't even have to worry about flushing. Process will do it.
-            self.h5_main.file.flush()
+class _BatchState(object):
+    """
+    Positions, source data, and results of a single batch
+    """
 
-            dump_time = np.round(tm.time() - t_start_2, decimals=2)
-            write_times.put(dump_time / num_jobs_in_batch)
+    def __init__(self, pixels, data, results, end_pos, failures=None):
+        """
+        Parameters
+        ----------
+        pixels : :class:`numpy.ndarray`
+            1D array of unsigned integers denoting the positions in this batch
+        data : :class:`numpy.ndarray`
+            Source data for the positions in this batch
+        results : object
+            Results computed for the positions in this batch
+        end_pos : uint
+            Index within the list of pending jobs where this batch ends
+        failures : list of tuples, optional
+            Index within this batch and error of each position whose computation raised an exception
+        """
+        self.pixels = pixels
+        self.data = data
+        self.results = results
+        self.end_pos = end_pos
+        self.failures = failures
 
-            if self.verbose:
-                print('Rank {} - wrote its {} pixel chunk in {}'.format(self.mpi_rank,
-                                                                        num_jobs_in_batch,
-                                                                        format_time(dump_time)))
 
-            time_remaining = (self.__rank_end_pos - self.__end_pos) * \
-                             (compute_times.get_mean() + write_times.get_mean())
+class _BatchWriter(object):
+    """
+    Writes batches handed to it in a separate thread, holding on to no more than a fixed number of batches at a time
+    """
 
-            if self.verbose or self.mpi_rank == 0:
-                percent_complete = int(100 * (self.__end_pos - orig_rank_start) /
-                                       (self.__rank_end_pos - orig_rank_start))
-                print('Rank {} - {}% complete. Time remaining: {}'.format(self.mpi_rank, percent_complete,
-                                                                          format_time(time_remaining)))
+    def __init__(self, write_func, max_batches):
+        """
+        Starts the thread that writes batches
 
-            # All ranks should mark the pixels for this batch as completed. 'last_pixel' attribute will be updated later
-            # Setting each section to 1 independently
-            for curr_slice in integers_to_slices(self.__pixels_in_batch):
-                self._h5_status_dset[curr_slice] = 1
+        Parameters
+        ----------
+        write_func : callable
+            Function that writes a single batch
+        max_batches : uint
+            Maximum number of batches that are either waiting to be written or being written
+        """
+        self.__write_func = write_func
+        self.__queue = queue.Queue()
+        self.__slots = threading.BoundedSemaphore(max_batches)
+        self.__error = None
+        self.__error_raised = False
+        self.__thread = threading.Thread(target=self.__drain)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __drain(self):
+        while True:
+            batch = self.__queue.get()
+            if batch is None:
+                break
+            try:
+                # Don't bother writing anything after a failure
+                if self.__error is None:
+                    self.__write_func(batch)
+            except Exception as exp:
+                self.__error = exp
+            finally:
+                self.__slots.release()
+
+    def __raise_error(self):
+        if self.__error is not None:
+            self.__error_raised = True
+            raise self.__error
+
+    def get_depth(self):
+        """
+        Returns the number of batches waiting to be written
 
-            self._read_data_chunk()
+        Returns
+        -------
+        depth : uint
+            Number of batches waiting to be written
+        """
+        return self.__queue.qsize()
 
-        if self.verbose:
-            print('Rank {} - Finished computing all jobs!'.format(self.mpi_rank))
+    def put(self, batch):
+        """
+        Hands over a batch for writing. Blocks if the maximum number of batches are already being held
 
-        if self.mpi_comm is not None:
-            self.mpi_comm.barrier()
+        Parameters
+        ----------
+        batch : _BatchState
+            Batch to write
+        """
+        self.__raise_error()
+        self.__slots.acquire()
+        self.__queue.put(batch)
 
-        if self.mpi_rank == 0:
-            print('Finished processing the entire dataset!')
+    def close(self, raise_error=True):
+        """
+        Waits for all batches to be written and stops the thread. Errors encountered while writing are raised here
 
-        # Update the legacy 'last_pixel' attribute here:
-        if self.mpi_rank == 0:
-            self.h5_results_grp.attrs['last_pixel'] = self.h5_main.shape[0]
+        Parameters
+        ----------
+        raise_error : bool, optional. default = True
+            Whether or not to raise the error encountered while writing. Set to False when another exception is
+            already being raised, in which case the error is only reported as a warning
+        """
+        self.__queue.put(None)
+        self.__thread.join()
+        if raise_error:
+            self.__raise_error()
+        elif self.__error is not None and not self.__error_raised:
+            warn('Results could not be written in the background: {!r}'.format(self.__error))
 
-        return self.h5_results_grp
+
+class _BackgroundRead(object):
+    """
+    Reads a batch of positions from a HDF5 dataset in a separate thread
+    """
+
+    def __init__(self, h5_dset, pixels, start_pos, end_pos, tracer=None):
+        """
+        Starts reading the requested positions from the dataset
+
+        Parameters
+        ----------
+        h5_dset : :class:`h5py.Dataset`
+            Dataset to read from
+        pixels : :class:`numpy.ndarray`
+            1D array of sorted unsigned integers denoting the positions to read
+        start_pos : uint
+            Index within the list of pending jobs where this batch starts
+        end_pos : uint
+            Index within the list of pending jobs where this batch ends
+        tracer : :class:`~pyUSID.processing.trace_utils.Tracer`, optional
+            Tracer that will record the time taken to read this batch
+        """
+        self.pixels = pixels
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+        if tracer is None:
+            tracer = Tracer(enabled=False)
+        self.__tracer = tracer
+        self.__data = None
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__read, args=(h5_dset,))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __read(self, h5_dset):
+        try:
+            with self.__tracer.span('read', batch=self.start_pos) as span:
+                self.__data = h5_dset[self.pixels, :]
+                span.bytes_read = self.__data.nbytes
+        except Exception as exp:
+            # Raise this in the main thread instead
+            self.__error = exp
+
+    def join(self):
+        """
+        Waits for the read to complete
+        """
+        self.__thread.join()
+
+    def get_data(self):
+        """
+        Waits for the read to complete and returns the data
+
+        Returns
+        -------
+        data : :class:`numpy.ndarray`
+            2D array containing the requested positions of the dataset
+        """
+        self.join()
+        if self.__error is not None:
+            raise self.__error
+        return self.__data
 
 
 def parallel_compute(data, func, cores=1, lengthy_computation=False, func_args=None, func_kwargs=None, verbose=False):
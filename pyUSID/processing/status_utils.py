@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Utilities for keeping track of which positions have already been computed
+
+Created on Sat Oct 17 10:12:31 2026
+"""
+from __future__ import division, print_function, absolute_import
+import h5py
+import numpy as np
+
+__all__ = ['PendingPositions', 'CompletionTracker', 'values_to_runs', 'STATUS_PENDING', 'STATUS_COMPLETED',
+           'STATUS_FAILED', 'FAILURE_DTYPE']
+
+STATUS_PENDING = 0
+"""
+Status of positions that have not been computed yet
+"""
+
+STATUS_COMPLETED = 1
+"""
+Status of positions whose results have been computed and written to the file
+"""
+
+STATUS_FAILED = 2
+"""
+Status of positions whose computation raised an exception
+"""
+
+FAILURE_DTYPE = np.dtype([('Position', np.uint64), ('Error', 'S256')])
+"""
+Data type of the records of failed positions. Errors are truncated to 256 bytes so that records are of a fixed size,
+which keeps them writable via parallel HDF5
+"""
+
+
+def values_to_runs(values):
+    """
+    Converts a sorted 1D array of unique integers into runs of consecutive integers
+
+    Parameters
+    ----------
+    values : :class:`numpy.ndarray`
+        Sorted 1D array of unique integers
+
+    Returns
+    -------
+    starts : :class:`numpy.ndarray`
+        First value in each run
+    stops : :class:`numpy.ndarray`
+        One more than the last value in each run
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if values.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    breaks = np.where(np.diff(values) != 1)[0]
+    starts = values[np.hstack(([0], breaks + 1))]
+    stops = values[np.hstack((breaks, [values.size - 1]))] + 1
+    return starts, stops
+
+
+class PendingPositions(object):
+    """
+    Sorted list of positions that remain to be computed, stored as runs of consecutive positions rather than as
+    individual positions. Slicing this object returns the positions as a :class:`numpy.ndarray`, just like slicing the
+    equivalent 1D array of positions would.
+    """
+
+    def __init__(self, starts, stops):
+        """
+        Parameters
+        ----------
+        starts : array-like
+            First position in each run of consecutive positions
+        stops : array-like
+            One more than the last position in each run of consecutive positions
+        """
+        self.__starts = np.asarray(starts, dtype=np.int64)
+        self.__lengths = np.asarray(stops, dtype=np.int64) - self.__starts
+        if self.__starts.ndim != 1 or self.__starts.shape != self.__lengths.shape:
+            raise ValueError('starts and stops should be 1D arrays of the same size')
+        if np.any(self.__lengths <= 0):
+            raise ValueError('Each run should contain at least one position')
+        # Index of the first position of each run within this list:
+        self.__offsets = np.hstack(([0], np.cumsum(self.__lengths)[:-1])).astype(np.int64)
+        self.size = int(np.sum(self.__lengths))
+
+    @property
+    def num_runs(self):
+        """
+        Number of runs of consecutive positions
+        """
+        return self.__starts.size
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '{} positions in {} runs: {}'.format(self.size, self.num_runs,
+                                                   ', '.join(['{}-{}'.format(start, start + length - 1) for
+                                                              start, length in zip(self.__starts[:5],
+                                                                                   self.__lengths[:5])]) +
+                                                   (', ...' if self.num_runs > 5 else ''))
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self[:]
+        if dtype is not None:
+            arr = arr.astype(dtype)
+        return arr
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.size)
+            if step != 1:
+                raise ValueError('Only contiguous slices are supported')
+            return self.__get_range(start, stop)
+        item = int(item)
+        if item < 0:
+            item += self.size
+        if item < 0 or item >= self.size:
+            raise IndexError('index {} is out of bounds for {} positions'.format(item, self.size))
+        run = np.searchsorted(self.__offsets, item, side='right') - 1
+        return self.__starts[run] + item - self.__offsets[run]
+
+    def __get_range(self, start, stop):
+        """
+        Returns the positions between the provided indices within this list
+
+        Parameters
+        ----------
+        start : uint
+            Index of the first position
+        stop : uint
+            Index one more than that of the last position
+
+        Returns
+        -------
+        positions : :class:`numpy.ndarray`
+            1D array of positions
+        """
+        if stop <= start:
+            return np.zeros(0, dtype=np.int64)
+        first_run = np.searchsorted(self.__offsets, start, side='right') - 1
+        last_run = np.searchsorted(self.__offsets, stop - 1, side='right') - 1
+        pieces = []
+        for run in range(first_run, last_run + 1):
+            run_start = max(start, self.__offsets[run]) - self.__offsets[run]
+            run_stop = min(stop, self.__offsets[run] + self.__lengths[run]) - self.__offsets[run]
+            pieces.append(np.arange(self.__starts[run] + run_start, self.__starts[run] + run_stop, dtype=np.int64))
+        return np.hstack(pieces)
+
+    def searchsorted(self, position):
+        """
+        Finds the index within this list of the first pending position that is at least the provided position
+
+        Parameters
+        ----------
+        position : uint
+            Position in the dataset
+
+        Returns
+        -------
+        index : uint
+            Index within this list
+        """
+        run = np.searchsorted(self.__starts, position, side='right') - 1
+        if run < 0:
+            return 0
+        return int(self.__offsets[run] + min(position - self.__starts[run], self.__lengths[run]))
+
+
+class CompletionTracker(object):
+    """
+    Keeps track of the positions that have been computed using a dataset in the HDF5 file that holds one unsigned
+    8-bit integer per position. The dataset is only read when necessary and in blocks so that datasets with a very
+    large number of positions do not need to be loaded into memory in one go. Positions marked as computed are
+    written back together in as few contiguous writes as possible.
+    """
+
+    def __init__(self, h5_status_dset, block_size=2 ** 22):
+        """
+        Parameters
+        ----------
+        h5_status_dset : :class:`h5py.Dataset`
+            1D dataset with one unsigned 8-bit integer per position
+        block_size : uint, optional
+            Number of values to read from the dataset at a time
+        """
+        if not isinstance(h5_status_dset, h5py.Dataset):
+            raise TypeError('h5_status_dset should be a h5py.Dataset object')
+        if len(h5_status_dset.shape) != 1 or h5_status_dset.dtype != np.uint8:
+            raise ValueError('h5_status_dset should be a 1D dataset of unsigned 8-bit integers')
+        if not isinstance(block_size, int) or block_size < 1:
+            raise TypeError('block_size should be a positive integer')
+        self.h5_status_dset = h5_status_dset
+        self.__block_size = block_size
+        self.__marked = dict()
+
+    def __iter_blocks(self):
+        """
+        Reads the status dataset one block at a time
+
+        Returns
+        -------
+        iterable : :class:`generator`
+            Yields the offset and values of each block
+        """
+        num_pos = self.h5_status_dset.shape[0]
+        for offset in range(0, num_pos, self.__block_size):
+            yield offset, self.h5_status_dset[offset: min(num_pos, offset + self.__block_size)]
+
+    def get_pending(self, values=(0,)):
+        """
+        Returns the positions that have one of the provided status values in the HDF5 dataset
+
+        Parameters
+        ----------
+        values : tuple of uint, optional
+            Status values that denote positions that need to be computed. Default - (0,) - not yet computed
+
+        Returns
+        -------
+        pending : PendingPositions
+            Positions that remain to be computed
+        """
+        starts = []
+        stops = []
+        for offset, block in self.__iter_blocks():
+            is_pending = np.isin(block, values)
+            if not np.any(is_pending):
+                continue
+            edges = np.diff(np.hstack(([False], is_pending, [False])).astype(np.int8))
+            block_starts = np.where(edges == 1)[0] + offset
+            block_stops = np.where(edges == -1)[0] + offset
+            if len(stops) > 0 and stops[-1][-1] == block_starts[0]:
+                # Runs continuing across blocks are merged
+                stops[-1][-1] = block_stops[0]
+                block_starts = block_starts[1:]
+                block_stops = block_stops[1:]
+                if block_starts.size == 0:
+                    continue
+            starts.append(block_starts)
+            stops.append(block_stops)
+        if len(starts) == 0:
+            return PendingPositions([], [])
+        return PendingPositions(np.hstack(starts), np.hstack(stops))
+
+    def count(self, value=1):
+        """
+        Counts the positions that have the provided status value in the HDF5 dataset
+
+        Parameters
+        ----------
+        value : uint, optional
+            Status value to count. Default - 1 - computed
+
+        Returns
+        -------
+        count : uint
+            Number of positions with the provided status
+        """
+        return int(sum([np.count_nonzero(block == value) for _, block in self.__iter_blocks()]))
+
+    def mark(self, positions, value=1):
+        """
+        Marks the provided positions with the provided status. Nothing is written to the HDF5 dataset until
+        :meth:`~pyUSID.processing.status_utils.CompletionTracker.commit` is called.
+
+        Parameters
+        ----------
+        positions : array-like
+            1D array of unsigned integers denoting the positions
+        value : uint, optional
+            Status value for these positions. Default - 1 - computed
+        """
+        self.__marked.setdefault(value, []).append(np.asarray(positions, dtype=np.int64))
+
+    @property
+    def num_marked(self):
+        """
+        Number of positions that have been marked but not yet written to the HDF5 dataset
+        """
+        return int(sum([sum([item.size for item in items]) for items in self.__marked.values()]))
+
+    def commit(self):
+        """
+        Writes all marked positions to the HDF5 dataset, coalescing consecutive positions into single writes
+
+        Returns
+        -------
+        num_writes : uint
+            Number of writes made to the HDF5 dataset
+        """
+        num_writes = 0
+        for value, items in self.__marked.items():
+            starts, stops = values_to_runs(np.unique(np.hstack(items)))
+            for start, stop in zip(starts, stops):
+                self.h5_status_dset[start: stop] = value
+            num_writes += starts.size
+        self.__marked = dict()
+        return num_writes
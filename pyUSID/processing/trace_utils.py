@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Utilities for recording a timeline of the steps taken by each rank while computing
+
+Created on Sun Oct 18 09:41:05 2026
+"""
+from __future__ import division, print_function, absolute_import
+import json
+import threading
+import time as tm
+from numbers import Number
+
+import numpy as np
+
+from ..io.io_utils import format_time, format_size
+
+__all__ = ['Tracer', 'get_nbytes']
+
+
+def get_nbytes(obj):
+    """
+    Estimates the size of the provided results in memory
+
+    Parameters
+    ----------
+    obj : object
+        numpy array, number, or (nested) list / tuple of these
+
+    Returns
+    -------
+    nbytes : uint
+        Size of the object in bytes. 0 if the size could not be determined
+    """
+    if isinstance(obj, np.ndarray) or isinstance(obj, np.generic):
+        return int(obj.nbytes)
+    if isinstance(obj, (list, tuple)):
+        return int(sum([get_nbytes(item) for item in obj]))
+    if isinstance(obj, Number):
+        return int(np.asarray(obj).nbytes)
+    return 0
+
+
+class _Span(object):
+    """
+    A single step, such as reading a batch, that is being timed
+    """
+
+    def __init__(self, tracer, name, batch):
+        self.__tracer = tracer
+        self.name = name
+        self.batch = batch
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.start = None
+
+    def __enter__(self):
+        self.start = tm.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__tracer._record(self, tm.time() - self.start)
+        return False
+
+
+class _NullSpan(object):
+    """
+    Stand-in for :class:`_Span` that records nothing when tracing is disabled
+    """
+
+    def __init__(self):
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer(object):
+    """
+    Records the time spent by a rank in each step, such as reading, computing, or writing, of every batch along with
+    the bytes read or written in that step. The timeline can be exported as a Chrome trace that can be viewed in
+    chrome://tracing or https://ui.perfetto.dev or be summarized as a table
+    """
+
+    def __init__(self, rank=0, enabled=True):
+        """
+        Parameters
+        ----------
+        rank : uint, optional
+            MPI rank of this process. Default - 0
+        enabled : bool, optional
+            If False, nothing will be recorded and tracing will add practically no overhead. Default - True
+        """
+        if not isinstance(enabled, bool):
+            raise TypeError('enabled should be a boolean value')
+        if not isinstance(rank, int) or rank < 0:
+            raise TypeError('rank should be a non-negative integer')
+        self.rank = rank
+        self.enabled = enabled
+        self.__spans = []
+        self.__lock = threading.Lock()
+
+    def span(self, name, batch=None):
+        """
+        Returns a context manager that times the enclosed step. The bytes read or written in this step may be set
+        via the ``bytes_read`` and ``bytes_written`` attributes of the returned object
+
+        Parameters
+        ----------
+        name : str
+            Name of the step. Eg - 'read', 'compute', 'write', 'flush', 'status', 'barrier'
+        batch : uint, optional
+            Identifier for the batch that this step belongs to
+
+        Returns
+        -------
+        span : object
+            Context manager
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, batch)
+
+    def _record(self, span, duration):
+        """
+        Stores the provided completed span. Spans may be recorded from multiple threads
+        """
+        record = {'name': span.name, 'rank': self.rank, 'thread': threading.current_thread().name,
+                  'batch': span.batch, 'start': span.start, 'duration': duration,
+                  'bytes_read': int(span.bytes_read), 'bytes_written': int(span.bytes_written)}
+        with self.__lock:
+            self.__spans.append(record)
+
+    def get_spans(self):
+        """
+        Returns the spans recorded thus far
+
+        Returns
+        -------
+        spans : list of dict
+            Name, rank, thread, batch, start time (seconds since epoch), duration (seconds), and bytes read and written
+            in each span
+        """
+        with self.__lock:
+            return list(self.__spans)
+
+    def gather(self, comm=None):
+        """
+        Collects the spans recorded by all MPI ranks on rank 0
+
+        Parameters
+        ----------
+        comm : :class:`mpi4py.MPI.Comm`, optional
+            MPI communicator. If not provided, only the spans of this rank are returned
+
+        Returns
+        -------
+        spans : list of dict
+            Spans from all ranks on rank 0 and None on all other ranks
+        """
+        if comm is None:
+            return self.get_spans()
+        all_spans = comm.gather(self.get_spans(), root=0)
+        if comm.Get_rank() != 0:
+            return None
+        return [span for rank_spans in all_spans for span in rank_spans]
+
+    def to_chrome_trace(self, file_path=None, spans=None):
+        """
+        Formats the spans as a Chrome trace where each rank is shown as a process and each thread as a track
+
+        Parameters
+        ----------
+        file_path : str, optional
+            Path to the JSON file that the trace will be written to
+        spans : list of dict, optional
+            Spans, such as those collected from all ranks via
+            :meth:`~pyUSID.processing.trace_utils.Tracer.gather`. Default - spans recorded by this object
+
+        Returns
+        -------
+        trace : dict
+            Trace in the Chrome trace event format
+        """
+        if spans is None:
+            spans = self.get_spans()
+        t_zero = min([span['start'] for span in spans]) if len(spans) > 0 else 0
+        events = []
+        threads = dict()
+        for span in spans:
+            key = (span['rank'], span['thread'])
+            if key not in threads:
+                threads[key] = len(threads)
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': span['rank'], 'tid': threads[key],
+                               'args': {'name': span['thread']}})
+            events.append({'name': span['name'], 'cat': 'Process', 'ph': 'X', 'pid': span['rank'],
+                           'tid': threads[key], 'ts': (span['start'] - t_zero) * 1E+6,
+                           'dur': span['duration'] * 1E+6,
+                           'args': {'batch': span['batch'], 'bytes_read': span['bytes_read'],
+                                    'bytes_written': span['bytes_written']}})
+        for rank in sorted(set([span['rank'] for span in spans])):
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': rank, 'args': {'name': 'Rank {}'.format(rank)}})
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if file_path is not None:
+            with open(file_path, mode='w') as file_handle:
+                json.dump(trace, file_handle)
+        return trace
+
+    def summary(self, spans=None):
+        """
+        Tabulates the number of occurrences, total time, and bytes read and written for each kind of span per rank
+
+        Parameters
+        ----------
+        spans : list of dict, optional
+            Spans, such as those collected from all ranks via
+            :meth:`~pyUSID.processing.trace_utils.Tracer.gather`. Default - spans recorded by this object
+
+        Returns
+        -------
+        table : str
+            Table with one row per rank and kind of span
+        """
+        if spans is None:
+            spans = self.get_spans()
+        totals = dict()
+        for span in spans:
+            key = (span['rank'], span['name'])
+            row = totals.setdefault(key, [0, 0.0, 0, 0])
+            row[0] += 1
+            row[1] += span['duration']
+            row[2] += span['bytes_read']
+            row[3] += span['bytes_written']
+
+        lines = ['{:<6}{:<12}{:>8}{:>14}{:>14}{:>14}{:>14}'.format('Rank', 'Step', 'Count', 'Total time', 'Mean time',
+                                                                   'Read', 'Written')]
+        for (rank, name), (count, duration, bytes_read, bytes_written) in sorted(totals.items()):
+            lines.append('{:<6}{:<12}{:>8}{:>14}{:>14}{:>14}{:>14}'.format(rank, name, count, format_time(duration),
+                                                                           format_time(duration / count),
+                                                                           format_size(bytes_read),
+                                                                           format_size(bytes_written)))
+        return '\n'.join(lines)
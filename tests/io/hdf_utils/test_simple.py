@@ -11,6 +11,7 @@ import sys
 import h5py
 import numpy as np
 import shutil
+import tempfile
 
 sys.path.append("../../pyUSID/")
 from pyUSID.io import hdf_utils, write_utils, USIDataset
@@ -1359,5 +1360,87 @@ class TestCheckAndLinkAncillary(TestSimple):
         os.remove(file_path)
 
 
+class TestResultsIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.h5_f = h5py.File(os.path.join(self.tmp_dir, 'index.h5'), mode='w')
+        self.h5_main = self.h5_f.create_dataset('Raw_Data', data=np.zeros((4, 3)))
+
+    def tearDown(self):
+        self.h5_f.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hash_parms(self):
+        parms = {'a': 1, 'b': [1, 2], 'c': 'text', 'd': True}
+        self.assertEqual(hdf_utils.hash_parms(parms),
+                         hdf_utils.hash_parms({'d': np.bool_(True), 'c': b'text', 'b': np.array([1., 2.]),
+                                               'a': np.int64(1)}))
+        self.assertNotEqual(hdf_utils.hash_parms(parms), hdf_utils.hash_parms({'a': 2, 'b': [1, 2], 'c': 'text',
+                                                                                'd': True}))
+        self.assertNotEqual(hdf_utils.hash_parms({'b': [1, 2]}), hdf_utils.hash_parms({'b': [[1, 2]]}))
+        with self.assertRaises(TypeError):
+            _ = hdf_utils.hash_parms([1, 2])
+
+    def test_index_and_find(self):
+        h5_grp_0 = self.h5_f.create_group('Raw_Data-Fitter_000')
+        h5_grp_1 = self.h5_f.create_group('Raw_Data-Fitter_001')
+        hdf_utils.index_results_group(self.h5_main, 'Fitter', 'abc', h5_grp_0)
+        hdf_utils.index_results_group(self.h5_main, 'Fitter', 'abc', h5_grp_1, complete_status='completed_fits')
+        hdf_utils.index_results_group(self.h5_main, 'Fitter', 'def', h5_grp_1)
+
+        found = hdf_utils.find_indexed_results(self.h5_main, 'Fitter', 'abc')
+        self.assertEqual(found, [(h5_grp_0, []), (h5_grp_1, ['completed_fits'])])
+        self.assertEqual(hdf_utils.find_indexed_results(self.h5_main, 'Fitter', 'xyz'), [])
+        self.assertEqual(hdf_utils.find_indexed_results(self.h5_main, 'Guesser', 'abc'), [])
+        self.assertEqual(sorted(hdf_utils.get_results_index(self.h5_main, 'Fitter').keys()), ['abc', 'def'])
+        # Each hash is indexed in its own attribute so that finding groups only reads a single attribute
+        self.assertEqual(sorted([key for key in self.h5_f.attrs.keys()
+                                 if key.startswith(hdf_utils.RESULTS_INDEX_PREFIX)]),
+                         [hdf_utils.RESULTS_INDEX_PREFIX + 'Raw_Data:Fitter:',
+                          hdf_utils.RESULTS_INDEX_PREFIX + 'Raw_Data:Fitter:abc',
+                          hdf_utils.RESULTS_INDEX_PREFIX + 'Raw_Data:Fitter:def'])
+        self.assertEqual(hdf_utils.find_unindexed_results(self.h5_main, 'Fitter'), [])
+
+        # Deleted groups are skipped
+        del self.h5_f['Raw_Data-Fitter_000']
+        self.assertEqual(hdf_utils.find_indexed_results(self.h5_main, 'Fitter', 'abc'),
+                         [(h5_grp_1, ['completed_fits'])])
+
+    def test_unindexed_results(self):
+        h5_legacy = self.h5_f.create_group('Raw_Data-Fitter_000')
+        self.assertIsNone(hdf_utils.find_unindexed_results(self.h5_main, 'Fitter'))
+        h5_grp = self.h5_f.create_group('Raw_Data-Fitter_001')
+        hdf_utils.index_results_group(self.h5_main, 'Fitter', 'abc', h5_grp)
+        # Groups written before the tool was indexed are remembered, unlike groups written since
+        self.assertEqual(hdf_utils.find_unindexed_results(self.h5_main, 'Fitter'), [h5_legacy])
+        h5_new = self.h5_f.create_group('Raw_Data-Fitter_002')
+        hdf_utils.index_results_group(self.h5_main, 'Fitter', 'def', h5_new)
+        self.assertEqual(hdf_utils.find_unindexed_results(self.h5_main, 'Fitter'), [h5_legacy])
+        hdf_utils.index_results_group(self.h5_main, 'Fitter', 'abc', h5_legacy, complete_status='completed_fits')
+        self.assertEqual(hdf_utils.find_unindexed_results(self.h5_main, 'Fitter'), [])
+        self.assertEqual(hdf_utils.find_indexed_results(self.h5_main, 'Fitter', 'abc'),
+                         [(h5_legacy, ['completed_fits']), (h5_grp, [])])
+        # Tools whose names start with the name of another tool are indexed separately
+        hdf_utils.index_results_group(self.h5_main, 'Fitter:2', 'abc', h5_new)
+        self.assertEqual(sorted(hdf_utils.get_results_index(self.h5_main, 'Fitter').keys()), ['abc', 'def'])
+
+    def test_index_invalid_inputs(self):
+        h5_grp = self.h5_f.create_group('Raw_Data-Fitter_000')
+        h5_other = self.h5_f.create_group('Other').create_group('Raw_Data-Fitter_000')
+        with self.assertRaises(TypeError):
+            hdf_utils.index_results_group(h5_grp, 'Fitter', 'abc', h5_grp)
+        with self.assertRaises(TypeError):
+            hdf_utils.index_results_group(self.h5_main, 'Fitter', 'abc', self.h5_main)
+        with self.assertRaises(TypeError):
+            hdf_utils.index_results_group(self.h5_main, 'Fitter', 123, h5_grp)
+        with self.assertRaises(ValueError):
+            hdf_utils.index_results_group(self.h5_main, 'Fitter', 'abc', h5_other)
+        with self.assertRaises(ValueError):
+            hdf_utils.index_results_group(self.h5_main, 'Fitter', 'a:b', h5_grp)
+        with self.assertRaises(TypeError):
+            _ = hdf_utils.get_results_index(h5_grp, 'Fitter')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,13 +6,169 @@ Created on Tue Nov  3 15:07:16 2017
 """
 from __future__ import division, print_function, unicode_literals, absolute_import
 import unittest
+import os
 import sys
-from multiprocessing import cpu_count
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import dask.array as da
+import h5py
 
 sys.path.append("../../pyUSID/")
+from pyUSID.processing import comp_utils, process
+
+MAX_CPU_CORES = comp_utils.get_available_cores()
+
+
+@contextmanager
+def available_cores(num_cores):
+    """
+    Pretends that the provided number of cores are available such that pools of several workers are started even on
+    machines with fewer cores
+    """
+    original = comp_utils.get_available_cores
+
+    def get_available_cores():
+        return num_cores
+
+    comp_utils.get_available_cores = get_available_cores
+    process.get_available_cores = get_available_cores
+    try:
+        yield
+    finally:
+        comp_utils.get_available_cores = original
+        process.get_available_cores = original
+
+MPIRUN = shutil.which('mpirun') if hasattr(shutil, 'which') else None
+try:
+    import mpi4py
+except ImportError:
+    mpi4py = None
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+MPI_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+import joblib
+import numpy as np
 from pyUSID.processing import comp_utils
 
-MAX_CPU_CORES = cpu_count()
+
+def add_rank(vector, rank):
+    return vector + rank
+
+
+if __name__ == '__main__':
+    MPI = comp_utils.get_MPI()
+    assert MPI is not None
+    rank = MPI.COMM_WORLD.Get_rank()
+    cores = comp_utils.recommend_cores_per_rank()
+    data = np.random.RandomState(rank).rand(100, 4)
+    for backend in ['processes', 'threads']:
+        results = comp_utils.parallel_compute(data, add_rank, cores=2, func_args=[rank], backend=backend)
+        assert np.allclose(np.array(results), data + rank)
+    # Workers must never initialize MPI or touch the communicator of this rank
+    in_workers = joblib.Parallel(n_jobs=2)(joblib.delayed(comp_utils.get_MPI)() for _ in range(2))
+    assert all([item is None for item in in_workers])
+    MPI.COMM_WORLD.Barrier()
+    print('Rank {{}} computed on {{}} cores'.format(rank, cores))
+"""
+
+COUNTER_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+from mpi4py import MPI
+from pyUSID.processing import comp_utils
+
+
+if __name__ == '__main__':
+    comm = MPI.COMM_WORLD
+    counter = comp_utils.SharedCounter(comm)
+    claimed = [counter.fetch_and_add(3) for _ in range(50)]
+    claimed = sorted([value for part in comm.allgather(claimed) for value in part])
+    counter.free()
+    # Every value is handed out exactly once however the ranks interleave
+    assert claimed == list(range(0, 3 * 50 * comm.Get_size(), 3)), claimed
+    print('Rank {{}} claimed its share'.format(comm.Get_rank()))
+"""
+
+PROCESS_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+import h5py
+import numpy as np
+from mpi4py import MPI
+from tests.processing.test_process import make_simple_main_file, MeanProcess
+
+
+if __name__ == '__main__':
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    if rank == 0:
+        make_simple_main_file({path!r})
+    comm.Barrier()
+    # Flushes are collective, so ranks that flush a different number of times would wait on each other forever
+    configs = [({{}}, {{}}),
+               ({{'aggregate_io': True}}, {{}}),
+               ({{}}, {{'schedule': 'dynamic'}}),
+               ({{'aggregate_io': True}}, {{'schedule': 'dynamic', 'flush_every': 2}}),
+               ({{}}, {{'flush_every': None, 'flush_interval': 1E-3}}),
+               ({{'prefetch': True, 'write_behind': 1}}, {{'schedule': 'dynamic', 'flush_every': 2}})]
+    with h5py.File({path!r}, mode='r+', driver='mpio', comm=comm) as h5_f:
+        h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+        expected = np.mean(h5_main[()], axis=1)
+        for kwargs, compute_kwargs in configs:
+            proc = MeanProcess(h5_main, cores=1, **kwargs)
+            # Background threads make MPI calls via HDF5 while the main thread makes MPI calls of its own
+            threads_allowed = MPI.Query_thread() == MPI.THREAD_MULTIPLE
+            assert proc._prefetch == (threads_allowed and kwargs.get('prefetch', False)), kwargs
+            # Ranks compute different numbers of batches
+            proc._max_pos_per_read = 7 if rank == 0 else 13
+            h5_grp = proc.compute(override=True, **compute_kwargs)
+            assert np.allclose(h5_grp['Mean'][()][:, 0], expected), (kwargs, compute_kwargs)
+            assert np.all(h5_grp['completed_positions'][()] == 1), (kwargs, compute_kwargs)
+    print('Rank {{}} computed all configurations'.format(rank))
+"""
+
+
+def run_via_mpi(script, num_ranks=2, timeout=300):
+    """
+    Runs the provided python script on several MPI ranks and returns the exit code and the combined output
+    """
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'script.py')
+        with open(path, mode='w') as file_handle:
+            file_handle.write(script)
+        cmd = [MPIRUN, '-n', str(num_ranks)]
+        if 'Open MPI' in subprocess.check_output([MPIRUN, '--version']).decode():
+            cmd += ['--oversubscribe']
+            if hasattr(os, 'geteuid') and os.geteuid() == 0:
+                cmd += ['--allow-run-as-root']
+        # Leaves out the variables that MPI sets within this process if mpi4py was already initialized here
+        proc = subprocess.Popen(cmd + [sys.executable, path], stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, env=dict(os.environ))
+        try:
+            output = proc.communicate(timeout=timeout)[0].decode()
+        except subprocess.TimeoutExpired:
+            # Ranks that wait on each other forever should fail the test rather than hang it
+            proc.kill()
+            output = proc.communicate()[0].decode() + '\nTimed out after {} seconds'.format(timeout)
+    finally:
+        shutil.rmtree(folder)
+    return proc.returncode, output
+
+
+def add_offset(vector, offset=0):
+    return vector + offset
+
+
+def get_thread_id(vector):
+    return threading.current_thread().ident
 
 
 class TestIOUtils(unittest.TestCase):
@@ -69,7 +225,551 @@ class TestIOUtils(unittest.TestCase):
         if sys.maxsize <= 2 ** 32:
             mem = min([mem, sys.maxsize])
 
-        self.assertEqual(mem, comp_utils.get_available_memory())
+        self.assertLessEqual(comp_utils.get_available_memory(), mem)
+
+    def test_get_available_memory_source(self):
+        mem, source = comp_utils.get_available_memory(return_source=True)
+        self.assertIsInstance(source, str)
+        self.assertGreater(mem, 0)
+        with self.assertRaises(TypeError):
+            _ = comp_utils.get_available_memory(return_source=1)
+
+    def test_get_available_cores_source(self):
+        from multiprocessing import cpu_count
+        cores, source = comp_utils.get_available_cores(return_source=True)
+        self.assertTrue(1 <= cores <= cpu_count())
+        self.assertIsInstance(source, str)
+        if source == 'cpu_count':
+            self.assertEqual(cores, cpu_count())
+        self.assertEqual(cores, comp_utils.get_available_cores())
+
+
+class TestCgroupLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.proc_cgroup = os.path.join(self.root, 'proc_cgroup')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def __write(self, rel_path, contents):
+        path = os.path.join(self.root, rel_path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, mode='w') as file_handle:
+            file_handle.write(contents)
+        return path
+
+    def test_v1_limits(self):
+        self.__write('proc_cgroup', '4:memory:/job/step\n3:cpu,cpuacct:/job/step\n')
+        quota_path = self.__write('cgroup/cpu/job/cpu.cfs_quota_us', '250000')
+        self.__write('cgroup/cpu/job/cpu.cfs_period_us', '100000')
+        self.__write('cgroup/cpu/job/step/cpu.cfs_quota_us', '-1')
+        self.__write('cgroup/cpu/job/step/cpu.cfs_period_us', '100000')
+        limit_path = self.__write('cgroup/memory/job/step/memory.limit_in_bytes', str(1024 ** 3))
+        self.__write('cgroup/memory/job/step/memory.usage_in_bytes', str(512 * 1024 ** 2))
+        self.__write('cgroup/memory/job/step/memory.stat', 'cache 1\ntotal_inactive_file {}\n'.format(128 * 1024 ** 2))
+        self.__write('cgroup/memory/memory.limit_in_bytes', '9223372036854771712')
+        self.__write('cgroup/memory/memory.usage_in_bytes', '1')
+
+        root = os.path.join(self.root, 'cgroup')
+        cores, source = comp_utils._get_cgroup_cpu_limit(root=root, proc_cgroup=self.proc_cgroup)
+        self.assertAlmostEqual(cores, 2.5)
+        self.assertEqual(source, quota_path)
+        mem, source = comp_utils._get_cgroup_memory(root=root, proc_cgroup=self.proc_cgroup)
+        self.assertEqual(mem, (1024 - 512 + 128) * 1024 ** 2)
+        self.assertEqual(source, limit_path)
+
+    def test_v2_limits(self):
+        self.__write('proc_cgroup', '0::/pod/container\n')
+        self.__write('cgroup/cgroup.controllers', 'cpu memory')
+        quota_path = self.__write('cgroup/pod/container/cpu.max', '50000 100000')
+        self.__write('cgroup/pod/cpu.max', 'max 100000')
+        self.__write('cgroup/pod/container/memory.max', 'max')
+        self.__write('cgroup/pod/container/memory.current', str(300 * 1024 ** 2))
+        limit_path = self.__write('cgroup/pod/memory.max', str(2 * 1024 ** 3))
+        self.__write('cgroup/pod/memory.current', str(1024 ** 3))
+        self.__write('cgroup/pod/memory.stat', 'anon 1\ninactive_file {}\n'.format(1024 ** 2))
+
+        root = os.path.join(self.root, 'cgroup')
+        cores, source = comp_utils._get_cgroup_cpu_limit(root=root, proc_cgroup=self.proc_cgroup)
+        self.assertAlmostEqual(cores, 0.5)
+        self.assertEqual(source, quota_path)
+        mem, source = comp_utils._get_cgroup_memory(root=root, proc_cgroup=self.proc_cgroup)
+        self.assertEqual(mem, 1025 * 1024 ** 2)
+        self.assertEqual(source, limit_path)
+
+    def test_no_limits(self):
+        self.__write('proc_cgroup', '0::/\n')
+        self.__write('cgroup/cgroup.controllers', 'cpu memory')
+        self.__write('cgroup/cpu.max', 'max 100000')
+        root = os.path.join(self.root, 'cgroup')
+        self.assertEqual(comp_utils._get_cgroup_cpu_limit(root=root, proc_cgroup=self.proc_cgroup), (None, None))
+        self.assertEqual(comp_utils._get_cgroup_memory(root=root, proc_cgroup=self.proc_cgroup), (None, None))
+        missing = os.path.join(self.root, 'missing')
+        self.assertEqual(comp_utils._get_cgroup_cpu_limit(root=missing, proc_cgroup=self.proc_cgroup), (None, None))
+
+
+def block_mean(block, axis=1):
+    return np.mean(block, axis=axis)
+
+
+class TestParallelComputeBlocks(unittest.TestCase):
+
+    def test_matches_row_wise(self):
+        data = np.random.rand(101, 7)
+        results = comp_utils.parallel_compute_blocks(data, block_mean, cores=MAX_CPU_CORES)
+        self.assertIsInstance(results, np.ndarray)
+        self.assertTrue(np.allclose(results, data.mean(axis=1)))
+
+    def test_with_pool_and_kwargs(self):
+        data = np.random.rand(64, 5)
+        with comp_utils.WorkerPool(cores=MAX_CPU_CORES) as pool:
+            results = comp_utils.parallel_compute_blocks(data, add_offset, func_kwargs={'offset': 1}, pool=pool)
+        self.assertTrue(np.allclose(results, data + 1))
+
+    def test_wrong_result_shape(self):
+        with self.assertRaises(ValueError):
+            _ = comp_utils.parallel_compute_blocks(np.random.rand(10, 3), np.sum)
+
+    def test_illegal_inputs(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.parallel_compute_blocks([1, 2, 3], block_mean)
+        with self.assertRaises(TypeError):
+            _ = comp_utils.parallel_compute_blocks(np.arange(3), 'not callable')
+
+
+class TestDaskCompute(unittest.TestCase):
+
+    def test_row_function(self):
+        data = np.random.rand(37, 5)
+        for scheduler in ['threads', 'synchronous']:
+            results = comp_utils.dask_compute(data, np.mean, scheduler=scheduler, cores=3)
+            self.assertIsInstance(results, list)
+            self.assertTrue(np.allclose(results, data.mean(axis=1)))
+
+    def test_block_function_lazy_array(self):
+        data = np.random.rand(40, 6)
+        results = comp_utils.dask_compute(da.from_array(data, chunks=(7, 6)), add_offset, cores=2,
+                                          block_function=True, func_kwargs={'offset': 2})
+        self.assertIsInstance(results, np.ndarray)
+        self.assertTrue(np.allclose(results, data + 2))
+
+    def test_processes_scheduler(self):
+        data = np.random.rand(12, 4)
+        results = comp_utils.dask_compute(data, block_mean, scheduler='processes', cores=2, block_function=True)
+        self.assertTrue(np.allclose(results, data.mean(axis=1)))
+
+    def test_wrong_result_shape(self):
+        with self.assertRaises(ValueError):
+            _ = comp_utils.dask_compute(np.random.rand(10, 3), np.sum, scheduler='synchronous', block_function=True)
+
+    def test_illegal_inputs(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.dask_compute([1, 2, 3], np.mean)
+        with self.assertRaises(TypeError):
+            _ = comp_utils.dask_compute(np.random.rand(4, 2), 'not callable')
+        with self.assertRaises(ValueError):
+            _ = comp_utils.dask_compute(np.random.rand(4, 2), np.mean, scheduler='gpu')
+        with self.assertRaises(TypeError):
+            _ = comp_utils.dask_compute(np.random.rand(4, 2), np.mean, scheduler=4)
+
+
+def row_stats(vector):
+    return np.array([vector.mean(), vector.max()])
+
+
+def mean_and_first(vector):
+    return vector.mean(), vector[0] + 1j * vector[1]
+
+
+class TestParallelComputeShared(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(53, 40).astype(np.float32)
+        self.expected = np.vstack((self.data.mean(axis=1), self.data.max(axis=1))).T
+
+    def test_shared_memory(self):
+        for cores in [1, 2]:
+            results = comp_utils.parallel_compute(self.data, row_stats, cores=cores, shared_memory=True)
+            self.assertIsInstance(results, np.ndarray)
+            self.assertEqual(results.shape, (53, 2))
+            self.assertTrue(np.allclose(results, self.expected))
+
+    def test_scalar_results_with_pool(self):
+        with comp_utils.WorkerPool(cores=2) as pool:
+            results = comp_utils.parallel_compute(self.data, np.mean, pool=pool, shared_memory=True)
+        self.assertEqual(results.shape, (53,))
+        self.assertTrue(np.allclose(results, self.data.mean(axis=1)))
+
+    def test_object_results(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.parallel_compute(self.data, lambda vec: {'mean': vec.mean()}, cores=1,
+                                            shared_memory=True)
+
+    def test_shared_memory_not_bool(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.parallel_compute(self.data, np.mean, cores=1, shared_memory=1)
+
+
+class TestThreadsBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(53, 40).astype(np.float32)
+        self.expected = np.vstack((self.data.mean(axis=1), self.data.max(axis=1))).T
+
+    def test_parallel_compute(self):
+        for shared_memory in [False, True]:
+            results = comp_utils.parallel_compute(self.data, row_stats, cores=2, shared_memory=shared_memory,
+                                                  backend='threads')
+            self.assertTrue(np.allclose(np.array(results), self.expected))
+
+    def test_blocks_with_pool(self):
+        with comp_utils.WorkerPool(cores=2, backend='threads') as pool:
+            self.assertEqual(pool.backend, 'threads')
+            results = comp_utils.parallel_compute_blocks(self.data, block_mean, pool=pool)
+            self.assertTrue(np.allclose(results, self.data.mean(axis=1)))
+            results = pool.map(row_stats, self.data, shared_memory=True)
+            self.assertTrue(np.allclose(results, self.expected))
+
+    def test_shared_results_written_in_place(self):
+        import joblib
+        with joblib.Parallel(n_jobs=2, backend='threading') as parallel:
+            results = comp_utils._map_shared(parallel, row_stats, self.data, [], {}, 2, threads=True)
+        self.assertTrue(np.allclose(results, self.expected))
+
+    def test_illegal_backend(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.check_backend(1)
+        with self.assertRaises(ValueError):
+            _ = comp_utils.parallel_compute(self.data, np.mean, cores=1, backend='gpu')
+        with self.assertRaises(ValueError):
+            _ = comp_utils.WorkerPool(cores=1, backend='mpi')
+
+
+class TestGrainSize(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(53, 40).astype(np.float32)
+        self.expected = np.vstack((self.data.mean(axis=1), self.data.max(axis=1))).T
+
+    def test_results_in_order(self):
+        import joblib
+        for grain_size in [None, 1, 7, 53, 100, 'auto']:
+            with joblib.Parallel(n_jobs=2, backend='threading') as parallel:
+                results = comp_utils._map_grains(parallel, row_stats, self.data, [], {}, 2, grain_size=grain_size)
+            self.assertEqual(len(results), 53)
+            self.assertTrue(np.allclose(np.array(results), self.expected))
+
+    def test_shared_ranges(self):
+        import joblib
+        for grain_size in [None, 1, 7, 'auto']:
+            with joblib.Parallel(n_jobs=2, backend='threading') as parallel:
+                results = comp_utils._map_shared(parallel, row_stats, self.data, [], {}, 2, threads=True,
+                                                 grain_size=grain_size)
+            self.assertTrue(np.allclose(results, self.expected))
+
+    def test_parallel_compute_and_pool(self):
+        for grain_size in [5, 'auto']:
+            results = comp_utils.parallel_compute(self.data, add_offset, cores=2, func_kwargs={'offset': 1},
+                                                  grain_size=grain_size)
+            self.assertTrue(np.allclose(np.array(results), self.data + 1))
+            with comp_utils.WorkerPool(cores=2, backend='threads') as pool:
+                results = pool.map(row_stats, self.data, grain_size=grain_size)
+            self.assertTrue(np.allclose(np.array(results), self.expected))
+
+    def test_default_computes_only_in_workers(self):
+        import joblib
+        # Unless asked to time rows, no row is computed in this thread
+        for kwargs in [dict(), {'out': comp_utils.allocate_results(53, dtype=np.int64)}]:
+            with joblib.Parallel(n_jobs=2, backend='threading') as parallel:
+                results = comp_utils._map_grains(parallel, get_thread_id, self.data, [], {}, 2, **kwargs)
+            self.assertNotIn(threading.current_thread().ident, np.array(results).tolist())
+
+    def test_recommend_grain_size(self):
+        # Cheap rows are grouped but still leave a few tasks per worker
+        self.assertEqual(comp_utils.recommend_grain_size(1E-6, 10000, 2),
+                         int(np.ceil(10000 / (2 * comp_utils.GRAINS_PER_WORKER))))
+        self.assertEqual(comp_utils.recommend_grain_size(1E-4, 10 ** 6, 4),
+                         int(np.ceil(comp_utils.GRAIN_DURATION / 1E-4)))
+        # Expensive rows are dispatched one at a time
+        self.assertEqual(comp_utils.recommend_grain_size(1.0, 10000, 4), 1)
+        self.assertEqual(comp_utils.recommend_grain_size(0, 10, 4), 1)
+
+    def test_illegal_grain_size(self):
+        with self.assertRaises(ValueError):
+            _ = comp_utils.parallel_compute(self.data, np.mean, cores=1, grain_size='fine')
+        with self.assertRaises(ValueError):
+            _ = comp_utils.parallel_compute(self.data, np.mean, cores=1, grain_size=0)
+        for grain_size in [2.5, True]:
+            with self.assertRaises(TypeError):
+                _ = comp_utils.check_grain_size(grain_size)
+
+
+class TestPreallocatedResults(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(53, 40).astype(np.float32)
+        self.dtype = np.dtype([('mean', np.float32), ('first', np.complex64)])
+
+    def check(self, out):
+        self.assertTrue(np.allclose(out['mean'], self.data.mean(axis=1)))
+        self.assertTrue(np.allclose(out['first'], self.data[:, 0] + 1j * self.data[:, 1]))
+
+    def test_compound_results(self):
+        for cores, backend, shared_memory in [(1, 'processes', False), (2, 'processes', False),
+                                              (2, 'processes', True), (2, 'threads', False)]:
+            out = comp_utils.allocate_results(53, dtype=self.dtype)
+            results = comp_utils.parallel_compute(self.data, mean_and_first, cores=cores, backend=backend,
+                                                  shared_memory=shared_memory, out=out)
+            self.assertIs(results, out)
+            self.check(out)
+
+    def test_workers_fill_out(self):
+        import joblib
+        for grain_size in [4, 'auto']:
+            out = comp_utils.allocate_results(53, dtype=self.dtype)
+            with joblib.Parallel(n_jobs=2) as parallel:
+                _ = comp_utils._map_grains(parallel, mean_and_first, self.data, [], {}, 2, grain_size=grain_size,
+                                           out=out)
+            self.check(out)
+            out = comp_utils.allocate_results(53, dtype=self.dtype)
+            with joblib.Parallel(n_jobs=2) as parallel:
+                _ = comp_utils._map_shared(parallel, mean_and_first, self.data, [], {}, 2, grain_size=grain_size,
+                                           out=out)
+            self.check(out)
+
+    def test_complex_with_pool(self):
+        out = comp_utils.allocate_results(53, 21, np.complex64)
+        with comp_utils.WorkerPool(cores=2, backend='threads') as pool:
+            results = pool.map(np.fft.rfft, self.data, out=out)
+        self.assertIs(results, out)
+        self.assertTrue(np.allclose(out, np.fft.rfft(self.data, axis=1), atol=1E-4))
+
+    def test_illegal_out(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.parallel_compute(self.data, np.mean, cores=1, out=[0] * 53)
+        with self.assertRaises(ValueError):
+            _ = comp_utils.parallel_compute(self.data, np.mean, cores=1, out=np.zeros(52))
+        with self.assertRaises(TypeError):
+            _ = comp_utils.parallel_compute(self.data, np.mean, cores=1, out=np.zeros(53, dtype=object))
+        with self.assertRaises(TypeError):
+            _ = comp_utils.allocate_results(53, shape=(2.5,))
+        with self.assertRaises(TypeError):
+            _ = comp_utils.allocate_results(-1)
+
+
+class TestImapCompute(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(153, 40).astype(np.float32)
+        self.expected = self.data.mean(axis=1)
+
+    def test_ordered(self):
+        for backend in ['processes', 'threads']:
+            results = comp_utils.imap_compute(self.data, np.mean, cores=2, block_size=7, max_blocks=3,
+                                              backend=backend)
+            self.assertNotIsInstance(results, list)
+            self.assertTrue(np.allclose(list(results), self.expected))
+
+    def test_unordered(self):
+        results = list(comp_utils.imap_compute(self.data, add_offset, cores=2, ordered=False, backend='threads',
+                                               func_kwargs={'offset': 2}))
+        indices = [index for index, _ in results]
+        self.assertEqual(sorted(indices), list(range(153)))
+        for index, result in results:
+            self.assertTrue(np.allclose(result, self.data[index] + 2))
+
+    def test_hdf5_and_dask(self):
+        import h5py
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with h5py.File(os.path.join(tmp_dir, 'imap.h5'), mode='w') as h5_f:
+                h5_dset = h5_f.create_dataset('Raw_Data', data=self.data, chunks=(10, 40))
+                results = list(comp_utils.imap_compute(h5_dset, np.mean, cores=1))
+                self.assertTrue(np.allclose(results, self.expected))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        results = list(comp_utils.imap_compute(da.from_array(self.data, chunks=(20, 40)), np.mean, cores=2))
+        self.assertTrue(np.allclose(results, self.expected))
+
+    def test_iterable_of_blocks(self):
+        blocks = (self.data[start: start + 50] for start in range(0, 153, 50))
+        results = list(comp_utils.imap_compute(blocks, np.mean, cores=1, ordered=False))
+        self.assertEqual([index for index, _ in results], list(range(153)))
+        self.assertTrue(np.allclose([result for _, result in results], self.expected))
+
+    def test_stop_early(self):
+        results = comp_utils.imap_compute(self.data, np.mean, cores=2, backend='threads', block_size=5)
+        self.assertTrue(np.isclose(next(results), self.expected[0]))
+        results.close()
+
+    def test_illegal_inputs(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.imap_compute(5, np.mean)
+        with self.assertRaises(TypeError):
+            _ = comp_utils.imap_compute(self.data, 'not callable')
+        with self.assertRaises(ValueError):
+            _ = comp_utils.imap_compute(self.data, np.mean, block_size=0)
+        with self.assertRaises(ValueError):
+            _ = comp_utils.imap_compute(self.data, np.mean, block_size='big')
+        with self.assertRaises(TypeError):
+            _ = comp_utils.imap_compute(self.data, np.mean, max_blocks=1.5)
+        with self.assertRaises(ValueError):
+            _ = comp_utils.imap_compute(self.data, np.mean, max_blocks=0)
+        with self.assertRaises(TypeError):
+            _ = comp_utils.imap_compute(self.data, np.mean, ordered='yes')
+        with self.assertRaises(ValueError):
+            _ = comp_utils.imap_compute(self.data, np.mean, backend='gpu')
+
+
+def fail_on_negative(vector):
+    if vector[0] < 0:
+        raise ValueError('negative')
+    return vector.sum()
+
+
+class TestIsolateFailures(unittest.TestCase):
+
+    def test_failures_returned(self):
+        data = np.random.rand(60, 3)
+        failed = [3, 17, 42]
+        data[failed, 0] *= -1
+        for backend in ['processes', 'threads']:
+            results = comp_utils.parallel_compute(data, comp_utils.isolate_failures(fail_on_negative),
+                                                  cores=MAX_CPU_CORES, backend=backend)
+            self.assertEqual([index for index, result in enumerate(results)
+                              if isinstance(result, comp_utils.RowFailure)], failed)
+            self.assertEqual(results[3].error, 'ValueError: negative')
+            self.assertTrue(np.allclose(np.delete(np.array(results, dtype=object), failed).astype(float),
+                                        np.delete(data.sum(axis=1), failed)))
+
+    def test_not_callable(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.isolate_failures('func')
+
+
+class TestRankCores(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_env = dict([(name, os.environ.get(name)) for name in
+                              comp_utils.LOCAL_SIZE_ENVS + [comp_utils.MPI_RANK_PID_ENV]])
+        for name in self.orig_env.keys():
+            os.environ.pop(name, None)
+
+    def tearDown(self):
+        for name, value in self.orig_env.items():
+            os.environ.pop(name, None)
+            if value is not None:
+                os.environ[name] = value
+
+    def test_requested_cores(self):
+        self.assertEqual(comp_utils._get_rank_cores(1), 1)
+        self.assertEqual(comp_utils._get_rank_cores(10 ** 4), MAX_CPU_CORES)
+        with self.assertRaises(TypeError):
+            _ = comp_utils._get_rank_cores(2.5)
+
+    def test_shared_among_local_ranks(self):
+        self.assertEqual(comp_utils._get_rank_cores(), 1)
+        os.environ['SLURM_NTASKS_PER_NODE'] = '2(x3)'
+        self.assertEqual(comp_utils._get_rank_cores(), 1)
+        os.environ['OMPI_COMM_WORLD_LOCAL_SIZE'] = '2'
+        self.assertEqual(comp_utils._get_rank_cores(), max(1, MAX_CPU_CORES // 2))
+
+    def test_not_via_mpi(self):
+        self.assertEqual(comp_utils.recommend_cores_per_rank(), MAX_CPU_CORES)
+
+    def test_workers_never_get_mpi(self):
+        self.assertFalse(comp_utils._is_mpi_worker())
+        os.environ[comp_utils.MPI_RANK_PID_ENV] = str(os.getpid())
+        self.assertFalse(comp_utils._is_mpi_worker())
+        os.environ[comp_utils.MPI_RANK_PID_ENV] = str(os.getpid() + 1)
+        self.assertTrue(comp_utils._is_mpi_worker())
+        self.assertIsNone(comp_utils.get_MPI())
+
+    @unittest.skipIf(MPIRUN is None or mpi4py is None, 'mpirun and mpi4py are required')
+    def test_workers_on_two_ranks(self):
+        returncode, output = run_via_mpi(MPI_SCRIPT.format(root=ROOT))
+        self.assertEqual(returncode, 0, msg=output)
+        self.assertEqual(output.count('computed on'), 2, msg=output)
+
+
+class TestProcessViaMPI(unittest.TestCase):
+
+    @unittest.skipIf(MPIRUN is None or mpi4py is None or not h5py.get_config().mpi,
+                     'mpirun, mpi4py, and h5py built with MPI are required')
+    def test_flushes_on_two_ranks(self):
+        folder = tempfile.mkdtemp()
+        try:
+            script = PROCESS_SCRIPT.format(root=ROOT, path=os.path.join(folder, 'process.h5'))
+            returncode, output = run_via_mpi(script)
+        finally:
+            shutil.rmtree(folder)
+        self.assertEqual(returncode, 0, msg=output)
+        self.assertEqual(output.count('computed all configurations'), 2, msg=output)
+
+
+class TestSharedCounter(unittest.TestCase):
+
+    def test_local_counter(self):
+        counter = comp_utils.SharedCounter()
+        self.assertEqual(counter.fetch_and_add(5), 0)
+        self.assertEqual(counter.fetch_and_add(2), 5)
+        self.assertEqual(counter.fetch_and_add(0), 7)
+        counter.free()
+
+    @unittest.skipIf(MPIRUN is None or mpi4py is None, 'mpirun and mpi4py are required')
+    def test_counter_on_two_ranks(self):
+        returncode, output = run_via_mpi(COUNTER_SCRIPT.format(root=ROOT))
+        self.assertEqual(returncode, 0, msg=output)
+        self.assertEqual(output.count('claimed its share'), 2, msg=output)
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def test_start_map_shutdown(self):
+        data = np.random.rand(50, 3)
+        pool = comp_utils.WorkerPool(cores=MAX_CPU_CORES)
+        self.assertFalse(pool.is_active)
+        startup_time = pool.start()
+        self.assertTrue(pool.is_active)
+        self.assertGreaterEqual(startup_time, 0)
+        self.assertEqual(startup_time, pool.start())
+        results = pool.map(add_offset, data, func_kwargs={'offset': 2})
+        self.assertTrue(np.allclose(np.array(results), data + 2))
+        pool.shutdown()
+        self.assertFalse(pool.is_active)
+        with self.assertRaises(ValueError):
+            _ = pool.map(add_offset, data)
+
+    def test_reuse_in_parallel_compute(self):
+        data = np.random.rand(50, 3)
+        with comp_utils.WorkerPool(cores=MAX_CPU_CORES) as pool:
+            for offset in range(3):
+                results = comp_utils.parallel_compute(data, add_offset, func_args=[offset], pool=pool)
+                self.assertTrue(np.allclose(np.array(results), data + offset))
+            self.assertTrue(pool.is_active)
+        self.assertFalse(pool.is_active)
+
+    def test_map_list(self):
+        blocks = np.array_split(np.random.rand(50, 3), 4, axis=0)
+        for backend in ['processes', 'threads']:
+            with available_cores(4):
+                with comp_utils.WorkerPool(cores=2, backend=backend) as pool:
+                    self.assertEqual(pool.cores, 2)
+                    results = pool.map(block_mean, blocks)
+                    self.assertEqual(len(results), len(blocks))
+                    for block, block_results in zip(blocks, results):
+                        self.assertTrue(np.allclose(block_results, block.mean(axis=1)))
+                    with self.assertRaises(TypeError):
+                        _ = pool.map(block_mean, blocks, shared_memory=True)
+
+    def test_illegal_inputs(self):
+        with self.assertRaises(TypeError):
+            _ = comp_utils.WorkerPool(cores=2.5)
+        with self.assertRaises(TypeError):
+            _ = comp_utils.parallel_compute(np.arange(4), add_offset, pool='pool')
 
 
 if __name__ == '__main__':
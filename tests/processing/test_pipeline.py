@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:02:11 2026
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+sys.path.append("../../../pyUSID/")
+import pyUSID as usid
+from .test_comp_utils import available_cores
+from .test_process import make_simple_main_file, MeanProcess
+
+
+class ScaleProcess(usid.Process):
+
+    def __init__(self, h5_main, **kwargs):
+        super(ScaleProcess, self).__init__(h5_main, **kwargs)
+        self.process_name = 'Scale'
+        self.parms_dict = {'factor': 2.0}
+        self.duplicate_h5_groups, self.partial_h5_groups = self._check_for_duplicates()
+        self.reads = 0
+
+    def _create_results_datasets(self):
+        self.h5_results_grp = usid.hdf_utils.create_results_group(self.h5_main, self.process_name)
+        usid.hdf_utils.write_simple_attrs(self.h5_results_grp, self.parms_dict)
+        self.h5_scaled = usid.hdf_utils.write_main_dataset(self.h5_results_grp, self.h5_main.shape, 'Scaled',
+                                                           'Current', 'nA', None, None, dtype=np.float32,
+                                                           h5_pos_inds=self.h5_main.h5_pos_inds,
+                                                           h5_pos_vals=self.h5_main.h5_pos_vals,
+                                                           h5_spec_inds=self.h5_main.h5_spec_inds,
+                                                           h5_spec_vals=self.h5_main.h5_spec_vals)
+
+    def _get_existing_datasets(self):
+        self.h5_scaled = self.h5_results_grp['Scaled']
+
+    def _write_results_chunk(self):
+        self.pool = self._worker_pool
+        self.h5_scaled[self._get_pixels_in_current_batch(), :] = np.array(self._results)
+
+    @staticmethod
+    def _map_function(spectra, *args, **kwargs):
+        return 2 * spectra
+
+
+class TypedScaleProcess(ScaleProcess):
+
+    def __init__(self, h5_main, **kwargs):
+        super(TypedScaleProcess, self).__init__(h5_main, **kwargs)
+        self.results_dtype = np.float32
+        self.results_shape = (h5_main.shape[1],)
+
+    def _write_results_chunk(self):
+        self._write_results_direct(self.h5_scaled)
+
+
+class OffsetMeanProcess(MeanProcess):
+
+    @staticmethod
+    def _map_function(spectra, *args, **kwargs):
+        return np.mean(spectra) + kwargs.get('offset', 0)
+
+
+class TestProcessPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.h5_path = os.path.join(self.tmp_dir, 'pipeline.h5')
+        self.data = make_simple_main_file(self.h5_path)
+        self.stages = [lambda h5_main: ScaleProcess(h5_main, cores=1),
+                       lambda h5_grp: MeanProcess(h5_grp['Scaled'], cores=1)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def __run(self, max_mem_mb=1, compute_kwargs=None, **kwargs):
+        if compute_kwargs is None:
+            compute_kwargs = dict()
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            pipeline = usid.processing.ProcessPipeline(h5_f['Measurement_000/Channel_000/Raw_Data'], self.stages,
+                                                       max_mem_mb=max_mem_mb, **kwargs)
+            h5_grps = pipeline.compute(**compute_kwargs)
+            self.last_pipeline = pipeline
+            scaled = h5_grps[0]['Scaled'][()]
+            means = h5_grps[1]['Mean'][()]
+            statuses = [h5_grp['completed_positions'][()] for h5_grp in h5_grps]
+        return scaled, means, statuses
+
+    def test_intermediate_in_memory(self):
+        scaled, means, statuses = self.__run()
+        self.assertTrue(np.allclose(means[:, 0], 2 * self.data.mean(axis=1)))
+        # Intermediate results are neither written nor marked as completed
+        self.assertTrue(np.all(scaled == 0))
+        self.assertTrue(np.all(statuses[0] == 0))
+        self.assertTrue(np.all(statuses[1] == 1))
+
+    def test_persistent_intermediate(self):
+        scaled, means, statuses = self.__run(persistent=['Scaled'])
+        self.assertTrue(np.allclose(scaled, 2 * self.data))
+        self.assertTrue(np.allclose(means[:, 0], 2 * self.data.mean(axis=1)))
+        self.assertTrue(np.all(statuses[0] == 1))
+        self.assertTrue(np.all(statuses[1] == 1))
+
+    def test_shared_pool(self):
+        for backend in ['processes', 'threads']:
+            self.stages = [lambda h5_main: ScaleProcess(h5_main, cores=2, backend=backend),
+                           lambda h5_grp: MeanProcess(h5_grp['Scaled'], cores=2, backend=backend)]
+            with available_cores(4):
+                _, means, _ = self.__run(compute_kwargs={'override': True})
+            self.assertTrue(np.allclose(means[:, 0], 2 * self.data.mean(axis=1)))
+            for process in self.last_pipeline.processes:
+                self.assertEqual(process._backend, backend)
+            pool = self.last_pipeline.processes[0].pool
+            self.assertEqual(pool.cores, 2)
+            self.assertEqual(pool.backend, backend)
+
+    def test_dask_stage(self):
+        self.stages[1] = lambda h5_grp: MeanProcess(h5_grp['Scaled'], cores=1, dask_scheduler='threads')
+        _, means, _ = self.__run()
+        self.assertTrue(np.allclose(means[:, 0], 2 * self.data.mean(axis=1)))
+
+    def test_conflicting_backends(self):
+        self.stages[1] = lambda h5_grp: MeanProcess(h5_grp['Scaled'], cores=1, backend='threads')
+        with self.assertRaises(ValueError):
+            _ = self.__run()
+
+    def test_kwargs_forwarded(self):
+        self.stages[1] = lambda h5_grp: OffsetMeanProcess(h5_grp['Scaled'], cores=1)
+        _, means, _ = self.__run(compute_kwargs={'offset': 3})
+        self.assertTrue(np.allclose(means[:, 0], 2 * self.data.mean(axis=1) + 3))
+
+    def test_complete_results_indexed(self):
+        _ = self.__run(persistent=['Scaled'])
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            index = usid.hdf_utils.get_results_index(h5_main, 'Scale')
+            self.assertEqual(list(index.values()), [{'Raw_Data-Scale_000': ['completed_positions']}])
+            h5_grp = h5_f['Measurement_000/Channel_000/Raw_Data-Scale_000']
+            self.assertEqual(h5_grp.attrs['last_pixel'], h5_main.shape[0])
+            self.assertEqual(len(ScaleProcess(h5_main, cores=1).duplicate_h5_groups), 1)
+            self.assertEqual(len(MeanProcess(h5_grp['Scaled'], cores=1).duplicate_h5_groups), 1)
+
+    def test_typed_intermediate(self):
+        self.stages[0] = lambda h5_main: TypedScaleProcess(h5_main, cores=1)
+        for persistent in [[], ['Scaled']]:
+            with h5py.File(self.h5_path, mode='r+') as h5_f:
+                pipeline = usid.processing.ProcessPipeline(h5_f['Measurement_000/Channel_000/Raw_Data'],
+                                                           self.stages, max_mem_mb=1, persistent=persistent)
+                h5_grps = pipeline.compute(override=True)
+                scaled = h5_grps[0]['Scaled'][()]
+                means = h5_grps[1]['Mean'][()]
+            self.assertTrue(np.allclose(means[:, 0], 2 * self.data.mean(axis=1)))
+            self.assertTrue(np.allclose(scaled, 2 * self.data if persistent else 0))
+
+    def test_resume(self):
+        _ = self.__run()
+        pending = np.arange(40, 70)
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_grp = h5_f['Measurement_000/Channel_000/Raw_Data-Scale_000/Scaled-Mean_000']
+            h5_grp['completed_positions'][pending] = 0
+            h5_grp['Mean'][pending, 0] = 0
+        scaled, means, statuses = self.__run()
+        self.assertTrue(np.allclose(means[:, 0], 2 * self.data.mean(axis=1)))
+        self.assertTrue(np.all(statuses[1] == 1))
+        with h5py.File(self.h5_path, mode='r') as h5_f:
+            # The partially computed groups were resumed rather than duplicated
+            self.assertEqual(len([key for key in h5_f['Measurement_000/Channel_000'].keys() if 'Scale' in key]), 1)
+
+    def test_reuse_complete_stage(self):
+        _ = self.__run(persistent=['Scaled'])
+        self.stages[1] = lambda h5_grp: MeanProcess(h5_grp['Scaled'], cores=1)
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            del h5_f['Measurement_000/Channel_000/Raw_Data-Scale_000/Scaled-Mean_000']
+        scaled, means, statuses = self.__run()
+        self.assertTrue(np.allclose(means[:, 0], 2 * self.data.mean(axis=1)))
+
+    def test_illegal_inputs(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            with self.assertRaises(TypeError):
+                _ = usid.processing.ProcessPipeline(self.data, self.stages)
+            with self.assertRaises(TypeError):
+                _ = usid.processing.ProcessPipeline(h5_main, [])
+            with self.assertRaises(TypeError):
+                _ = usid.processing.ProcessPipeline(h5_main, self.stages, persistent='Scaled')
+            with self.assertRaises(TypeError):
+                _ = usid.processing.ProcessPipeline(h5_main, [lambda h5_main: h5_main]).compute()
+
+
+if __name__ == '__main__':
+    unittest.main()
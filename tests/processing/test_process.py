@@ -6,7 +6,14 @@ Created on Tue Nov  3 15:07:16 2017
 @author: Emily Costa, Suhas Somnath
 """
 from __future__ import division, print_function, unicode_literals, absolute_import
+import os
+import time
 import unittest
+import warnings
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 import shutil
 import numpy as np
 import h5py
@@ -14,6 +21,7 @@ import sys
 #from pycroscopy.processing.fft import LowPassFilter
 from .proc_utils import sho_slow_guess
 from .data_utils import *
+from .test_comp_utils import available_cores
 from shutil import copyfile
 #from pycroscopy.processing.signal_filter import SignalFilter
 import tempfile
@@ -357,5 +365,729 @@ class TestProcess(unittest.TestCase):
 
         #self.assertEqual(process.data, None)
 '''
+
+
+def make_simple_main_file(h5_path, num_pos=200, num_spec=16, chunks=None, compression=None):
+    data = np.random.rand(num_pos, num_spec).astype(np.float32)
+    with h5py.File(h5_path, mode='w') as h5_f:
+        h5_grp = h5_f.create_group('Measurement_000/Channel_000')
+        usid.hdf_utils.write_main_dataset(h5_grp, data, 'Raw_Data', 'Current', 'nA',
+                                          usid.write_utils.Dimension('X', 'nm', num_pos),
+                                          usid.write_utils.Dimension('Bias', 'V', num_spec),
+                                          chunks=chunks, compression=compression)
+    return data
+
+
+class MeanProcess(usid.Process):
+
+    def __init__(self, h5_main, **kwargs):
+        super(MeanProcess, self).__init__(h5_main, **kwargs)
+        self.process_name = 'Mean'
+        self.parms_dict = {'statistic': 'mean'}
+        self.duplicate_h5_groups, self.partial_h5_groups = self._check_for_duplicates()
+
+    def _create_results_datasets(self):
+        self.h5_results_grp = usid.hdf_utils.create_results_group(self.h5_main, self.process_name)
+        usid.hdf_utils.write_simple_attrs(self.h5_results_grp, self.parms_dict)
+        self.h5_results = usid.hdf_utils.write_main_dataset(self.h5_results_grp, (self.h5_main.shape[0], 1),
+                                                            'Mean', 'Current', 'nA', None,
+                                                            usid.write_utils.Dimension('Empty', 'a. u.', 1),
+                                                            dtype=np.float32,
+                                                            h5_pos_inds=self.h5_main.h5_pos_inds,
+                                                            h5_pos_vals=self.h5_main.h5_pos_vals)
+
+    def _get_existing_datasets(self):
+        self.h5_results = self.h5_results_grp['Mean']
+
+    def _write_results_chunk(self):
+        pos_in_batch = self._get_pixels_in_current_batch()
+        self.h5_results[pos_in_batch, 0] = np.array(self._results)
+
+    @staticmethod
+    def _map_function(spectra, *args, **kwargs):
+        return np.mean(spectra)
+
+
+class BlockMeanProcess(MeanProcess):
+
+    @staticmethod
+    def _map_block_function(spectra, *args, **kwargs):
+        return np.mean(spectra, axis=1)
+
+
+class BatchRecordingProcess(MeanProcess):
+
+    def __init__(self, h5_main, **kwargs):
+        super(BatchRecordingProcess, self).__init__(h5_main, **kwargs)
+        self.batches = []
+
+    def _write_results_chunk(self):
+        self.batches.append(self._get_pixels_in_current_batch())
+        super(BatchRecordingProcess, self)._write_results_chunk()
+
+
+class SlowMeanProcess(BatchRecordingProcess):
+
+    @staticmethod
+    def _map_function(spectra, *args, **kwargs):
+        time.sleep(1E-3)
+        return np.mean(spectra)
+
+
+class TypedStatsProcess(BatchRecordingProcess):
+
+    stats_dtype = np.dtype([('mean', np.float32), ('max', np.float32)])
+
+    def __init__(self, h5_main, **kwargs):
+        super(TypedStatsProcess, self).__init__(h5_main, **kwargs)
+        self.results_dtype = self.stats_dtype
+        self.results_types = []
+
+    def _create_results_datasets(self):
+        self.h5_results_grp = usid.hdf_utils.create_results_group(self.h5_main, self.process_name)
+        usid.hdf_utils.write_simple_attrs(self.h5_results_grp, self.parms_dict)
+        self.h5_results = usid.hdf_utils.write_main_dataset(self.h5_results_grp, (self.h5_main.shape[0], 1),
+                                                            'Mean', 'Current', 'nA', None,
+                                                            usid.write_utils.Dimension('Empty', 'a. u.', 1),
+                                                            dtype=self.stats_dtype,
+                                                            h5_pos_inds=self.h5_main.h5_pos_inds,
+                                                            h5_pos_vals=self.h5_main.h5_pos_vals)
+
+    def _write_results_chunk(self):
+        self.batches.append(self._get_pixels_in_current_batch())
+        self.results_types.append(type(self._results))
+        self._write_results_direct(self.h5_results)
+
+    @staticmethod
+    def _map_function(spectra, *args, **kwargs):
+        return np.mean(spectra), np.max(spectra)
+
+
+class TypedBlockStatsProcess(TypedStatsProcess):
+
+    @staticmethod
+    def _map_block_function(spectra, *args, **kwargs):
+        stats = np.zeros(spectra.shape[0], dtype=TypedStatsProcess.stats_dtype)
+        stats['mean'] = np.mean(spectra, axis=1)
+        stats['max'] = np.max(spectra, axis=1)
+        return stats
+
+
+class FlakyMeanProcess(BatchRecordingProcess):
+
+    @staticmethod
+    def _map_function(spectra, *args, **kwargs):
+        fail_above = kwargs.get('fail_above')
+        if fail_above is not None and spectra[0] > fail_above:
+            raise ValueError('diverged')
+        return np.mean(spectra)
+
+
+class TestProcessCompute(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.h5_path = os.path.join(self.tmp_dir, 'process.h5')
+        self.data = make_simple_main_file(self.h5_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def __run_mean(self, pos_per_batch=None, proc_class=MeanProcess, compute_kwargs=None, **kwargs):
+        if compute_kwargs is None:
+            compute_kwargs = dict()
+        kwargs.setdefault('cores', 1)
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = proc_class(h5_f['Measurement_000/Channel_000/Raw_Data'], **kwargs)
+            if pos_per_batch is not None:
+                proc._max_pos_per_read = pos_per_batch
+            h5_grp = proc.compute(**compute_kwargs)
+            results = h5_grp['Mean'][()]
+            status = h5_grp['completed_positions'][()]
+        self.last_process = proc
+        return results, status
+
+    def test_compute_serial(self):
+        results, status = self.__run_mean(pos_per_batch=30)
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+
+    def test_compute_prefetch(self):
+        results, status = self.__run_mean(pos_per_batch=30, prefetch=True)
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+
+    def test_prefetch_memory(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            plain = MeanProcess(h5_main, cores=1, max_mem_mb=1)
+            prefetching = MeanProcess(h5_main, cores=1, max_mem_mb=1, prefetch=True)
+            self.assertEqual(prefetching._max_pos_per_read, plain._max_pos_per_read // 2)
+
+    def test_compute_write_behind(self):
+        results, status = self.__run_mean(pos_per_batch=30, write_behind=2, prefetch=True)
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+
+    def test_write_behind_memory(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            plain = MeanProcess(h5_main, cores=1, max_mem_mb=1)
+            writing = MeanProcess(h5_main, cores=1, max_mem_mb=1, write_behind=3)
+            self.assertEqual(writing._max_pos_per_read, plain._max_pos_per_read // 4)
+
+    def test_write_behind_error_raised(self):
+
+        class FailingWrite(MeanProcess):
+
+            def _write_results_chunk(self):
+                raise IOError('Could not write')
+
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = FailingWrite(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1, write_behind=1)
+            proc._max_pos_per_read = 50
+            with self.assertRaises(IOError):
+                _ = proc.compute()
+            self.assertTrue(np.all(h5_f[proc.h5_results_grp.name + '/completed_positions'][()] == 0))
+
+    def test_write_behind_error_does_not_mask(self):
+
+        class FailingWriteAndCompute(MeanProcess):
+
+            def _unit_computation(self, *args, **kwargs):
+                if self._get_pixels_in_current_batch()[0] >= 50:
+                    raise ValueError('Could not compute')
+                super(FailingWriteAndCompute, self)._unit_computation(*args, **kwargs)
+
+            def _write_results_chunk(self):
+                raise IOError('Could not write')
+
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = FailingWriteAndCompute(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1, write_behind=2)
+            proc._max_pos_per_read = 50
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                # The error raised while computing is the one that reaches the caller
+                with self.assertRaises(ValueError):
+                    _ = proc.compute()
+            self.assertTrue(any(['Could not write' in str(item.message) for item in caught]))
+
+    def test_write_behind_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            with self.assertRaises(TypeError):
+                _ = MeanProcess(h5_main, write_behind=1.5)
+            with self.assertRaises(ValueError):
+                _ = MeanProcess(h5_main, write_behind=-1)
+
+    def test_reuse_external_pool(self):
+        with usid.WorkerPool(cores=1) as pool:
+            for _ in range(2):
+                results, status = self.__run_mean(pos_per_batch=30, pool=pool)
+                self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+                self.assertTrue(pool.is_active)
+                os.remove(self.h5_path)
+                self.data = make_simple_main_file(self.h5_path)
+
+    def test_compute_block_function(self):
+        results, status = self.__run_mean(pos_per_batch=30, proc_class=BlockMeanProcess)
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+
+    def test_compute_block_function_pooled(self):
+        for backend in ['processes', 'threads']:
+            for kwargs in [dict(), dict(prefetch=True, write_behind=1)]:
+                with available_cores(4):
+                    results, status = self.__run_mean(pos_per_batch=30, proc_class=BlockMeanProcess, cores=2,
+                                                      backend=backend, compute_kwargs={'override': True}, **kwargs)
+                self.assertEqual(self.last_process._cores, 2)
+                self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+                self.assertTrue(np.all(status == 1))
+
+    def test_uses_block_function(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            self.assertFalse(MeanProcess(h5_main)._uses_block_function())
+            self.assertTrue(BlockMeanProcess(h5_main)._uses_block_function())
+
+    def test_batches_aligned_to_chunks(self):
+        os.remove(self.h5_path)
+        self.data = make_simple_main_file(self.h5_path, chunks=(16, 16), compression='gzip')
+        results, status = self.__run_mean(pos_per_batch=40, proc_class=BatchRecordingProcess, prefetch=True)
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+        batches = self.last_process.batches
+        self.assertEqual(np.concatenate(batches).tolist(), list(range(self.data.shape[0])))
+        for batch in batches:
+            self.assertEqual(batch[0] % 16, 0)
+            self.assertLessEqual(len(batch), 40)
+
+    def test_batches_smaller_than_chunks(self):
+        os.remove(self.h5_path)
+        self.data = make_simple_main_file(self.h5_path, chunks=(64, 16))
+        results, status = self.__run_mean(pos_per_batch=40, proc_class=BatchRecordingProcess)
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(max([len(batch) for batch in self.last_process.batches]) <= 40)
+
+    def test_checkpoint_interval(self):
+        results, status = self.__run_mean(pos_per_batch=120, proc_class=SlowMeanProcess,
+                                          compute_kwargs={'checkpoint_interval': 0.02})
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+        batch_sizes = [len(batch) for batch in self.last_process.batches]
+        # Starts with a small batch, grows, and never exceeds the memory limit
+        self.assertEqual(batch_sizes[0], 1)
+        self.assertGreater(max(batch_sizes), 1)
+        self.assertLessEqual(max(batch_sizes), 120)
+        self.assertLess(max(batch_sizes), self.data.shape[0])
+
+    def test_checkpoint_interval_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            with self.assertRaises(ValueError):
+                _ = proc.compute(checkpoint_interval=-1)
+            with self.assertRaises(TypeError):
+                _ = proc.compute(checkpoint_interval='1 min')
+
+    def test_dynamic_schedule(self):
+        os.remove(self.h5_path)
+        self.data = make_simple_main_file(self.h5_path, chunks=(8, 16))
+        results, status = self.__run_mean(pos_per_batch=30, proc_class=BatchRecordingProcess, prefetch=True,
+                                          compute_kwargs={'schedule': 'dynamic'})
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+        batches = self.last_process.batches
+        self.assertEqual(np.concatenate(batches).tolist(), list(range(self.data.shape[0])))
+        # Claims are multiples of the chunk size
+        self.assertTrue(all([len(batch) == 24 for batch in batches[:-1]]))
+
+    def test_resume_only_pending_positions(self):
+        _ = self.__run_mean(pos_per_batch=30)
+        pending = np.hstack((np.arange(10, 25), np.arange(150, 160)))
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_grp = h5_f['Measurement_000/Channel_000/Raw_Data-Mean_000']
+            h5_grp['completed_positions'][pending] = 0
+            h5_grp['Mean'][pending, 0] = 0
+        results, status = self.__run_mean(pos_per_batch=30, proc_class=BatchRecordingProcess)
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+        self.assertEqual(np.concatenate(self.last_process.batches).tolist(), pending.tolist())
+
+    def test_typed_results(self):
+        for kwargs in [dict(), dict(backend='threads'), dict(shared_memory=True)]:
+            results, status = self.__run_mean(pos_per_batch=30, proc_class=TypedStatsProcess,
+                                              compute_kwargs={'override': True}, **kwargs)
+            self.assertEqual(results.dtype, TypedStatsProcess.stats_dtype)
+            self.assertTrue(np.allclose(results['mean'][:, 0], self.data.mean(axis=1)))
+            self.assertTrue(np.allclose(results['max'][:, 0], self.data.max(axis=1)))
+            self.assertTrue(np.all(status == 1))
+            self.assertEqual(set(self.last_process.results_types), {np.ndarray})
+
+    def test_typed_results_all_paths(self):
+        for proc_class, kwargs in [(TypedStatsProcess, dict(dask_scheduler='threads')),
+                                   (TypedBlockStatsProcess, dict()),
+                                   (TypedBlockStatsProcess, dict(dask_scheduler='threads'))]:
+            results, status = self.__run_mean(pos_per_batch=30, proc_class=proc_class,
+                                              compute_kwargs={'override': True}, **kwargs)
+            self.assertEqual(results.dtype, TypedStatsProcess.stats_dtype)
+            self.assertTrue(np.allclose(results['mean'][:, 0], self.data.mean(axis=1)))
+            self.assertTrue(np.allclose(results['max'][:, 0], self.data.max(axis=1)))
+            self.assertTrue(np.all(status == 1))
+            self.assertEqual(set(self.last_process.results_types), {np.ndarray})
+
+    def test_typed_results_wrong_shape(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = TypedBlockStatsProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            proc.results_shape = (2,)
+            with self.assertRaises(ValueError):
+                _ = proc.compute()
+
+    def test_typed_results_resume(self):
+        _ = self.__run_mean(pos_per_batch=30, proc_class=TypedStatsProcess)
+        pending = np.hstack((np.arange(10, 25), np.arange(150, 160)))
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_grp = h5_f['Measurement_000/Channel_000/Raw_Data-Mean_000']
+            h5_grp['completed_positions'][pending] = 0
+            h5_grp['Mean'][pending, 0] = np.zeros(pending.size, dtype=TypedStatsProcess.stats_dtype)
+        results, status = self.__run_mean(pos_per_batch=30, proc_class=TypedStatsProcess)
+        self.assertEqual(np.concatenate(self.last_process.batches).tolist(), pending.tolist())
+        self.assertTrue(np.allclose(results['mean'][:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+
+    def test_allocate_results(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            self.assertIsNone(proc._allocate_results(5))
+            proc.results_shape = (3,)
+            proc.results_dtype = np.complex64
+            out = proc._allocate_results(5)
+            self.assertEqual(out.shape, (5, 3))
+            self.assertEqual(out.dtype, np.complex64)
+            proc.results_shape = 'three'
+            with self.assertRaises(TypeError):
+                _ = proc._allocate_results(5)
+            with self.assertRaises(TypeError):
+                proc._write_results_direct(np.zeros(5))
+
+    def test_trace(self):
+        results, _ = self.__run_mean(pos_per_batch=50, prefetch=True, write_behind=1,
+                                     compute_kwargs={'trace': True})
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        spans = self.last_process.tracer.get_spans()
+        for name in ['read', 'compute', 'write']:
+            self.assertEqual(len([span for span in spans if span['name'] == name]), 4)
+        # Flushed after every batch and once more at the end
+        for name in ['flush', 'status']:
+            self.assertEqual(len([span for span in spans if span['name'] == name]), 5)
+        bytes_read = sum([span['bytes_read'] for span in spans if span['name'] == 'read'])
+        self.assertEqual(bytes_read, self.data.nbytes)
+        self.assertEqual(sum([span['bytes_written'] for span in spans if span['name'] == 'status']),
+                         self.data.shape[0])
+
+    def test_trace_disabled_by_default(self):
+        _ = self.__run_mean(pos_per_batch=50)
+        self.assertFalse(self.last_process.tracer.enabled)
+        self.assertEqual(self.last_process.tracer.get_spans(), [])
+
+    def test_trace_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            with self.assertRaises(TypeError):
+                _ = proc.compute(trace='yes')
+
+    def test_shared_memory(self):
+        results, status = self.__run_mean(pos_per_batch=60, shared_memory=True)
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+
+    def test_shared_memory_not_bool(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            with self.assertRaises(TypeError):
+                _ = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], shared_memory='yes')
+
+    def test_dask_threads_lazy(self):
+        results, status = self.__run_mean(pos_per_batch=60, proc_class=BatchRecordingProcess,
+                                          dask_scheduler='threads')
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+        self.assertEqual(len(self.last_process.batches), 4)
+
+    def test_dask_block_function_prefetch(self):
+        results, status = self.__run_mean(pos_per_batch=60, proc_class=BlockMeanProcess, prefetch=True,
+                                          dask_scheduler='synchronous')
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+
+    def test_dask_processes(self):
+        results, status = self.__run_mean(pos_per_batch=100, proc_class=BlockMeanProcess,
+                                          dask_scheduler='processes')
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+
+    def test_dask_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            with self.assertRaises(ValueError):
+                _ = MeanProcess(h5_main, dask_scheduler='gpu')
+            with self.assertRaises(TypeError):
+                _ = MeanProcess(h5_main, dask_scheduler=1)
+            with self.assertRaises(ValueError):
+                _ = MeanProcess(h5_main, dask_scheduler='threads', pool=usid.processing.WorkerPool(cores=1))
+
+    def test_flush_only_at_end(self):
+        results, status = self.__run_mean(pos_per_batch=30, compute_kwargs={'flush_every': None, 'trace': True})
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+        spans = self.last_process.tracer.get_spans()
+        self.assertEqual(len([span for span in spans if span['name'] == 'write']), 7)
+        self.assertEqual(len([span for span in spans if span['name'] == 'flush']), 1)
+        self.assertEqual([span['bytes_written'] for span in spans if span['name'] == 'status'], [200])
+
+    def test_flush_every_few_batches(self):
+        results, status = self.__run_mean(pos_per_batch=30, write_behind=1,
+                                          compute_kwargs={'flush_every': 3, 'trace': True})
+        self.assertTrue(np.all(status == 1))
+        spans = self.last_process.tracer.get_spans()
+        # After the 3rd and 6th batches and at the end
+        self.assertEqual([span['bytes_written'] for span in spans if span['name'] == 'status'], [90, 90, 20])
+
+    def test_status_waits_for_flush(self):
+
+        class FailingWrite(MeanProcess):
+
+            def _write_results_chunk(self):
+                if self._get_pixels_in_current_batch()[0] >= 120:
+                    raise IOError('Disk is full')
+                super(FailingWrite, self)._write_results_chunk()
+
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = FailingWrite(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            proc._max_pos_per_read = 30
+            with self.assertRaises(IOError):
+                _ = proc.compute(flush_every=2)
+            status = proc.h5_results_grp['completed_positions'][()]
+        # Batches 1 - 4 were flushed. Batch 5 was written but not yet flushed
+        self.assertEqual(np.where(status == 1)[0].tolist(), list(range(120)))
+
+    def test_flush_policy_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            with self.assertRaises(ValueError):
+                _ = proc.compute(flush_every=0)
+            with self.assertRaises(TypeError):
+                _ = proc.compute(flush_every=1.5)
+            with self.assertRaises(ValueError):
+                _ = proc.compute(flush_interval=-1)
+            with self.assertRaises(TypeError):
+                _ = proc.compute(flush_interval='1 min')
+
+    def test_calibrate_memory(self):
+
+        class HungryMeanProcess(MeanProcess):
+
+            @staticmethod
+            def _map_function(spectra, *args, **kwargs):
+                # Temporary array 100x the size of the spectrum
+                return np.mean(np.tile(spectra, 100))
+
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = HungryMeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            max_pos = proc._max_pos_per_read
+            mem_multiplier = proc.calibrate_memory(num_pos=4)
+            self.assertGreater(mem_multiplier, 10)
+            self.assertLess(proc._max_pos_per_read, max_pos / 10)
+            h5_grp = proc.compute()
+            self.assertEqual(h5_grp.attrs['calibrated_mem_multiplier'], mem_multiplier)
+            self.assertTrue(np.allclose(h5_grp['Mean'][()][:, 0], self.data.mean(axis=1)))
+
+    def test_calibrate_memory_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            with self.assertRaises(ValueError):
+                _ = proc.calibrate_memory(num_pos=0)
+            with self.assertRaises(TypeError):
+                _ = proc.calibrate_memory(num_pos=2.5)
+            with self.assertRaises(ValueError):
+                _ = proc.calibrate_memory(safety_factor=0.5)
+            with self.assertRaises(TypeError):
+                _ = proc.calibrate_memory(safety_factor='large')
+
+    def test_calibrate_memory_stops_tracing(self):
+        if tracemalloc is None:
+            self.skipTest('tracemalloc is not available')
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = FlakyMeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            self.assertFalse(tracemalloc.is_tracing())
+            with self.assertRaises(ValueError):
+                _ = proc.calibrate_memory(num_pos=4, fail_above=-1)
+            self.assertFalse(tracemalloc.is_tracing())
+
+    def test_autotune(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            proc = BatchRecordingProcess(h5_main, cores=1)
+            settings = proc.autotune(cores=[1], batch_sizes=[2, 8], backends=['processes', 'threads', 'dask-synchronous'])
+            self.assertIn(settings['autotuned_batch_size'], [2, 8])
+            self.assertIn(settings['autotuned_backend'], ['processes', 'threads', 'dask-synchronous'])
+            self.assertGreater(settings['autotuned_pos_per_sec'], 0)
+            h5_grp = proc.compute()
+            self.assertTrue(np.allclose(h5_grp['Mean'][()][:, 0], self.data.mean(axis=1)))
+            self.assertTrue(all([len(batch) <= settings['autotuned_batch_size'] for batch in proc.batches]))
+            self.assertEqual(h5_grp.attrs['autotuned_batch_size'], settings['autotuned_batch_size'])
+            self.assertEqual(h5_grp.attrs['autotuned_backend'], settings['autotuned_backend'])
+
+            # A new object adopts the recorded settings instead of benchmarking again
+            proc = BatchRecordingProcess(h5_main, cores=1)
+            self.assertEqual(proc.autotune(batch_sizes=[4]), settings)
+
+    def test_autotune_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            with self.assertRaises(TypeError):
+                _ = proc.autotune(cores=[1.5])
+            with self.assertRaises(TypeError):
+                _ = proc.autotune(batch_sizes=[0])
+            with self.assertRaises(TypeError):
+                _ = proc.autotune(backends='threads')
+            with self.assertRaises(ValueError):
+                _ = proc.autotune(backends=['mpi'])
+            with self.assertRaises(ValueError):
+                _ = proc.autotune(backends=['dask-gpu'])
+            with self.assertRaises(TypeError):
+                _ = proc.autotune(override=1)
+
+    def test_duplicates_found_via_index(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            h5_grp = MeanProcess(h5_main, cores=1).compute()
+            parms_hash = h5_grp.attrs['parms_hash']
+            self.assertEqual(usid.hdf_utils.find_indexed_results(h5_main, 'Mean', parms_hash),
+                             [(h5_grp, ['completed_positions'])])
+
+            proc = MeanProcess(h5_main, cores=1)
+            self.assertEqual(proc.duplicate_h5_groups, [h5_grp])
+            self.assertEqual(proc.compute(), h5_grp)
+
+            # Groups written before results were indexed are compared by their attributes and then indexed
+            for key in list(h5_main.parent.attrs.keys()):
+                if key.startswith(usid.hdf_utils.RESULTS_INDEX_PREFIX):
+                    del h5_main.parent.attrs[key]
+            proc = MeanProcess(h5_main, cores=1)
+            self.assertEqual(proc.duplicate_h5_groups, [h5_grp])
+            self.assertEqual(len(usid.hdf_utils.find_indexed_results(h5_main, 'Mean', parms_hash)), 1)
+
+            # Different parameters
+            h5_grp.attrs['statistic'] = 'median'
+            proc = MeanProcess(h5_main, cores=1)
+            proc.parms_dict = {'statistic': 'median'}
+            self.assertEqual(proc._check_for_duplicates(), ([], []))
+
+    def test_index_decides_completion(self):
+        _ = self.__run_mean(pos_per_batch=30)
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            h5_grp = h5_f['Measurement_000/Channel_000/Raw_Data-Mean_000']
+            parms_hash = h5_grp.attrs['parms_hash']
+            # As if the computation stopped after the last flush but before the group was indexed as complete
+            del h5_main.parent.attrs[usid.hdf_utils.RESULTS_INDEX_PREFIX + 'Raw_Data:Mean:' + parms_hash]
+            usid.hdf_utils.index_results_group(h5_main, 'Mean', parms_hash, h5_grp)
+            proc = MeanProcess(h5_main, cores=1)
+            self.assertEqual(proc.partial_h5_groups, [h5_grp])
+            self.assertEqual(proc.duplicate_h5_groups, [])
+            self.assertEqual(proc.compute(), h5_grp)
+            self.assertEqual(MeanProcess(h5_main, cores=1).duplicate_h5_groups, [h5_grp])
+
+            # Groups written since the process was indexed are only found via the index
+            h5_copy = h5_main.parent.create_group('Raw_Data-Mean_001')
+            usid.hdf_utils.write_simple_attrs(h5_copy, {'statistic': 'mean', 'last_pixel': h5_main.shape[0]})
+            self.assertEqual(MeanProcess(h5_main, cores=1).duplicate_h5_groups, [h5_grp])
+
+    def test_resume_keeps_index(self):
+        _ = self.__run_mean(pos_per_batch=30)
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            h5_grp = h5_f['Measurement_000/Channel_000/Raw_Data-Mean_000']
+            parms_hash = h5_grp.attrs['parms_hash']
+            h5_grp['completed_positions'][50:] = 0
+
+            proc = MeanProcess(h5_main, cores=1)
+            self.assertEqual(proc.partial_h5_groups, [h5_grp])
+            self.assertEqual(proc.compute(), h5_grp)
+            # Resuming must neither rehash the attributes of the group nor index it under another hash
+            self.assertEqual(h5_grp.attrs['parms_hash'], parms_hash)
+            self.assertEqual(usid.hdf_utils.get_results_index(h5_main, 'Mean'),
+                             {parms_hash: {'Raw_Data-Mean_000': ['completed_positions']}})
+            self.assertEqual(MeanProcess(h5_main, cores=1).duplicate_h5_groups, [h5_grp])
+
+    def test_isolate_failures(self):
+        failed = np.where(self.data[:, 0] > 0.9)[0]
+        for index, kwargs in enumerate([dict(), dict(write_behind=1), dict(backend='threads')]):
+            results, status = self.__run_mean(pos_per_batch=30, proc_class=FlakyMeanProcess,
+                                              compute_kwargs={'override': True, 'isolate_failures': True,
+                                                              'fail_above': 0.9}, **kwargs)
+            self.assertEqual(np.where(status == 2)[0].tolist(), failed.tolist())
+            self.assertTrue(np.all(np.delete(status, failed) == 1))
+            self.assertTrue(np.allclose(np.delete(results[:, 0], failed), np.delete(self.data.mean(axis=1), failed)))
+            self.assertTrue(np.all(results[failed, 0] == 0))
+            with h5py.File(self.h5_path, mode='r') as h5_f:
+                h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+                h5_grp = h5_f['Measurement_000/Channel_000/Raw_Data-Mean_{:03d}'.format(index)]
+                failures = h5_grp['failed_positions'][()]
+                self.assertEqual(failures['Position'].tolist(), failed.tolist())
+                self.assertTrue(all([error == b'ValueError: diverged' for error in failures['Error']]))
+                # Groups with failed positions are not complete
+                indexed = usid.hdf_utils.find_indexed_results(h5_main, 'Mean', h5_grp.attrs['parms_hash'])
+                self.assertEqual(dict([(grp.name, done) for grp, done in indexed])[h5_grp.name], [])
+
+    def test_retry_failed(self):
+        failed = np.where(self.data[:, 0] > 0.9)[0]
+        _ = self.__run_mean(pos_per_batch=30, proc_class=FlakyMeanProcess,
+                            compute_kwargs={'isolate_failures': True, 'fail_above': 0.9})
+        # Failed positions are not computed again unless asked to
+        _, status = self.__run_mean(pos_per_batch=30, proc_class=FlakyMeanProcess)
+        self.assertEqual(self.last_process.batches, [])
+        self.assertEqual(np.where(status == 2)[0].tolist(), failed.tolist())
+
+        # Only some of the failed positions fail again
+        _, status = self.__run_mean(pos_per_batch=30, proc_class=FlakyMeanProcess,
+                                    compute_kwargs={'retry_failed': True, 'isolate_failures': True,
+                                                    'fail_above': 0.95})
+        self.assertEqual(np.concatenate(self.last_process.batches).tolist(), failed.tolist())
+        still_failed = np.where(self.data[:, 0] > 0.95)[0]
+        self.assertEqual(np.where(status == 2)[0].tolist(), still_failed.tolist())
+        with h5py.File(self.h5_path, mode='r') as h5_f:
+            failures = h5_f['Measurement_000/Channel_000/Raw_Data-Mean_000/failed_positions'][()]
+            self.assertEqual(failures['Position'].tolist(), still_failed.tolist())
+
+        results, status = self.__run_mean(pos_per_batch=30, proc_class=FlakyMeanProcess,
+                                          compute_kwargs={'retry_failed': True})
+        self.assertEqual(np.concatenate(self.last_process.batches).tolist(), still_failed.tolist())
+        self.assertTrue(np.allclose(results[:, 0], self.data.mean(axis=1)))
+        self.assertTrue(np.all(status == 1))
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            h5_grp = h5_f['Measurement_000/Channel_000/Raw_Data-Mean_000']
+            self.assertEqual(h5_grp['failed_positions'].shape, (0,))
+            self.assertEqual(MeanProcess(h5_main, cores=1).duplicate_h5_groups, [h5_grp])
+
+    def test_failures_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            proc = MeanProcess(h5_main, cores=1)
+            with self.assertRaises(TypeError):
+                _ = proc.compute(isolate_failures=1)
+            with self.assertRaises(TypeError):
+                _ = proc.compute(retry_failed='yes')
+            with self.assertRaises(ValueError):
+                _ = BlockMeanProcess(h5_main, cores=1).compute(isolate_failures=True)
+            # Exceptions are raised as usual otherwise
+            with self.assertRaises(ValueError):
+                _ = FlakyMeanProcess(h5_main, cores=1).compute(override=True, fail_above=0.9)
+
+    def test_schedule_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1)
+            with self.assertRaises(ValueError):
+                _ = proc.compute(schedule='guided')
+            with self.assertRaises(TypeError):
+                _ = proc.compute(schedule=1)
+
+    def test_threads_backend(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            proc = MeanProcess(h5_main, cores=2, backend='threads')
+            h5_grp = proc.compute()
+            self.assertTrue(np.allclose(h5_grp['Mean'][()][:, 0], self.data.mean(axis=1)))
+
+            with usid.processing.WorkerPool(cores=1, backend='threads') as pool:
+                proc = MeanProcess(h5_main, cores=1, pool=pool)
+                self.assertEqual(proc._backend, 'threads')
+
+    def test_threads_backend_illegal(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            h5_main = h5_f['Measurement_000/Channel_000/Raw_Data']
+            with self.assertRaises(ValueError):
+                _ = MeanProcess(h5_main, backend='gpu')
+            with self.assertRaises(ValueError):
+                _ = MeanProcess(h5_main, backend='threads', dask_scheduler='threads')
+
+    def test_aggregate_io_without_mpi(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            proc = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], cores=1, aggregate_io=True)
+            h5_grp = proc.compute()
+            self.assertTrue(np.allclose(h5_grp['Mean'][()][:, 0], self.data.mean(axis=1)))
+            self.assertTrue(np.all(h5_grp['completed_positions'][()] == 1))
+
+    def test_aggregate_io_not_bool(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            with self.assertRaises(TypeError):
+                _ = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], aggregate_io=1)
+
+    def test_prefetch_not_bool(self):
+        with h5py.File(self.h5_path, mode='r+') as h5_f:
+            with self.assertRaises(TypeError):
+                _ = MeanProcess(h5_f['Measurement_000/Channel_000/Raw_Data'], prefetch=1)
+
+
 if __name__ == '__main__':
     unittest.main()
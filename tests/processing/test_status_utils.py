@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:02:45 2026
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+
+sys.path.append("../../pyUSID/")
+from pyUSID.processing import status_utils
+
+
+class TestValuesToRuns(unittest.TestCase):
+
+    def test_multiple_runs(self):
+        starts, stops = status_utils.values_to_runs([0, 1, 2, 5, 7, 8])
+        self.assertEqual(starts.tolist(), [0, 5, 7])
+        self.assertEqual(stops.tolist(), [3, 6, 9])
+
+    def test_empty(self):
+        starts, stops = status_utils.values_to_runs([])
+        self.assertEqual(starts.size, 0)
+        self.assertEqual(stops.size, 0)
+
+
+class TestPendingPositions(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = np.hstack((np.arange(3, 10), np.arange(20, 22), np.arange(40, 55)))
+        self.pending = status_utils.PendingPositions([3, 20, 40], [10, 22, 55])
+
+    def test_size(self):
+        self.assertEqual(self.pending.size, self.expected.size)
+        self.assertEqual(len(self.pending), self.expected.size)
+        self.assertEqual(self.pending.num_runs, 3)
+
+    def test_slicing(self):
+        for start, stop in [(0, 24), (0, 5), (5, 12), (8, 9), (10, 10), (2, 100), (-4, 24)]:
+            self.assertEqual(self.pending[start: stop].tolist(), self.expected[start: stop].tolist())
+
+    def test_indexing(self):
+        for index in [0, 6, 7, 8, 9, 23, -1]:
+            self.assertEqual(self.pending[index], self.expected[index])
+        with self.assertRaises(IndexError):
+            _ = self.pending[24]
+
+    def test_step_slicing_illegal(self):
+        with self.assertRaises(ValueError):
+            _ = self.pending[::2]
+
+    def test_array(self):
+        self.assertEqual(np.array(self.pending).tolist(), self.expected.tolist())
+
+    def test_searchsorted(self):
+        for position in [0, 3, 5, 10, 15, 21, 22, 40, 54, 55, 100]:
+            self.assertEqual(self.pending.searchsorted(position),
+                             np.searchsorted(self.expected, position, side='left'))
+
+    def test_empty(self):
+        pending = status_utils.PendingPositions([], [])
+        self.assertEqual(pending.size, 0)
+        self.assertEqual(pending[:].size, 0)
+        self.assertEqual(pending.searchsorted(5), 0)
+
+    def test_empty_run_illegal(self):
+        with self.assertRaises(ValueError):
+            _ = status_utils.PendingPositions([3, 8], [3, 10])
+
+
+class TestCompletionTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.h5_f = h5py.File(os.path.join(self.tmp_dir, 'status.h5'), mode='w')
+        self.status = np.zeros(100, dtype=np.uint8)
+        self.status[[0, 1, 2, 30, 31, 32, 33, 34, 35, 80]] = 1
+        self.h5_status = self.h5_f.create_dataset('completed_positions', data=self.status)
+
+    def tearDown(self):
+        self.h5_f.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_pending(self):
+        # Small blocks make runs span across blocks
+        for block_size in [7, 32, 100, 1000]:
+            tracker = status_utils.CompletionTracker(self.h5_status, block_size=block_size)
+            pending = tracker.get_pending()
+            self.assertEqual(pending[:].tolist(), np.where(self.status == 0)[0].tolist())
+            self.assertEqual(pending.num_runs, 3)
+
+    def test_count(self):
+        tracker = status_utils.CompletionTracker(self.h5_status, block_size=16)
+        self.assertEqual(tracker.count(1), 10)
+        self.assertEqual(tracker.count(0), 90)
+
+    def test_mark_and_commit(self):
+        tracker = status_utils.CompletionTracker(self.h5_status)
+        tracker.mark(np.arange(50, 60))
+        tracker.mark([60, 61, 70])
+        self.assertEqual(tracker.num_marked, 13)
+        # Nothing is written until committed
+        self.assertEqual(np.count_nonzero(self.h5_status[()]), 10)
+        self.assertEqual(tracker.commit(), 2)
+        self.assertEqual(tracker.num_marked, 0)
+        self.status[50:62] = 1
+        self.status[70] = 1
+        self.assertEqual(self.h5_status[()].tolist(), self.status.tolist())
+
+    def test_not_h5_dataset(self):
+        with self.assertRaises(TypeError):
+            _ = status_utils.CompletionTracker(self.status)
+
+    def test_wrong_dtype(self):
+        h5_dset = self.h5_f.create_dataset('other', data=np.zeros(10, dtype=np.float32))
+        with self.assertRaises(ValueError):
+            _ = status_utils.CompletionTracker(h5_dset)
+
+
+if __name__ == '__main__':
+    unittest.main()
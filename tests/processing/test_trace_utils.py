@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:15:22 2026
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+sys.path.append("../../pyUSID/")
+from pyUSID.processing import trace_utils
+
+
+class TestGetNbytes(unittest.TestCase):
+
+    def test_array(self):
+        self.assertEqual(trace_utils.get_nbytes(np.zeros(10, dtype=np.float32)), 40)
+
+    def test_nested_list(self):
+        self.assertEqual(trace_utils.get_nbytes([np.zeros(2), [np.zeros(3, dtype=np.uint8), 1.5]]), 16 + 3 + 8)
+
+    def test_unknown(self):
+        self.assertEqual(trace_utils.get_nbytes('abc'), 0)
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = trace_utils.Tracer(rank=2)
+        with self.tracer.span('read', batch=0) as span:
+            span.bytes_read = 128
+        with self.tracer.span('compute', batch=0):
+            pass
+        with self.tracer.span('read', batch=10) as span:
+            span.bytes_read = 64
+
+    def test_spans(self):
+        spans = self.tracer.get_spans()
+        self.assertEqual([span['name'] for span in spans], ['read', 'compute', 'read'])
+        self.assertEqual([span['batch'] for span in spans], [0, 0, 10])
+        self.assertEqual(spans[0]['bytes_read'], 128)
+        self.assertTrue(all([span['rank'] == 2 and span['duration'] >= 0 for span in spans]))
+
+    def test_spans_from_threads(self):
+        def record():
+            with self.tracer.span('write'):
+                pass
+        thread = threading.Thread(target=record, name='writer')
+        thread.start()
+        thread.join()
+        self.assertEqual(self.tracer.get_spans()[-1]['thread'], 'writer')
+
+    def test_disabled(self):
+        tracer = trace_utils.Tracer(enabled=False)
+        with tracer.span('read') as span:
+            span.bytes_read = 10
+        self.assertEqual(tracer.get_spans(), [])
+
+    def test_span_recorded_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span('write'):
+                raise ValueError('failed')
+        self.assertEqual(self.tracer.get_spans()[-1]['name'], 'write')
+
+    def test_chrome_trace(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(tmp_dir, 'trace.json')
+            trace = self.tracer.to_chrome_trace(file_path)
+            with open(file_path) as file_handle:
+                self.assertEqual(json.load(file_handle), trace)
+        finally:
+            shutil.rmtree(tmp_dir)
+        events = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0]['ts'], 0)
+        self.assertTrue(all([event['pid'] == 2 for event in events]))
+        self.assertEqual(events[2]['args']['bytes_read'], 64)
+
+    def test_summary(self):
+        lines = self.tracer.summary().split('\n')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].split()[:3] == ['2', 'read', '2'])
+
+    def test_gather_without_mpi(self):
+        self.assertEqual(self.tracer.gather(), self.tracer.get_spans())
+
+    def test_illegal(self):
+        with self.assertRaises(TypeError):
+            _ = trace_utils.Tracer(enabled=1)
+        with self.assertRaises(TypeError):
+            _ = trace_utils.Tracer(rank=-1)
+
+
+if __name__ == '__main__':
+    unittest.main()